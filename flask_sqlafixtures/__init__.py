@@ -2,15 +2,25 @@ import os
 from flask_sqlafixtures import commands
 from flask import current_app
 from pathlib import Path
+from flask_sqlafixtures.db_utils import DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_SIZE
+from flask_sqlafixtures.formats import DEFAULT_FORMAT
+from flask_sqlafixtures.registry import FixtureRegistry
 
 
 class _SQLAFixturesConfig(object):
-    def __init__(self, db, base_directory, directory, modules, file):
+    def __init__(self, db, base_directory, directory, modules, file, batch_size,
+                 format, queue_size=DEFAULT_QUEUE_SIZE, shard_rows=None, shard_bytes=None):
         self.db = db
         self.base_directory = base_directory
         self.directory = directory
         self.modules = modules
         self.file = file
+        self.batch_size = batch_size
+        self.format = format
+        self.queue_size = queue_size
+        self.shard_rows = shard_rows
+        self.shard_bytes = shard_bytes
+        self.registry = FixtureRegistry(modules)
 
 
 class SQLAFixtures(object):
@@ -25,10 +35,17 @@ class SQLAFixtures(object):
         self.directory = self.get_directory(app)
         self.file = self.get_fixtures_file(app)
         self.fixtures_modules = self.get_fixtures_modules(app)
+        self.batch_size = self.get_batch_size(app)
+        self.fixtures_format = self.get_fixtures_format(app)
+        self.queue_size = self.get_queue_size(app)
+        self.shard_rows = self.get_shard_rows(app)
+        self.shard_bytes = self.get_shard_bytes(app)
         if not hasattr(app, 'extensions'):
             app.extensions = {}
         app.extensions['sqlafixtures'] = _SQLAFixturesConfig(
-            self.db, self.base_directory, self.directory, self.fixtures_modules, self.file)
+            self.db, self.base_directory, self.directory, self.fixtures_modules, self.file,
+            self.batch_size, self.fixtures_format, self.queue_size, self.shard_rows,
+            self.shard_bytes)
         register_commands(app)
 
     def get_base_directory(self, app):
@@ -74,6 +91,65 @@ class SQLAFixtures(object):
             fixtures_modules = []
         return fixtures_modules
 
+    def get_batch_size(self, app):
+        """Get the app config for 'SQLAFIXTURES_BATCH_SIZE'
+
+        SQLAFIXTURES_BATCH_SIZE is the number of records inserted per statement when seeding.
+        """
+        try:
+            batch_size = app.config['SQLAFIXTURES_BATCH_SIZE']
+        except KeyError:
+            batch_size = DEFAULT_BATCH_SIZE
+        return batch_size
+
+    def get_fixtures_format(self, app):
+        """Get the app config for 'SQLAFIXTURES_FORMAT'
+
+        SQLAFIXTURES_FORMAT is the name of the format fixtures are written in: 'json',
+        'columnar' or 'jsonl'. Seed reads any format.
+        """
+        try:
+            fixtures_format = app.config['SQLAFIXTURES_FORMAT']
+        except KeyError:
+            fixtures_format = DEFAULT_FORMAT
+        return fixtures_format
+
+    def get_queue_size(self, app):
+        """Get the app config for 'SQLAFIXTURES_QUEUE_SIZE'
+
+        SQLAFIXTURES_QUEUE_SIZE is the number of batches of a fixture parsed ahead of
+        the inserts when seeding. 0 parses each batch when it is inserted.
+        """
+        try:
+            queue_size = app.config['SQLAFIXTURES_QUEUE_SIZE']
+        except KeyError:
+            queue_size = DEFAULT_QUEUE_SIZE
+        return queue_size
+
+    def get_shard_rows(self, app):
+        """Get the app config for 'SQLAFIXTURES_SHARD_ROWS'
+
+        SQLAFIXTURES_SHARD_ROWS is the maximum number of records per fixture file.
+        Larger tables are written in numbered shards. None for no cap.
+        """
+        try:
+            shard_rows = app.config['SQLAFIXTURES_SHARD_ROWS']
+        except KeyError:
+            shard_rows = None
+        return shard_rows
+
+    def get_shard_bytes(self, app):
+        """Get the app config for 'SQLAFIXTURES_SHARD_BYTES'
+
+        SQLAFIXTURES_SHARD_BYTES is the size a fixture file is closed at, the next
+        records going to the next shard. None for no cap.
+        """
+        try:
+            shard_bytes = app.config['SQLAFIXTURES_SHARD_BYTES']
+        except KeyError:
+            shard_bytes = None
+        return shard_bytes
+
 
 def register_commands(app):
     app.cli.add_command(commands.init_sqlafixtures)
@@ -81,3 +157,5 @@ def register_commands(app):
     app.cli.add_command(commands.create_fixtures_from_xlsx)
     app.cli.add_command(commands.create_fixtures_from_db)
     app.cli.add_command(commands.check_sqlafixtures_config)
+    app.cli.add_command(commands.sqlafixtures_bench)
+    app.cli.add_command(commands.scale_fixtures)
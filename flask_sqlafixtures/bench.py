@@ -0,0 +1,504 @@
+"""Throughput benchmarks of seed, create_fixture_from_db and create_fixture_from_file.
+
+A synthetic table of mixed column types, including the Date and DateTime columns of
+fixtures like app.users.models.Tool, is created in the app database, loaded from a
+generated fixture, with and without the SQLite bulk load profile, exported back and
+converted from a generated workbook. Each phase reports rows/s, peak RSS and the bytes
+of the file it reads or writes. The formats phase writes the same records in each
+fixture format and compares their size and read throughput.
+"""
+import datetime as dt
+import gc
+import importlib.util
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+import click
+import simplejson as json
+from flask import current_app
+from sqlalchemy import (
+    Boolean, Column, Date, DateTime, Float, Integer, MetaData, String, Table, Text)
+from flask_sqlafixtures import db_utils, formats, seed_state, type_codecs
+
+BENCH_TABLE_NAME = 'sqlafixtures_bench'
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+PHASES = ('seed', 'bulk', 'formats', 'export', 'xlsx')
+RESULTS_VERSION = 1
+
+# pandas writes and reads the workbooks of the xlsx phase with openpyxl, not a
+# requirement of the package, see the 'xlsx' extra
+XLSX_MODULE = 'openpyxl'
+XLSX_MISSING = "The xlsx phase needs openpyxl, install Flask-SQLAFixtures[xlsx]."
+
+# writing and reading workbooks is much slower than the other phases, and a sheet
+# holds at most 1048576 rows
+XLSX_MAX_ROWS = 100000
+
+BASE_DATE = dt.date(2020, 1, 1)
+
+
+class BenchModel(object):
+    """Stand in for a declarative model of the benchmark table.
+
+    Parameters:
+        table (sqlalchemy Table): the benchmark table, see make_bench_table.
+
+    Notes:
+        The fixture functions of db_utils only use __table__, __tablename__ and
+        __name__ of a model.
+    """
+
+    def __init__(self, table):
+        self.__table__ = table
+        self.__tablename__ = table.name
+        self.__name__ = 'BenchModel'
+
+    def __repr__(self):
+        return '<BenchModel {}>'.format(self.__tablename__)
+
+
+def make_bench_table(metadata=None, name=BENCH_TABLE_NAME):
+    """Return the benchmark table, in its own metadata unless one is given."""
+
+    return Table(
+        name, metadata if metadata is not None else MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('name', String(128)),
+        Column('quantity', Integer),
+        Column('price', Float),
+        Column('active', Boolean),
+        Column('notes', Text),
+        Column('added', Date),
+        Column('last_seen', DateTime))
+
+
+def generate_records(table, size, seed=0):
+    """Yield size records of the benchmark table, encoded as in a fixture file.
+
+    Notes:
+        Records are the same for the same seed. About a seventh of the dates and a fifth
+        of the datetimes are None.
+    """
+
+    rng = random.Random(seed)
+    codec = type_codecs.get_table_codec(table)
+    for index in range(1, size + 1):
+        added = BASE_DATE + dt.timedelta(days=rng.randrange(3650))
+        last_seen = dt.datetime.combine(added, dt.time()) + dt.timedelta(
+            seconds=rng.randrange(86400))
+        yield codec.encode({
+            'id': index,
+            'name': 'item {}'.format(index),
+            'quantity': rng.randrange(1000),
+            'price': round(rng.uniform(0, 1000), 2),
+            'active': rng.random() < 0.5,
+            'notes': 'note ' * rng.randrange(1, 12),
+            'added': added if index % 7 else None,
+            'last_seen': last_seen if index % 5 else None,
+        })
+
+
+def write_bench_fixture(directory, table, size, fixture_format):
+    """Write a fixture of size generated records and return its path."""
+
+    fixture_format = formats.get_format(fixture_format)
+    path = os.path.join(directory, table.name + fixture_format.extension)
+    columns = [col.name for col in table.columns]
+    with open(path, 'w') as outfile:
+        fixture_format.write(outfile, table.name, columns, generate_records(table, size))
+    return path
+
+
+def write_bench_workbook(path, table, size):
+    """Write a workbook with a sheet of size generated records and return path."""
+
+    import pandas as pd
+
+    codec = type_codecs.get_table_codec(table)
+    records = codec.decode_records(list(generate_records(table, size)))
+    df = pd.DataFrame(records, columns=[col.name for col in table.columns])
+    df.to_excel(path, sheet_name=table.name, index=False)
+    return path
+
+
+def load_fixture(engine, table, path, batch_size=db_utils.DEFAULT_BATCH_SIZE, bulk=False):
+    """Create the table empty and seed it from the fixture at path. Return path.
+
+    Notes:
+        The table is seeded with db_utils.seed, as by the seed command, with --bulk
+        when bulk is True, see bench_fixtures. Its seed state is removed afterwards.
+    """
+
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    with bench_fixtures(table, os.path.dirname(path)) as model:
+        db_utils.seed([model.__name__], batch_size=batch_size, bulk=bulk, force=True)
+    return path
+
+
+@contextmanager
+def bench_fixtures(table, directory):
+    """Make table a fixture model with its fixtures in directory while the block runs.
+
+    Parameters:
+        table (sqlalchemy Table): the benchmark table, see make_bench_table.
+        directory (str): directory of the fixture of the table.
+
+    Returns:
+        model (BenchModel): the model registered for the table, yielded.
+
+    Raises:
+        ValueError: when the app metadata already has a table named as table.
+
+    Notes:
+        db_utils.seed looks its models up in the fixture registry, orders them by the
+        tables of the app metadata and reads the fixtures directory. A copy of table
+        is added to the app metadata, a BenchModel of it to the registry with
+        FixtureRegistry.temporary_models, and the fixtures directory is set to
+        directory. Each change is undone when the block exits, also when a later one
+        fails, and the seed state of the table is removed.
+    """
+
+    sqlafixtures = current_app.extensions['sqlafixtures']
+    metadata = sqlafixtures.db.metadata
+    if table.name in metadata.tables:
+        raise ValueError("Table '{}' is already in the app metadata.".format(table.name))
+    with ExitStack() as stack:
+        app_table = table.tometadata(metadata)
+        stack.callback(metadata.remove, app_table)
+        stack.callback(_remove_seed_state, sqlafixtures.db.engine, table.name)
+        model = BenchModel(app_table)
+        stack.enter_context(sqlafixtures.registry.temporary_models({model.__name__: model}))
+        stack.callback(setattr, sqlafixtures, 'directory', sqlafixtures.directory)
+        sqlafixtures.directory = directory
+        yield model
+
+
+def _remove_seed_state(engine, table_name):
+    state_table = seed_state.state_table
+    with engine.begin() as conn:
+        if state_table.exists(bind=conn):
+            conn.execute(state_table.delete().where(state_table.c.table_name == table_name))
+
+
+def read_fixture(path):
+    """Read every record of the fixture at path, as seed does. Return path."""
+
+    records = formats.read_fixture_records(path)
+    try:
+        for record in records:
+            pass
+    finally:
+        records.close()
+    return path
+
+
+def measure_formats(directory, table, size):
+    """Write size generated records in each fixture format and measure their reads.
+
+    Parameters:
+        directory (str): directory the fixtures are written to, one directory per format.
+        table (sqlalchemy Table): the benchmark table, see make_bench_table.
+        size (int): number of records.
+
+    Returns:
+        list of results of measure, one per format with phase 'read-<format>', see
+        measure. Each has the speedup of its rows/s and the size_ratio of its bytes
+        over those of the default format, json.
+    """
+
+    results = []
+    for name in sorted(formats.FORMATS, key=lambda name: name != formats.DEFAULT_FORMAT):
+        format_directory = os.path.join(directory, name)
+        os.makedirs(format_directory, exist_ok=True)
+        path = write_bench_fixture(format_directory, table, size, name)
+        results.append(measure('read-' + name, size, read_fixture, path))
+    baseline = results[0]
+    for result in results[1:]:
+        _set_speedup(result, baseline)
+        result['size_ratio'] = result['bytes'] / baseline['bytes']
+    return results
+
+
+def has_xlsx_support():
+    """Return True when the module the xlsx phase needs is installed."""
+
+    return importlib.util.find_spec(XLSX_MODULE) is not None
+
+
+def get_default_phases():
+    """Return the phases run by default: PHASES, less xlsx without openpyxl."""
+
+    return [phase for phase in PHASES if phase != 'xlsx' or has_xlsx_support()]
+
+
+def export_fixture(model, directory):
+    """Create the fixture of model from the db in directory. Return its paths."""
+
+    db_utils.create_fixture_from_db(model, directory)
+    return formats.find_fixture_paths(
+        directory, model.__tablename__, db_utils.get_fixtures_format())
+
+
+def convert_workbook(model, path, directory, fixture_format):
+    """Create the fixture of model from the workbook at path. Return its paths."""
+
+    import pandas as pd
+
+    with pd.ExcelFile(path) as workbook:
+        db_utils.create_fixture_from_file(model, workbook, directory, fixture_format)
+    return formats.find_fixture_paths(directory, model.__tablename__, fixture_format)
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of the process. Return False where it can not be reset.
+
+    Notes:
+        Linux only, by writing 5 to /proc/self/clear_refs. Elsewhere the peak of a
+        phase is the peak of the process so far.
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the process in bytes, or None."""
+
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    try:
+        import resource
+    except ImportError:  # windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(phase, rows, function, *args):
+    """Call function(*args) and return the result of the phase.
+
+    Parameters:
+        phase (str): name of the phase.
+        rows (int): number of rows processed by the phase.
+        function (function): the measured function, returning the path of the file
+            the phase reads or writes, or the list of its shards.
+
+    Returns:
+        result (dict): phase, rows, seconds, rows_per_second, peak_rss and bytes.
+    """
+
+    gc.collect()
+    reset_peak_rss()
+    start = time.perf_counter()
+    path = function(*args)
+    seconds = time.perf_counter() - start
+    return {
+        'phase': phase,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0,
+        'peak_rss': get_peak_rss(),
+        'bytes': sum(os.path.getsize(shard) for shard in formats.get_paths(path)),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, phases=None, directory=None, batch_size=None):
+    """Run the phases for each size against the app database.
+
+    Parameters:
+        sizes (list of int): numbers of rows.
+        phases (list of str): names of the phases to run, see PHASES. If None, use
+            get_default_phases.
+        directory (str): directory the generated and created files are written to.
+            Default is a temporary directory, removed afterwards.
+        batch_size (int): records per batch. If None, use
+            app.config['SQLAFIXTURES_BATCH_SIZE'].
+
+    Returns:
+        report (dict): the environment of the run and its list of results, see
+            measure. Save it with save_results.
+
+    Notes:
+        The benchmark table is created in the app database and dropped afterwards. The
+        fixtures are written in the configured format. The export phase reads the rows
+        loaded by the seed phase, which is run for every size. The bulk phase seeds the
+        same fixture with the SQLite bulk load profile, and its result gets the speedup,
+        its rows/s over those of the seed phase. The formats phase does not use the
+        database, see measure_formats. Sizes over XLSX_MAX_ROWS are not run for the
+        xlsx phase.
+    """
+
+    if phases is None:
+        phases = get_default_phases()
+    for phase in phases:
+        if phase not in PHASES:
+            raise ValueError("Unknown benchmark phase '{}'.".format(phase))
+    if 'xlsx' in phases and not has_xlsx_support():
+        raise ValueError(XLSX_MISSING)
+    engine = current_app.extensions['sqlafixtures'].db.engine
+    if batch_size is None:
+        batch_size = current_app.extensions['sqlafixtures'].batch_size
+    fixture_format = db_utils.get_fixtures_format()
+    table = make_bench_table()
+    model = BenchModel(table)
+
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix='sqlafixtures-bench-')
+    report = {
+        'version': RESULTS_VERSION,
+        'created': dt.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'dialect': engine.dialect.name,
+        'format': fixture_format,
+        'batch_size': batch_size,
+        'results': [],
+    }
+    try:
+        for size in sizes:
+            run_directory = os.path.join(directory, str(size))
+            for name in ('seed', 'export', 'xlsx'):
+                os.makedirs(os.path.join(run_directory, name), exist_ok=True)
+            path = write_bench_fixture(
+                os.path.join(run_directory, 'seed'), table, size, fixture_format)
+            result = measure('seed', size, load_fixture, engine, table, path, batch_size)
+            _add_result(report, result, 'seed' in phases)
+            if 'bulk' in phases:
+                bulk = measure(
+                    'bulk', size, load_fixture, engine, table, path, batch_size, True)
+                _set_speedup(bulk, result)
+                _add_result(report, bulk)
+            if 'formats' in phases:
+                for read_result in measure_formats(
+                        os.path.join(run_directory, 'formats'), table, size):
+                    _add_result(report, read_result)
+            if 'export' in phases:
+                _add_result(report, measure(
+                    'export', size, export_fixture, model,
+                    os.path.join(run_directory, 'export')))
+            if 'xlsx' in phases and size > XLSX_MAX_ROWS:
+                click.echo('Skipped xlsx for {} rows, over {} rows.'.format(
+                    size, XLSX_MAX_ROWS))
+            elif 'xlsx' in phases:
+                workbook = write_bench_workbook(
+                    os.path.join(run_directory, 'fixtures_file.xlsx'), table, size)
+                _add_result(report, measure(
+                    'xlsx', size, convert_workbook, model, workbook,
+                    os.path.join(run_directory, 'xlsx'), fixture_format))
+    finally:
+        table.drop(engine, checkfirst=True)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+
+def _add_result(report, result, recorded=True):
+    if recorded:
+        report['results'].append(result)
+        click.echo(format_result(result))
+
+
+def _set_speedup(result, baseline):
+    """Set the speedup of result, its rows/s over those of baseline, another result."""
+
+    result['baseline'] = baseline['phase']
+    result['speedup'] = (result['rows_per_second'] / baseline['rows_per_second']
+                         if baseline['rows_per_second'] else None)
+
+
+def format_result(result):
+    """Return a result of measure as one line of text."""
+
+    line = '{phase:<13} {rows:>9} rows {seconds:9.3f}s {rate:>11.0f} rows/s ' \
+        'peak RSS {rss} bytes on disk {size}'.format(
+            phase=result['phase'], rows=result['rows'], seconds=result['seconds'],
+            rate=result['rows_per_second'],
+            rss=_format_bytes(result['peak_rss']), size=_format_bytes(result['bytes']))
+    if result.get('speedup') is not None:
+        line += ' {:.2f}x {}'.format(result['speedup'], result['baseline'])
+    if result.get('size_ratio') is not None:
+        line += ', {:.0%} of its bytes'.format(result['size_ratio'])
+    return line
+
+
+def _format_bytes(count):
+    if count is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if count < 1024:
+            return '{:.0f}{}'.format(count, unit)
+        count /= 1024.
+    return '{:.1f}GiB'.format(count)
+
+
+def save_results(path, report):
+    """Save a report of run_benchmark as json."""
+
+    with open(path, 'w') as fp:
+        json.dump(report, fp, indent=4)
+
+
+def load_results(path):
+    """Return a report saved by save_results."""
+
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def compare_results(previous, current):
+    """Compare the rows/s of two reports of run_benchmark.
+
+    Returns:
+        list of dict with phase, rows, previous and current rows/s and change, the
+        relative change of rows/s (0.1 is 10% faster). Only the phases and sizes found
+        in both reports are compared.
+    """
+
+    rates = {(result['phase'], result['rows']): result['rows_per_second']
+             for result in previous['results']}
+    comparison = []
+    for result in current['results']:
+        key = (result['phase'], result['rows'])
+        if key not in rates:
+            continue
+        comparison.append({
+            'phase': result['phase'],
+            'rows': result['rows'],
+            'previous': rates[key],
+            'current': result['rows_per_second'],
+            'change': result['rows_per_second'] / rates[key] - 1 if rates[key] else 0,
+        })
+    return comparison
+
+
+def parse_sizes(value):
+    """Return the list of sizes of a comma separated string, ex: '1000,10k,1M'."""
+
+    sizes = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        multiplier = {'k': 1000, 'm': 1000000}.get(item[-1], 1)
+        if multiplier > 1:
+            item = item[:-1]
+        size = int(item) * multiplier
+        if size <= 0:
+            raise ValueError('Benchmark sizes must be positive.')
+        sizes.append(size)
+    return sizes
@@ -5,7 +5,7 @@ import click
 from flask import current_app
 from flask.cli import with_appcontext
 
-from flask_sqlafixtures import db_utils
+from flask_sqlafixtures import bench, db_utils, manifest, metrics, scale, subset
 
 
 @click.command()
@@ -19,7 +19,12 @@ def check_sqlafixtures_config():
         'SQLAFIXTURES_DIRECTORY',
         'SQLAFIXTURES_MODULES',
         'SQLAFIXTURES_MODE',
-        'SQLAFIXTURES_FILENAME'
+        'SQLAFIXTURES_FILENAME',
+        'SQLAFIXTURES_BATCH_SIZE',
+        'SQLAFIXTURES_FORMAT',
+        'SQLAFIXTURES_QUEUE_SIZE',
+        'SQLAFIXTURES_SHARD_ROWS',
+        'SQLAFIXTURES_SHARD_BYTES'
     ]:
         try:
             click.echo('{}: {}'.format(config, current_app.config[config]))
@@ -32,9 +37,22 @@ def check_sqlafixtures_config():
         ('base_directory', 'BASE DIRECTORY'),
         ('directory', 'FIXTURES DIRECTORY'),
         ('modules', 'FIXTURES MODULES'),
-        ('file', 'FIXTURES FILE')
+        ('file', 'FIXTURES FILE'),
+        ('batch_size', 'BATCH SIZE'),
+        ('format', 'FIXTURES FORMAT'),
+        ('queue_size', 'QUEUE SIZE'),
+        ('shard_rows', 'SHARD ROWS'),
+        ('shard_bytes', 'SHARD BYTES')
     ):
         click.echo('{}: {}'.format(attr[1], getattr(fixtures, attr[0])))
+    click.echo('')
+    fixtures_manifest = manifest.load_manifest(fixtures.directory)
+    if not fixtures_manifest:
+        click.echo('Manifest: not found in the fixtures directory.')
+        return
+    click.echo('Manifest:')
+    for line in manifest.format_summary(fixtures_manifest):
+        click.echo(line)
 
 
 @click.command()
@@ -68,8 +86,30 @@ def check_fixtures_file_exists():
 
 @click.command()
 @click.option('--models', multiple=True, default=[])
+@click.option('--batch-size', type=int, default=None,
+              help='Records per insert statement. Default is SQLAFIXTURES_BATCH_SIZE.')
+@click.option('--savepoints', is_flag=True, default=False,
+              help='Seed each table in a SAVEPOINT so one failing table does not roll back the rest.')
+@click.option('--bulk', is_flag=True, default=False,
+              help='Use the SQLite bulk load profile while seeding.')
+@click.option('--workers', type=int, default=1,
+              help='Number of tables loaded at the same time.')
+@click.option('--force', is_flag=True, default=False,
+              help='Seed every table, including tables unchanged since the last seed.')
+@click.option('--mode', type=click.Choice(db_utils.SEED_MODES), default='upsert',
+              help='upsert writes every record, diff only new and changed records.')
+@click.option('--delete', is_flag=True, default=False,
+              help='With --mode diff, delete rows missing from the fixtures.')
+@click.option('--report', 'report_path', default=None,
+              help='Save the metrics of the seed to this json file.')
+@click.option('--queue-size', type=int, default=None,
+              help='Batches parsed ahead of the inserts per fixture, 0 for none. '
+                   'Default is SQLAFIXTURES_QUEUE_SIZE.')
+@click.option('--shards', default=None,
+              help='Shards of sharded fixtures to seed, ex: 0-3,7. Default is all.')
 @with_appcontext
-def seed(models):
+def seed(models, batch_size, savepoints, bulk, workers, force, mode, delete, report_path,
+         queue_size, shards):
     """Seed the database.
 
     if user does not enter model_names, seed all
@@ -81,16 +121,33 @@ def seed(models):
         model_names = model_names[0].split(',')
     else:
         model_names = []
+    if shards is not None:
+        try:
+            shards = db_utils.parse_shards(shards)
+        except db_utils.SeedError as e:
+            raise click.BadParameter(e.message, param_hint='--shards')
     click.echo(model_names)
 
-    db_utils.seed(model_names)
+    report = metrics.Report('seed')
+    try:
+        db_utils.seed(model_names, batch_size=batch_size, savepoints=savepoints, bulk=bulk,
+                      workers=workers, force=force, mode=mode, delete=delete, report=report,
+                      queue_size=queue_size, shards=shards)
+    finally:
+        save_report(report, report_path)
 
 
 @click.command()
 @click.option('--models', multiple=True, default=[])
 @click.option('--excludes', multiple=True, default=[])
+@click.option('--workers', type=int, default=1,
+              help='Number of models to create at the same time.')
+@click.option('--force', is_flag=True, default=False,
+              help='Create every fixture, including fixtures of unchanged sheets.')
+@click.option('--report', 'report_path', default=None,
+              help='Save the metrics of the fixtures created to this json file.')
 @with_appcontext
-def create_fixtures_from_xlsx(models, excludes):
+def create_fixtures_from_xlsx(models, excludes, workers, force, report_path):
     """Create fixtures from an excel file.
 
 
@@ -110,16 +167,35 @@ def create_fixtures_from_xlsx(models, excludes):
         excludes = excludes[0].split(',')
     else:
         excludes = []
-    db_utils.create_fixtures(model_names, excludes, from_file=True)
+    report = metrics.Report('create_fixtures')
+    try:
+        db_utils.create_fixtures(model_names, excludes, from_file=True, workers=workers,
+                                 force=force, report=report)
+    finally:
+        save_report(report, report_path)
     click.echo('Completed creating fixtures from xlsx')
 
 
 @click.command()
 @click.option('--models', multiple=True, default=[])
 @click.option('--excludes', multiple=True, default=[])
+@click.option('--workers', type=int, default=1,
+              help='Number of models to create at the same time.')
+@click.option('--report', 'report_path', default=None,
+              help='Save the metrics of the fixtures created to this json file.')
+@click.option('--where', multiple=True, default=[],
+              help="Export a subset from the rows of a model matching a SQL condition, "
+                   "ex: \"Order:status = 'open'\". Repeat for several models.")
+@click.option('--sample', multiple=True, default=[],
+              help='Export a subset from a sample of the rows of a model, a number of '
+                   'rows or a fraction, ex: Order:100 or Order:0.01.')
 @with_appcontext
-def create_fixtures_from_db(models, excludes):
-    """Create fixtures from the database."""
+def create_fixtures_from_db(models, excludes, workers, report_path, where, sample):
+    """Create fixtures from the database.
+
+    With --where or --sample, the rows referencing the selected rows and the rows they
+    reference are exported too, so the fixtures seed without foreign key violations.
+    """
     model_names = models
 
     # # validate sqlafixtures has been intitiated
@@ -135,5 +211,99 @@ def create_fixtures_from_db(models, excludes):
         excludes = excludes[0].split(',')
     else:
         excludes = []
-    db_utils.create_fixtures(model_names, excludes, from_file=False)
+    try:
+        where = subset.parse_model_options(where)
+    except subset.SubsetError as e:
+        raise click.BadParameter(e.message, param_hint='--where')
+    try:
+        sample = {name: subset.parse_sample(value)
+                  for name, value in subset.parse_model_options(sample).items()}
+    except subset.SubsetError as e:
+        raise click.BadParameter(e.message, param_hint='--sample')
+    report = metrics.Report('create_fixtures')
+    try:
+        db_utils.create_fixtures(model_names, excludes, from_file=False, workers=workers,
+                                 report=report, where=where, sample=sample)
+    finally:
+        save_report(report, report_path)
     click.echo('Completed creating fixtures from db')
+
+
+def save_report(report, path):
+    """Save a metrics.Report to path, if path is set."""
+
+    if path:
+        report.save(path)
+
+
+@click.command()
+@click.option('--sizes', default=','.join(str(size) for size in bench.DEFAULT_SIZES),
+              help='Comma separated numbers of rows, ex: 1k,10k,1M.')
+@click.option('--phases', default=None,
+              help='Comma separated phases: seed, bulk, formats, export, xlsx. Default '
+                   'is all, less xlsx when openpyxl is not installed.')
+@click.option('--batch-size', type=int, default=None,
+              help='Records per batch. Default is SQLAFIXTURES_BATCH_SIZE.')
+@click.option('--output', default='sqlafixtures_bench.json',
+              help='File the results are saved to as json.')
+@click.option('--compare', default=None,
+              help='Results file of an earlier run to compare rows/s with.')
+@with_appcontext
+def sqlafixtures_bench(sizes, phases, batch_size, output, compare):
+    """Measure the throughput of seed and fixture creation on the app database."""
+
+    try:
+        sizes = bench.parse_sizes(sizes)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--sizes')
+    if phases is None:
+        phases = bench.get_default_phases()
+    else:
+        phases = [phase.strip() for phase in phases.split(',') if phase.strip()]
+    for phase in phases:
+        if phase not in bench.PHASES:
+            raise click.BadParameter(
+                "Unknown phase '{}'.".format(phase), param_hint='--phases')
+    if 'xlsx' in phases and not bench.has_xlsx_support():
+        raise click.BadParameter(bench.XLSX_MISSING, param_hint='--phases')
+    previous = bench.load_results(compare) if compare else None
+
+    report = bench.run_benchmark(sizes, phases, batch_size=batch_size)
+    bench.save_results(output, report)
+    click.echo('Saved results to {}'.format(output))
+    if previous is not None:
+        for item in bench.compare_results(previous, report):
+            click.echo('{phase:<13} {rows:>9} rows {previous:>11.0f} -> {current:>11.0f} '
+                       'rows/s ({change:+.1%})'.format(**item))
+
+
+@click.command()
+@click.option('--factor', required=True,
+              help='Number of copies of the records of each fixture, ex: 100.')
+@click.option('--models', multiple=True, default=[])
+@click.option('--excludes', multiple=True, default=[])
+@click.option('--output', default=None,
+              help='Directory the scaled fixtures are written to. Default is '
+                   'x<factor> in the fixtures directory.')
+@click.option('--to-db', is_flag=True, default=False,
+              help='Load the scaled records into the database instead of writing fixtures.')
+@click.option('--batch-size', type=int, default=None,
+              help='Records built and written per batch. Default is SQLAFIXTURES_BATCH_SIZE.')
+@click.option('--report', 'report_path', default=None,
+              help='Save the metrics of the scaled tables to this json file.')
+@with_appcontext
+def scale_fixtures(factor, models, excludes, output, to_db, batch_size, report_path):
+    """Scale the fixtures to factor times their records for load tests."""
+
+    try:
+        factor = scale.parse_factor(factor)
+    except scale.ScaleError as e:
+        raise click.BadParameter(e.message, param_hint='--factor')
+    model_names = models[0].split(',') if models else []
+    excludes = excludes[0].split(',') if excludes else []
+    report = metrics.Report('scale_fixtures')
+    try:
+        scale.scale_fixtures(model_names, excludes, factor=factor, output_directory=output,
+                             to_db=to_db, batch_size=batch_size, report=report)
+    finally:
+        save_report(report, report_path)
@@ -1,15 +1,41 @@
 import os
-import importlib
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 import simplejson as json
 import click
-from flask import current_app
-import pandas as pd
-import numpy as np
-from sqlalchemy import Table
+from flask import current_app, has_app_context
 import datetime as dt
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+from flask_sqlafixtures import (
+    diff, fingerprints, formats, manifest, metrics, seed_state, signals, subset,
+    type_codecs, upsert)
+from flask_sqlafixtures.formats import (
+    FixtureFormatError, iter_fixture_records, json_encoder, write_fixture)
+from flask_sqlafixtures.type_codecs import (
+    DATE_FORMAT, DATETIME_FORMAT, convert_str_to_date, convert_str_to_datetime)
 
-DATE_FORMAT = '%Y-%m-%d'
-DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_BATCH_SIZE = 1000
+
+# batches parsed ahead of the inserts, per fixture
+DEFAULT_QUEUE_SIZE = 2
+
+# fixtures from this size are parsed by a child process while seeding, see ParsedBatches
+PROCESS_PARSE_MIN_BYTES = 1024 * 1024
+
+SEED_MODES = ('upsert', 'diff')
+
+# (pragma, value) applied by sqlite_bulk_load. journal_mode MEMORY keeps ROLLBACK working.
+SQLITE_BULK_PRAGMAS = (
+    ('journal_mode', 'MEMORY'),
+    ('synchronous', 'OFF'),
+    ('cache_size', '-65536'),
+    ('temp_store', 'MEMORY'),
+)
 
 
 class Error(Exception):
@@ -24,6 +50,26 @@ class ModelNameError(Error):
         self.message = message
 
 
+class SeedError(Error):
+    """Exception raised when one or more tables fail to seed."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class FixtureCreationError(Error):
+    """Exception raised when one or more fixtures fail to be created.
+
+    Attributes:
+        errors (dict): {model name: exception} for each failed model.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.message = 'Failed to create fixtures: {}'.format('; '.join(
+            '{}: {}'.format(name, error) for name, error in errors.items()))
+
+
 def get_fixtures_directory():
     """Return the path to the fixtures directory.
 
@@ -38,35 +84,884 @@ def get_fixtures_directory():
     return current_app.extensions['sqlafixtures'].directory
 
 
-def seed(model_names=[]):
+def get_fixtures_format():
+    """Return the name of the format fixtures are written in.
+
+    Notes:
+        Set with 'SQLAFIXTURES_FORMAT' in app.config. Outside an app context the
+        format is 'json'.
+    """
+
+    if not has_app_context():
+        return formats.DEFAULT_FORMAT
+    return current_app.extensions['sqlafixtures'].format
+
+
+def get_shard_limits():
+    """Return (shard_rows, shard_bytes), the caps of each fixture file.
+
+    Notes:
+        Set with 'SQLAFIXTURES_SHARD_ROWS' and 'SQLAFIXTURES_SHARD_BYTES' in app.config.
+        None is no cap. Outside an app context there is no cap.
+    """
+
+    if not has_app_context():
+        return None, None
+    config = current_app.extensions['sqlafixtures']
+    return config.shard_rows, config.shard_bytes
+
+
+def parse_shards(value):
+    """Return the sorted shard numbers of a string of numbers and ranges, ex: '0-3,7'."""
+
+    shards = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            first, _, last = item.partition('-')
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise SeedError("Invalid shards '{}'.".format(value))
+        if first < 0 or last < first:
+            raise SeedError("Invalid shards '{}'.".format(value))
+        shards.update(range(first, last + 1))
+    return sorted(shards)
+
+
+def select_shards(paths, shards):
+    """Return the paths of the shards numbered in shards, or paths if not sharded.
+
+    Parameters:
+        paths (list of str): paths of the files of a fixture, see
+            formats.find_fixture_paths.
+        shards (list of int): shard numbers. If None, all.
+    """
+
+    if shards is None or formats.get_shard_index(paths[0]) is None:
+        return paths
+    selected = set(shards)
+    return [path for path in paths if formats.get_shard_index(path) in selected]
+
+
+def seed(model_names=[], batch_size=None, savepoints=False, bulk=False, workers=1,
+         force=False, mode='upsert', delete=False, report=None, queue_size=None,
+         shards=None):
     """Seed the database.
 
     Parameters:
         models_names (list of str): names of models to seed. If empty, seed all.
+        batch_size (int): number of records inserted per statement. If None, use
+            app.config['SQLAFIXTURES_BATCH_SIZE'].
+        savepoints (boolean): True - seed each table inside a SAVEPOINT. A table that
+            fails is rolled back on its own and the remaining tables are still loaded.
+        bulk (boolean): True - use the SQLite bulk load profile (see sqlite_bulk_load)
+            and insert records in primary key order.
+        workers (int): number of tables loaded at the same time. See Notes.
+        force (boolean): True - seed every table, even when unchanged.
+        mode (str): 'upsert' - write every record. 'diff' - compare the records with
+            the table contents and write only new and changed records, see
+            flask_sqlafixtures.diff.
+        delete (boolean): with mode 'diff', True - delete the rows missing from the
+            fixture. Deletes run once every table is loaded, children first.
+        report (metrics.Report): report the metrics are collected in. If None, a new
+            one. Pass one to keep the metrics of a seed that raises.
+        queue_size (int): number of batches of each fixture parsed ahead of the
+            inserts. If None, use app.config['SQLAFIXTURES_QUEUE_SIZE']. 0 parses
+            each batch when it is inserted.
+        shards (list of int): numbers of the shards of sharded fixtures to seed, see
+            parse_shards. If None, all. Fixtures in a single file are seeded whole.
+
+    Returns:
+        report (metrics.Report): report.count is the number of records seeded. In
+            diff mode, rows inserted, updated and deleted. See Notes.
 
     Notes:
         app.extensions['sqlafixtures'].fixtures_directory point to the directory
         where fixtures are maintained.
+
+        Tables are seeded in foreign key dependency order inside a single transaction,
+        which is committed once. Without savepoints any error rolls back the whole seed.
+
+        Large fixtures are parsed in child processes while the batches parsed before
+        them are inserted, see pipeline_batches. The bounded queues hold at most
+        queue_size batches per fixture being parsed, so memory use stays bounded while
+        the parse of the next batches, and of the next fixtures, overlaps the inserts.
+
+        With workers > 1 on a server database, the tables of each foreign key level
+        (see group_tables_by_level) are loaded on separate pooled connections, each in
+        its own transaction, and a level starts once the level before it is committed.
+        SQLite serializes writes, so there the next workers fixtures are parsed ahead
+        while the inserts stay sequential in a single transaction.
+
+        The content hash of each fixture file and of the table schema is recorded in
+        the 'sqlafixtures_state' table with the transaction seeding the table. Tables
+        whose fixture, schema and row count are unchanged since are skipped, see
+        flask_sqlafixtures.seed_state. The hashes recorded in the manifest of the
+        fixtures directory are used for the fixture files unchanged since it was
+        written, see flask_sqlafixtures.manifest, so those files are not read.
+
+        A sharded fixture is seeded from its shards in order, in one transaction with
+        the rest of its table. The shards of a large fixture are parsed by child
+        processes like large fixtures, so the parse of the next shards runs in parallel
+        with the inserts. Seeding some of the shards loads a subset of the table, rows
+        referencing rows of the shards left out fail where foreign keys are enforced.
+
+        The report holds the rows, bytes read, parse, convert and insert times and
+        statements executed of each table, see flask_sqlafixtures.metrics. The signals
+        of flask_sqlafixtures.signals are sent as the seed progresses.
     """
 
+    if mode not in SEED_MODES:
+        raise SeedError("Unknown seed mode '{}'.".format(mode))
+    if delete and mode != 'diff':
+        raise SeedError("Deleting missing rows requires seed mode 'diff'.")
+    if delete and shards is not None:
+        raise SeedError('Deleting missing rows requires every shard.')
+
     db = current_app.extensions['sqlafixtures'].db
     fixtures_directory = get_fixtures_directory()
+    if batch_size is None:
+        batch_size = current_app.extensions['sqlafixtures'].batch_size
+    if queue_size is None:
+        queue_size = current_app.extensions['sqlafixtures'].queue_size
+    load = diff.DiffLoader(delete) if mode == 'diff' else insert_batches
+    if report is None:
+        report = metrics.Report('seed')
+
+    fixture_models = sort_models_by_dependency(
+        get_fixture_models(model_names), db.metadata)
+    tables = [mdl.__table__ for mdl in fixture_models]
+    preferred = get_fixtures_format()
+    paths = {table: select_shards(
+        formats.find_fixture_paths(fixtures_directory, table.name, preferred), shards)
+        for table in tables}
+
+    planned = manifest.load_manifest(fixtures_directory)
+    hashes = {table: manifest.get_fixture_hash(
+        planned, fixtures_directory, table.name, paths[table]) for table in tables}
+
+    start = time.perf_counter()
+    signals.send(signals.seed_started, tables=[table.name for table in tables], mode=mode)
+    with report.count_statements(db.engine):
+        states = seed_state.get_table_states(db.engine.dialect, paths, hashes)
+        with db.engine.connect() as conn:
+            unchanged = set() if force else seed_state.find_unchanged_tables(conn, states)
+            seed_state.state_table.create(bind=conn, checkfirst=True)
+        skipped = [table.name for table in tables if table in unchanged]
+        tables = [table for table in tables if table not in unchanged]
+        for name in skipped:
+            report.table(name).status = 'skipped'
+            signals.send(signals.table_skipped, metrics=report.table(name))
+        _echo_plan(planned, tables, hashes)
+
+        try:
+            if workers > 1 and db.engine.dialect.name != 'sqlite':
+                count = seed_tables_by_level(
+                    db.engine, tables, paths, batch_size, workers, states, load, report,
+                    queue_size)
+                with db.engine.begin() as conn:
+                    count += _delete_missing_rows(conn, load, states)
+                failed = []
+            else:
+                count, failed = _seed_tables_in_transaction(
+                    db.engine, tables, paths, batch_size, savepoints, bulk, workers,
+                    states, load, report, queue_size)
+        finally:
+            report.elapsed = time.perf_counter() - start
+    elapsed = report.elapsed
+    report.count = count
+    if mode == 'diff':
+        for table_diff in load.diffs:
+            click.echo(str(table_diff))
+    click.echo('Seeded {count} records in {elapsed:.2f}s ({rate:.0f} records/s{mode}).'.format(
+        count=count, elapsed=elapsed, rate=count / elapsed if elapsed else 0,
+        mode=', bulk' if bulk else ''))
+    if skipped:
+        click.echo('Skipped {count} unchanged tables: {names}.'.format(
+            count=len(skipped), names=', '.join(skipped)))
+    signals.send(signals.seed_finished, report=report)
+    if failed:
+        message = 'Failed to seed tables: {}.'.format(', '.join(failed))
+        raise SeedError(message)
+    return report
+
+
+def _echo_plan(planned, tables, hashes):
+    """Print the records and bytes to seed, when the manifest lists every table."""
+
+    if not tables or not all(hashes.get(table) for table in tables):
+        return
+    entries = [planned['tables'][table.name] for table in tables]
+    click.echo('Seeding {rows} records of {count} tables, {size} bytes of fixtures.'.format(
+        rows=sum(entry['rows'] for entry in entries), count=len(entries),
+        size=sum(entry['bytes'] for entry in entries)))
+
+
+def _seed_tables_in_transaction(engine, tables, paths, batch_size, savepoints, bulk, workers,
+                                states={}, load=None, report=None,
+                                queue_size=DEFAULT_QUEUE_SIZE):
+    """Seed tables in order in one transaction. Return (count, names of failed tables)."""
+
+    load = load or insert_batches
+    count = 0
+    failed = []
+    with pipeline_batches(tables, paths, batch_size, bulk, max(1, workers), queue_size,
+                          report) as sources:
+        with engine.connect() as conn:
+            with sqlite_bulk_load(conn, enabled=bulk):
+                with begin_transaction(conn):
+                    if bulk and conn.dialect.name == 'sqlite':
+                        # reset by SQLite when the transaction ends
+                        conn.execute('PRAGMA defer_foreign_keys = ON')
+                    for table, batches in sources:
+                        try:
+                            if not savepoints:
+                                count += _load_table(conn, table, batches, load, report)
+                                _record_table_state(conn, table, states)
+                                _table_loaded(report, table)
+                                continue
+                            savepoint = conn.begin_nested()
+                            try:
+                                count += _load_table(conn, table, batches, load, report)
+                                _record_table_state(conn, table, states)
+                            except Exception as e:
+                                savepoint.rollback()
+                                click.echo('Rolled back "{table}": {error}'.format(
+                                    table=table.name, error=e))
+                                failed.append(table.name)
+                                _table_failed(report, table)
+                            else:
+                                savepoint.commit()
+                                _table_loaded(report, table)
+                        except Exception:
+                            _table_failed(report, table)
+                            raise
+                        finally:
+                            batches.close()
+                    count += _delete_missing_rows(conn, load, states)
+    return count, failed
+
+
+def _get_table_metrics(report, table):
+    return report.table(table.name) if report is not None else None
+
+
+def _load_table(conn, table, batches, load, report=None):
+    """Call load(conn, table, batches), collecting the metrics of table in report."""
+
+    if report is None:
+        return load(conn, table, batches)
+    return report.table(table.name).load(load, conn, table, batches)
+
+
+def _table_loaded(report, table):
+    if report is not None:
+        report.table(table.name).status = 'loaded'
+        signals.send(signals.table_loaded, metrics=report.table(table.name))
+
+
+def _table_failed(report, table):
+    if report is not None:
+        report.table(table.name).status = 'failed'
+
+
+def _record_table_state(conn, table, states):
+    if table in states:
+        seed_state.record_table_state(conn, table, states[table])
+
+
+def _delete_missing_rows(conn, load, states):
+    """Apply the deletes of a DiffLoader and update the row counts of the tables."""
+
+    if not isinstance(load, diff.DiffLoader):
+        return 0
+    count = load.delete_missing(conn)
+    for table_diff in load.diffs:
+        if table_diff.deleted:
+            _record_table_state(conn, table_diff.table, states)
+    return count
+
+
+def seed_tables_by_level(engine, tables, paths, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                         states={}, load=None, report=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """Seed tables level by level, the tables of a level at the same time.
+
+    Parameters:
+        engine (sqlalchemy Engine): engine the worker connections are taken from.
+        tables (list of sqlalchemy Table): tables in foreign key dependency order.
+        paths (dict): {table: path to its fixture file, or list of its shards}
+        batch_size (int): number of records read from the file per batch.
+        workers (int): number of tables loaded at the same time.
+        states (dict): {table: seed_state.TableState} recorded for each seeded table.
+        load (function): load(conn, table, batches) writing the batches of a table.
+            Default is insert_batches.
+        report (metrics.Report): report the metrics of each table are collected in.
+        queue_size (int): number of batches parsed ahead of the inserts of each table.
+            0 parses each batch when it is inserted.
+
+    Returns:
+        count (int): number of records seeded.
+
+    Notes:
+        Each table is seeded in its own transaction, while a thread of its own parses
+        its fixture ahead. When a table fails, the rest of
+        its level is finished, the following levels are not started, and SeedError is
+        raised.
+    """
+
+    count = 0
+    with ThreadPoolExecutor(workers) as executor:
+        for level in group_tables_by_level(tables):
+            futures = [(table, executor.submit(
+                _seed_table_in_transaction, engine, table, paths[table], batch_size,
+                states, load, report, queue_size))
+                for table in level]
+            failed = []
+            for table, future in futures:
+                try:
+                    count += future.result()
+                except Exception as e:
+                    click.echo('Failed to seed "{table}": {error}'.format(
+                        table=table.name, error=e))
+                    failed.append(table.name)
+                    _table_failed(report, table)
+                else:
+                    _table_loaded(report, table)
+            if failed:
+                message = 'Failed to seed tables: {}.'.format(', '.join(failed))
+                raise SeedError(message)
+    return count
+
+
+def _seed_table_in_transaction(engine, table, path, batch_size, states={}, load=None,
+                               report=None, queue_size=DEFAULT_QUEUE_SIZE):
+    load = load or insert_batches
+    sources = [(table, read_fixture_batches(
+        table, path, batch_size, table_metrics=_get_table_metrics(report, table)))]
+    with prefetch_batches(sources, 1, queue_size) as sources:
+        batches = sources[0][1]
+        try:
+            with engine.begin() as conn:
+                count = _load_table(conn, table, batches, load, report)
+                _record_table_state(conn, table, states)
+                return count
+        finally:
+            batches.close()
+
+
+def group_tables_by_level(tables):
+    """Group tables by foreign key level.
+
+    Parameters:
+        tables (list of sqlalchemy Table): tables in foreign key dependency order.
+
+    Returns:
+        levels (list of list of Table): level 0 holds the tables referencing none of the
+            other tables, level n the tables referencing tables of level n - 1 at most.
+    """
 
-    conn = db.engine.connect()
-    metadata = db.metadata
+    levels = {}
+    for table in tables:
+        parents = [fk.column.table for fk in table.foreign_keys
+                   if fk.column.table in levels and fk.column.table is not table]
+        levels[table] = 1 + max([levels[parent] for parent in parents], default=-1)
+    grouped = [[] for level in range(max(levels.values(), default=-1) + 1)]
+    for table in tables:
+        grouped[levels[table]].append(table)
+    return grouped
 
-    fixture_models = get_fixture_models(model_names)
 
-    for mdl in fixture_models:
-        table_name = mdl.__table__.name
-        path = os.path.join(fixtures_directory, table_name + '.json')
-        fixture = json.load(open(path))
-        table = Table(fixture['table']['name'], metadata)
-        cols = [col for col in table.columns]
-        fixture['records'] = format_fixture_record_dates(
-            cols, fixture['records'])
-        conn.execute(table.insert().prefix_with(
-            'OR REPLACE'), fixture['records'])
+@contextmanager
+def sqlite_bulk_load(conn, enabled=True):
+    """Switch a SQLite connection to a fast load profile for the duration of the block.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection used for the load. Must not be in a
+            transaction, journal_mode can not change inside one.
+        enabled (boolean): False - do nothing.
+
+    Notes:
+        The settings in SQLITE_BULK_PRAGMAS are applied and the original values are
+        restored when the block exits. Other dialects are left untouched.
+    """
+
+    if not enabled or conn.dialect.name != 'sqlite':
+        yield conn
+        return
+
+    original = [(name, conn.execute('PRAGMA {}'.format(name)).scalar())
+                for name, value in SQLITE_BULK_PRAGMAS]
+    for name, value in SQLITE_BULK_PRAGMAS:
+        conn.execute('PRAGMA {} = {}'.format(name, value))
+    try:
+        yield conn
+    finally:
+        for name, value in reversed(original):
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def begin_transaction(conn):
+    """Begin a transaction on conn and return it.
+
+    Notes:
+        pysqlite defers BEGIN until the first INSERT, so a SAVEPOINT or PRAGMA issued
+        first would run outside of the transaction. For SQLite, BEGIN is emitted here.
+    """
+
+    trans = conn.begin()
+    if conn.dialect.name == 'sqlite' and not conn.connection.in_transaction:
+        conn.execute('BEGIN')
+    return trans
+
+
+def sort_models_by_dependency(models, metadata):
+    """Return models sorted so that referenced tables come before referencing tables.
+
+    Parameters:
+        models (list): list of models.
+        metadata (sqlalchemy MetaData): metadata holding the model tables.
+
+    Returns:
+        list of models in the order of metadata.sorted_tables
+    """
+
+    order = {table: index for index, table in enumerate(metadata.sorted_tables)}
+    return sorted(models, key=lambda mdl: order[mdl.__table__])
+
+
+def seed_table(conn, table, path, batch_size=DEFAULT_BATCH_SIZE, order_by_pk=False,
+               load=None, report=None):
+    """Seed a table from a fixture file in batches.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection used for the inserts.
+        table (sqlalchemy Table): the table to seed.
+        path (str or list of str): path to the fixture file, or its shards in order.
+        batch_size (int): number of records read from the file per batch.
+        order_by_pk (boolean): True - sort each batch by primary key before inserting.
+        load (function): load(conn, table, batches) writing the batches. Default is
+            insert_batches, diff.DiffLoader writes only the differences.
+        report (metrics.Report): report the metrics of the table are collected in.
+
+    Returns:
+        count (int): number of records inserted.
+
+    Notes:
+        Records are read incrementally, so memory use is bounded by batch_size rather
+        than by the size of the fixture file. Existing rows with the same primary key
+        are updated, see flask_sqlafixtures.upsert.
+    """
+
+    load = load or insert_batches
+    batches = read_fixture_batches(table, path, batch_size, order_by_pk,
+                                   _get_table_metrics(report, table))
+    return _load_table(conn, table, batches, load, report)
+
+
+def read_fixture_batches(table, path, batch_size=DEFAULT_BATCH_SIZE, order_by_pk=False,
+                         table_metrics=None):
+    """Yield decoded batches of records from a fixture file.
+
+    Parameters:
+        table (sqlalchemy Table): the table the records are seeded into.
+        path (str or list of str): path to the fixture file, in any registered format,
+            or the paths of its shards, read in order.
+        batch_size (int): number of records per batch.
+        order_by_pk (boolean): True - sort each batch by primary key.
+        table_metrics (metrics.TableMetrics): metrics the bytes read and the parse and
+            convert times are added to.
+    """
+
+    for shard in formats.get_paths(path):
+        records = formats.read_fixture_records(shard)
+        if table_metrics is not None:
+            table_metrics.bytes += os.path.getsize(shard)
+        try:
+            batches = iter_batches(records, batch_size)
+            if table_metrics is not None:
+                batches = _time_parse(batches, table_metrics)
+            for batch in decode_batches(table, batches, order_by_pk, table_metrics):
+                yield batch
+        finally:
+            records.close()
+
+
+def decode_batches(table, batches, order_by_pk=False, table_metrics=None):
+    """Yield batches of fixture records decoded for table.
+
+    Parameters:
+        table (sqlalchemy Table): the table the records are seeded into.
+        batches (iterable of list of dict): records as read from the fixture.
+        order_by_pk (boolean): True - sort each batch by primary key.
+        table_metrics (metrics.TableMetrics): metrics the convert time is added to.
+
+    Notes:
+        With order_by_pk, each batch is sorted on its own, so memory use stays bounded
+        by the batch size. Rows are inserted in primary key order within a batch, not
+        across the batches of a fixture out of order. Records without a primary key
+        value sort last, see get_pk_sort_key.
+    """
+
+    codec = type_codecs.get_table_codec(table)
+    sort_key = get_pk_sort_key(table)
+    for batch in batches:
+        start = time.perf_counter()
+        if order_by_pk and sort_key is not None:
+            batch.sort(key=sort_key)
+        batch = codec.decode_records(batch)
+        if table_metrics is not None:
+            table_metrics.convert_time += time.perf_counter() - start
+        yield batch
+
+
+def get_pk_sort_key(table):
+    """Return a sort key of records by the primary key of table, None without one.
+
+    Notes:
+        Each primary key value v is keyed as (v is None, v), so records with a None or
+        missing value sort after the others instead of failing to compare with them.
+    """
+
+    pk_names = [col.name for col in table.primary_key]
+    if not pk_names:
+        return None
+
+    def sort_key(record):
+        return tuple((record.get(name) is None, record.get(name)) for name in pk_names)
+    return sort_key
+
+
+def _time_parse(batches, table_metrics):
+    """Yield batches, adding the time spent reading each one to table_metrics."""
+
+    batches = iter(batches)
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        table_metrics.parse_time += time.perf_counter() - start
+        if batch is None:
+            return
+        yield batch
+
+
+def insert_batches(conn, table, batches):
+    """Upsert each batch of decoded records into table. Return the number of records."""
+
+    count = 0
+    for batch in batches:
+        upsert.upsert(conn, table, batch)
+        count += len(batch)
+    return count
+
+
+@contextmanager
+def prefetch_batches(sources, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+    """Read the batches of several fixtures ahead in worker threads.
+
+    Parameters:
+        sources (list of tuple): (table, iterator of batches) in the order they are used.
+        workers (int): number of worker threads.
+        queue_size (int): number of batches read ahead per source. With 0, or with no
+            workers, sources are returned as is and read by the consumer.
+
+    Returns:
+        context manager giving the list of (table, PrefetchedBatches).
+
+    Notes:
+        Workers start in the order of sources and a worker blocks once its queue is
+        full, so at most workers * queue_size batches are held in memory. Close each
+        PrefetchedBatches when done with it, its worker then stops and moves on.
+
+        The worker threads share the GIL with the consumer. They overlap the parse with
+        inserts waiting on a database server, not with inserts bound by Python.
+    """
+
+    if workers < 1 or queue_size < 1:
+        yield sources
+        return
+
+    stop = threading.Event()
+    prefetched = [(table, PrefetchedBatches(batches, queue_size, stop))
+                  for table, batches in sources]
+    executor = ThreadPoolExecutor(workers)
+    try:
+        for table, batches in prefetched:
+            executor.submit(batches.produce)
+        yield prefetched
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+@contextmanager
+def pipeline_batches(tables, paths, batch_size=DEFAULT_BATCH_SIZE, order_by_pk=False,
+                     workers=1, queue_size=DEFAULT_QUEUE_SIZE, report=None):
+    """Read the fixtures of tables, parsing the large ones ahead in child processes.
+
+    Parameters:
+        tables (list of sqlalchemy Table): tables in the order their batches are used.
+        paths (dict): {table: path to its fixture file, or list of its shards}
+        batch_size (int): number of records per batch.
+        order_by_pk (boolean): True - sort each batch by primary key.
+        workers (int): number of upcoming fixtures parsed ahead of the current one.
+        queue_size (int): number of batches parsed ahead per fixture. With 0, every
+            fixture is read by the consumer.
+        report (metrics.Report): report the metrics of each table are collected in.
+
+    Returns:
+        context manager giving the list of (table, batches). Close each batches when
+        done with it.
+
+    Notes:
+        Fixtures of PROCESS_PARSE_MIN_BYTES or more are parsed by a child process each,
+        see ParsedBatches. When the consumer starts on one of them, the child processes
+        of the next workers of them start too, so the parse of upcoming fixtures
+        overlaps the inserts. A child blocks once queue_size batches wait in its queue,
+        so at most (workers + 1) * queue_size batches wait in memory. Smaller fixtures
+        are read by the consumer, a child process would cost more than their parse.
+        So is every fixture when the process may only use one CPU, the child would
+        take its time from the inserts.
+
+        Parsing in threads would not overlap the inserts: parse and inserts both hold
+        the GIL for most of their time, see prefetch_batches.
+
+        Each shard of a sharded fixture is a fixture of its own here, so the shards of
+        a table are parsed by up to workers + 1 child processes at the same time. A
+        child and its queue are created when it starts and released when its fixture
+        or shard is done, so the open pipes do not grow with the number of shards.
+    """
+
+    sources = []
+    parsed = []
+    pipelined = queue_size > 0 and get_cpu_count() > 1
+    for table in tables:
+        table_metrics = _get_table_metrics(report, table)
+        shards = []
+        for path in formats.get_paths(paths[table]):
+            if pipelined and _get_file_size(path) >= PROCESS_PARSE_MIN_BYTES:
+                batches = ParsedBatches(table, path, batch_size, queue_size,
+                                        order_by_pk, table_metrics)
+                parsed.append(batches)
+            else:
+                batches = read_fixture_batches(
+                    table, path, batch_size, order_by_pk, table_metrics)
+            shards.append(batches)
+        batches = shards[0] if len(shards) == 1 else ShardBatches(shards)
+        sources.append((table, batches))
+    for index, batches in enumerate(parsed):
+        batches.ahead = parsed[index + 1:index + 1 + workers]
+    try:
+        yield sources
+    finally:
+        for table, batches in sources:
+            batches.close()
+
+
+def get_cpu_count():
+    """Return the number of CPUs the process may use."""
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on linux
+        return os.cpu_count() or 1
+
+
+def _get_file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:  # reported when the fixture is read
+        return 0
+
+
+class ShardBatches(object):
+    """Iterator over the batches of the shards of a fixture, shard after shard.
+
+    Parameters:
+        shards (list): iterators over the batches of each shard, each with close().
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def __iter__(self):
+        for batches in self.shards:
+            try:
+                for batch in batches:
+                    yield batch
+            finally:
+                # releases the child process of a parsed shard before the next ones
+                batches.close()
+
+    def close(self):
+        for batches in self.shards:
+            batches.close()
+
+
+class ParsedBatches(object):
+    """Iterator over the batches of a fixture parsed by a child process.
+
+    Parameters:
+        table (sqlalchemy Table): the table the records are seeded into.
+        path (str): path to the fixture file.
+        batch_size (int): number of records per batch.
+        queue_size (int): number of batches the child parses ahead.
+        order_by_pk (boolean): True - sort each batch by primary key.
+        table_metrics (metrics.TableMetrics): metrics the bytes read and the parse and
+            convert times are added to.
+
+    Notes:
+        The child only reads the records and groups them in batches, sent through a
+        bounded queue. The batches are decoded by the consumer, so codecs registered
+        by the app apply whatever the start method of the child. The child starts
+        when iteration starts, or earlier with start().
+
+        The queue and the child are created by start() and released by close(), so
+        only the fixtures being parsed hold pipes, not every fixture of the seed.
+    """
+
+    def __init__(self, table, path, batch_size=DEFAULT_BATCH_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE, order_by_pk=False, table_metrics=None):
+        self.table = table
+        self.path = path
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.order_by_pk = order_by_pk
+        self.table_metrics = table_metrics
+        # ParsedBatches started with this one, see pipeline_batches
+        self.ahead = []
+        self.queue = None
+        self.process = None
+        self.closed = False
+
+    def start(self):
+        if self.process is None and not self.closed:
+            context = multiprocessing.get_context()
+            self.queue = context.Queue(self.queue_size)
+            self.process = context.Process(
+                target=_parse_fixture, args=(self.path, self.batch_size, self.queue),
+                daemon=True)
+            self.process.start()
+
+    def __iter__(self):
+        self.start()
+        for batches in self.ahead:
+            batches.start()
+        if self.table_metrics is not None:
+            self.table_metrics.bytes += os.path.getsize(self.path)
+        return decode_batches(self.table, self._receive(), self.order_by_pk,
+                              self.table_metrics)
+
+    def _receive(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.process.is_alive():
+                    continue
+                message = 'Parsing "{path}" stopped with exit code {code}.'.format(
+                    path=self.path, code=self.process.exitcode)
+                raise SeedError(message)
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, tuple):  # done, with the parse time of the child
+                if self.table_metrics is not None:
+                    self.table_metrics.parse_time += item[1]
+                return
+            yield item
+
+    def close(self):
+        self.closed = True
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.process.close()
+        self.queue.close()
+        self.queue.cancel_join_thread()
+        self.process = self.queue = None
+
+
+def _parse_fixture(path, batch_size, parsed):
+    """Put the batches of records of a fixture in the queue parsed, in a child process."""
+
+    elapsed = 0.
+    try:
+        records = formats.read_fixture_records(path)
+        try:
+            batches = iter_batches(records, batch_size)
+            while True:
+                start = time.perf_counter()
+                batch = next(batches, None)
+                elapsed += time.perf_counter() - start
+                if batch is None:
+                    break
+                parsed.put(batch)
+        finally:
+            records.close()
+    except Exception as e:
+        parsed.put(e)
+    else:
+        parsed.put(('done', elapsed))
+
+
+class PrefetchedBatches(object):
+    """Iterator over batches produced by a worker thread into a bounded queue."""
+
+    _done = object()
+
+    def __init__(self, batches, queue_size, stop):
+        self.batches = batches
+        self.queue = queue.Queue(queue_size)
+        self.stop = stop
+        self.closed = threading.Event()
+
+    def produce(self):
+        try:
+            for batch in self.batches:
+                if not self._put(batch):
+                    return
+        except Exception as e:
+            self._put(e)
+        else:
+            self._put(self._done)
+        finally:
+            self.batches.close()
+
+    def _put(self, item):
+        while not (self.stop.is_set() or self.closed.is_set()):
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self._done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self.closed.set()
+
+
+def iter_batches(iterable, batch_size):
+    """Yield lists of at most batch_size items from iterable."""
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 def get_fixture_models(model_names=[], excludes=[]):
@@ -82,26 +977,12 @@ def get_fixture_models(model_names=[], excludes=[]):
     Note:
         app.extensions['sqlafixtures'].fixtures_modules is a list of configured modules
         module.FIXTURES is a list of configured models
-    """
 
-    models = []
-    for module_name in current_app.extensions['sqlafixtures'].modules:
-        module = importlib.import_module(module_name)
-        for model_name in getattr(module, 'FIXTURES'):
-            if model_names and model_name not in model_names:
-                continue
-            if model_name in excludes:
-                continue
-            models.append(getattr(module, model_name))
-        mdl_names = [mdl.__name__ for mdl in models]
+        The models are looked up in app.extensions['sqlafixtures'].registry, which
+        imports the modules once, see flask_sqlafixtures.registry.
+    """
 
-        model_names = [name for name in model_names if name not in excludes]
-        for name in model_names:
-            if name not in mdl_names:
-                message = "Model '{name}' is not defined as a fixture.".format(
-                    name=name)
-                raise ModelNameError(message)
-    return models
+    return current_app.extensions['sqlafixtures'].registry.get_models(model_names, excludes)
 
 
 def format_fixture_record_dates(cols, records):
@@ -114,14 +995,31 @@ def format_fixture_record_dates(cols, records):
     Returns:
         records (list): list of dict records where col with str date have been convert to date
         or datetime.
+
+    Notes:
+        Every column with a registered codec is decoded, see type_codecs.
     """
 
-    for record in records:
-        for col in cols:
-            if col.type.python_type in (dt.date, dt.datetime):
-                record[col.name] = convert_str_to_datetime_or_date(
-                    record[col.name], col.type.python_type)
-    return records
+    if not cols:
+        return records
+    return type_codecs.get_table_codec(cols[0].table).decode_records(records)
+
+
+def get_conversion_plan(table):
+    """Return the conversion plan for a table.
+
+    Parameters:
+        table (sqlalchemy Table): the table records are seeded into.
+
+    Returns:
+        plan (list of tuple): (column name, converter) for each column that needs to be
+            converted from its json value. Columns that need no conversion are left out.
+
+    Notes:
+        The plan is compiled once per table, see type_codecs.get_table_codec.
+    """
+
+    return type_codecs.get_table_codec(table).decoders
 
 
 def convert_str_to_datetime_or_date(data, col_type=dt.date):
@@ -146,32 +1044,380 @@ def convert_str_to_datetime_or_date(data, col_type=dt.date):
     return data
 
 
-def create_fixtures(model_names, excludes=[], from_file=False):
+def create_fixtures(model_names, excludes=[], from_file=False, workers=1, force=False,
+                    report=None, where={}, sample={}):
     """Create json fixtures
 
     Parameters:
         model_names (list of str): names of models to create fixtures. If empty, create all.
         excludes (list of str): names of models to exclude
         from_file (boolean): True - create from xlsx file, False - create from db.
+        workers (int): number of models created at the same time. From file, models are
+            created in a process pool. From db, in a thread pool with one pooled
+            connection per thread.
+        force (boolean): From file, True - create every fixture, even when its sheet
+            and model are unchanged.
+        report (metrics.Report): report the metrics are collected in. If None, a new
+            one. Pass one to keep the metrics of a run that raises.
+        where (dict): from db, {model name: SQL condition} selecting the rows of a root
+            model of a subset, see Notes.
+        sample (dict): from db, {model name: number of rows or fraction} sampled from
+            the rows of a root model of a subset.
+
+    Returns:
+        report (metrics.Report): rows, bytes written and statements executed of each
+            fixture, and from file the sheet parse and convert times.
+
+    Notes:
+        A model that fails does not stop the others. The failures are raised together
+        as FixtureCreationError once every model is done.
+
+        From file, a fingerprint of each sheet and of the columns of its model is saved
+        next to the fixtures (see flask_sqlafixtures.fingerprints). Models whose
+        fingerprint is unchanged and whose fixture file exists are skipped.
+
+        The manifest of the fixtures directory is updated with the files, rows, hash,
+        columns and load order of each fixture, see flask_sqlafixtures.manifest.
+
+        With where or sample, only a subset of the rows is exported: the rows selected
+        in the root models, the rows of the models referencing them, and the rows
+        these reference, see flask_sqlafixtures.subset. The fixtures seed without
+        foreign key violations. Models not reached from the roots are exported empty.
+
+        The signals of flask_sqlafixtures.signals are sent as the run progresses.
     """
 
+    if report is None:
+        report = metrics.Report('create_fixtures')
+    if from_file and (where or sample):
+        raise subset.SubsetError('A subset can only be exported from the db.')
+    start = time.perf_counter()
     models = get_fixture_models(model_names, excludes)
+    signals.send(signals.export_started,
+                 model_names=[model.__name__ for model in models], from_file=from_file)
+    if from_file:
+        all_models = models
+        models, created = _skip_unchanged_sheets(models, force)
+        for model in all_models:
+            if model not in models:
+                report.table(model.__table__.name).status = 'skipped'
+    errors = {}
+    with _count_statements(report):
+        try:
+            keys = find_subset_keys(models, where, sample) if where or sample else None
+            errors = _create_fixtures(models, from_file, workers, report, keys)
+        finally:
+            report.elapsed = time.perf_counter() - start
+    for model in models:
+        table_metrics = report.table(model.__table__.name)
+        if model.__name__ in errors:
+            table_metrics.status = 'failed'
+            continue
+        table_metrics.status = 'created'
+        report.count += table_metrics.rows
+        signals.send(signals.fixture_created, metrics=table_metrics)
+    if from_file:
+        created.save([model for model in models if model.__name__ not in errors])
+        models = all_models
+    update_manifest(models, errors, report)
+    signals.send(signals.export_finished, report=report)
+    if errors:
+        raise FixtureCreationError(errors)
+    return report
+
+
+def update_manifest(models, errors={}, report=None):
+    """Update the manifest of the fixtures directory with the fixtures of models.
+
+    Parameters:
+        models (list): models whose fixtures were created or skipped.
+        errors (dict): {model name: exception} of the models that failed. Their
+            entries are removed.
+        report (metrics.Report): rows of the fixtures created. The records of the other
+            fixtures are counted, unless their entry is unchanged.
+
+    Notes:
+        Entries of other tables are kept. The load order covers every table of the
+        manifest, by foreign key level. Nothing is done outside of an app context.
+    """
+
+    if not has_app_context():
+        return
+    fixtures_directory = get_fixtures_directory()
+    if not os.path.isdir(fixtures_directory):
+        return
+    fixture_format = get_fixtures_format()
+    saved = manifest.load_manifest(fixtures_directory)
+    entries = dict(saved.get('tables', {}))
+    for model in models:
+        table = model.__table__
+        paths = formats.find_fixture_paths(fixtures_directory, table.name, fixture_format)
+        if model.__name__ in errors or not all(os.path.isfile(path) for path in paths):
+            entries.pop(table.name, None)
+            continue
+        rows = None
+        if report is not None and report.table(table.name).status == 'created':
+            rows = report.table(table.name).rows
+        elif manifest.get_fixture_hash(saved, fixtures_directory, table.name, paths):
+            continue
+        entries[table.name] = manifest.describe_fixture(
+            paths, table, fixture_format, rows)
+    metadata = current_app.extensions['sqlafixtures'].db.metadata
+    levels = group_tables_by_level(
+        [table for table in metadata.sorted_tables if table.name in entries])
+    manifest.save_manifest(fixtures_directory, manifest.set_load_order(
+        {'tables': entries}, [[table.name for table in level] for level in levels]))
+
+
+def find_subset_keys(models, where={}, sample={}):
+    """Return {table: sorted primary keys} of the subset of models to export.
+
+    Parameters:
+        models (list): the exported models.
+        where (dict): {model name: SQL condition} selecting the rows of a root model.
+        sample (dict): {model name: number of rows or fraction} of a root model.
+
+    Raises:
+        ModelNameError: for a root model that is not exported.
+    """
+
+    by_name = {model.__name__: model.__table__ for model in models}
+    for name in list(where) + list(sample):
+        if name not in by_name:
+            message = "Model '{name}' is not exported.".format(name=name)
+            raise ModelNameError(message)
+    engine = current_app.extensions['sqlafixtures'].db.engine
+    with engine.connect() as conn:
+        found = subset.find_subset(
+            conn, list(by_name.values()),
+            {by_name[name]: condition for name, condition in where.items()},
+            {by_name[name]: value for name, value in sample.items()},
+            current_app.extensions['sqlafixtures'].batch_size)
+    keys = {table: found.get_keys(table) for table in found.keys}
+    click.echo('Selected a subset of {count} rows from {roots}.'.format(
+        count=sum(len(table_keys) for table_keys in keys.values()),
+        roots=', '.join(sorted(set(where) | set(sample)))))
+    return keys
+
+
+def _create_fixtures(models, from_file, workers, report, keys=None):
+    """Create the fixtures of models. Return {model name: exception} of the failures.
+
+    Notes:
+        With keys, {table: primary keys}, only the rows with those keys are exported.
+    """
+
+    threaded = workers > 1 and not from_file and _engine_supports_threads(
+        current_app.extensions['sqlafixtures'].db.engine)
+    errors = {}
+    if from_file and workers > 1:
+        sfile = current_app.extensions['sqlafixtures'].file
+        with ProcessPoolExecutor(workers, initializer=_open_worker_workbook,
+                                 initargs=(sfile,)) as executor:
+            futures = [(model, executor.submit(
+                _create_fixture_from_worker_workbook, model, get_fixtures_directory(),
+                get_fixtures_format(), get_shard_limits()))
+                for model in models]
+            errors = _collect_model_errors(futures, report)
+    elif from_file:
+        # the workbook is opened once and each sheet is parsed when its model is created
+        with open_fixtures_workbook() as workbook:
+            for model in models:
+                try:
+                    _create_fixture(report, model, create_fixture_from_file, workbook)
+                except Exception as e:
+                    errors[model.__name__] = e
+    elif threaded:
+        app = current_app._get_current_object()
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [(model, executor.submit(
+                _run_in_app_context, app, _create_fixture, report, model,
+                create_fixture_from_db, *_get_subset_args(model, keys)))
+                for model in models]
+            errors = _collect_model_errors(futures)
+    else:
+        for model in models:
+            try:
+                _create_fixture(report, model, create_fixture_from_db,
+                                *_get_subset_args(model, keys))
+            except Exception as e:
+                errors[model.__name__] = e
+    return errors
+
+
+def _get_subset_args(model, keys):
+    """Return the arguments of create_fixture_from_db after model for a subset."""
+
+    return () if keys is None else (None, keys[model.__table__])
+
+
+def _create_fixture(report, model, function, *args):
+    """Call function(model, *args), collecting the metrics of model in report."""
+
+    with report.table(model.__table__.name).collect():
+        function(model, *args)
+
+
+@contextmanager
+def _count_statements(report):
+    """Count the statements of the app engine in report, when there is an app context."""
+
+    if not has_app_context():
+        yield report
+        return
+    with report.count_statements(current_app.extensions['sqlafixtures'].db.engine):
+        yield report
+
+
+def _skip_unchanged_sheets(models, force):
+    """Return (models to create, SheetFingerprints to save for the created models)."""
+
+    fixtures_directory = get_fixtures_directory()
+    fixture_format = get_fixtures_format()
+    shard_limits = get_shard_limits()
+    sheets = fingerprints.get_sheet_fingerprints(current_app.extensions['sqlafixtures'].file)
+    created = SheetFingerprints(fixtures_directory)
+    changed = []
+    skipped = []
     for model in models:
-        if from_file:
-            create_fixture_from_file(model)
+        table = model.__table__
+        sheet = sheets.get(table.name)
+        if sheet is not None:
+            created.current[table.name] = fingerprints.fingerprint_model(
+                sheet, table, fixture_format, shard_limits)
+        extension = formats.get_format(fixture_format).extension
+        exists = (os.path.isfile(os.path.join(fixtures_directory, table.name + extension))
+                  or formats.find_fixture_shards(fixtures_directory, table.name, extension))
+        if (not force and sheet is not None and exists
+                and created.saved.get(table.name) == created.current[table.name]):
+            skipped.append(table.name)
         else:
-            create_fixture_from_db(model)
+            changed.append(model)
+    if skipped:
+        click.echo('Skipped {count} unchanged sheets: {names}.'.format(
+            count=len(skipped), names=', '.join(skipped)))
+    return changed, created
+
+
+class SheetFingerprints(object):
+    """Fingerprints saved in a fixtures directory and computed for the current run."""
+
+    def __init__(self, fixtures_directory):
+        self.fixtures_directory = fixtures_directory
+        self.saved = fingerprints.load_fingerprints(fixtures_directory)
+        self.current = {}
+
+    def save(self, models):
+        """Save the current fingerprints of models created without error."""
+
+        updated = dict(self.saved)
+        for model in models:
+            name = model.__table__.name
+            if name in self.current:
+                updated[name] = self.current[name]
+            else:
+                updated.pop(name, None)
+        if updated != self.saved:
+            fingerprints.save_fingerprints(self.fixtures_directory, updated)
+            self.saved = updated
+
+
+def _collect_model_errors(futures, report=None):
+    """Wait for (model, future) pairs in order and return {model name: exception}.
+
+    Notes:
+        With report, the metrics.TableMetrics returned by the futures are added to it.
+    """
+
+    errors = {}
+    for model, future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            errors[model.__name__] = e
+            continue
+        if report is not None and isinstance(result, metrics.TableMetrics):
+            report.add(result)
+    return errors
+
+
+def _engine_supports_threads(engine):
+    """Return False for pools sharing one connection (ex: sqlite in memory)."""
+
+    return not isinstance(engine.pool, (StaticPool, SingletonThreadPool))
+
+
+def _run_in_app_context(app, function, *args):
+    with app.app_context():
+        return function(*args)
+
+
+_worker_workbook = None
+
+
+def _open_worker_workbook(sfile):
+    """Process pool initializer. Each worker opens the fixtures file once."""
+
+    import pandas as pd
+
+    global _worker_workbook
+    _worker_workbook = pd.ExcelFile(sfile)
+
+
+def _create_fixture_from_worker_workbook(model, fixtures_directory, fixture_format,
+                                        shard_limits=(None, None)):
+    table_metrics = metrics.TableMetrics(model.__table__.name)
+    with table_metrics.collect():
+        create_fixture_from_file(model, _worker_workbook, fixtures_directory, fixture_format,
+                                 *shard_limits)
+    return table_metrics
+
+
+def open_fixtures_workbook():
+    """Open the fixtures file.
+
+    Returns:
+        workbook (pd.ExcelFile): the opened fixtures file. Use as a context manager to
+            close it.
+    """
+
+    import pandas as pd
+
+    sfile = current_app.extensions['sqlafixtures'].file
+    return pd.ExcelFile(sfile)
 
 
-def create_fixture_from_file(model):
+def create_fixture_from_file(model, workbook=None, fixtures_directory=None,
+                             fixture_format=None, shard_rows=None, shard_bytes=None):
     """Create a fixture from an excel file for the associated model.
 
     Parameters:
         model (object): The model object for the fixture to create from the file.
+        workbook (pd.ExcelFile): the opened fixtures file. If None, the fixtures file is
+            read for this model only.
+        fixtures_directory (str): directory to write the fixture to. If None, use
+            get_fixtures_directory().
+        fixture_format (str): name of the fixture format. If None, use
+            get_fixtures_format().
+        shard_rows (int): maximum number of records per fixture file. If None, use
+            get_shard_limits(). 0 for no cap.
+        shard_bytes (int): size a fixture file is closed at. If None, use
+            get_shard_limits(). 0 for no cap.
 
+    Notes:
+        With workbook, fixtures_directory and fixture_format given, no app context is
+        needed.
+
+        A fixture over a cap is written in numbered shards, see
+        formats.write_fixture_shards.
     """
 
-    fixtures_directory = get_fixtures_directory()
+    if fixtures_directory is None:
+        fixtures_directory = get_fixtures_directory()
+    if fixture_format is None:
+        fixture_format = get_fixtures_format()
+    fixture_format = formats.get_format(fixture_format)
+    shard_rows, shard_bytes = _get_shard_limits(shard_rows, shard_bytes)
 
     click.echo('Creating a fixture for "{model}".'.format(model=model))
     fixture = {}
@@ -180,7 +1426,9 @@ def create_fixture_from_file(model):
     fixture['table']['name'] = table.name
     fixture['records'] = []
     cols = [col.name for col in model.__table__.columns]
-    df = get_fixture_dataframe(table.name)
+    start = time.perf_counter()
+    df = get_fixture_dataframe(table.name, workbook)
+    parsed = time.perf_counter()
     try:
         df = df[cols]
     except KeyError as e:
@@ -190,10 +1438,28 @@ def create_fixture_from_file(model):
         raise e
     df = convert_df_dates_to_str_or_none(df, table.columns)
     fixture['records'] = df.to_dict('records')
+    table_metrics = metrics.get_current_metrics()
+    if table_metrics is not None:
+        table_metrics.parse_time += parsed - start
+        table_metrics.convert_time += time.perf_counter() - parsed
+        table_metrics.rows += len(fixture['records'])
     #sfile = fixtures_directory.joinpath(table.name + '.json')
-    sfile = os.path.join(fixtures_directory, table.name + '.json')
-    with open(sfile, 'w') as outfile:
-        json.dump(fixture, outfile, indent=4)
+    sfiles, written = formats.write_fixture_shards(
+        fixtures_directory, table.name, fixture_format, cols, fixture['records'],
+        shard_rows, shard_bytes)
+    if not written:
+        click.echo('Fixture for "{model}" is unchanged.'.format(model=model))
+    formats.remove_other_fixtures(fixtures_directory, table.name, *sfiles)
+    if table_metrics is not None:
+        table_metrics.bytes += sum(os.path.getsize(sfile) for sfile in sfiles)
+
+
+def _get_shard_limits(shard_rows=None, shard_bytes=None):
+    """Return (shard_rows, shard_bytes), the configured limits for those that are None."""
+
+    configured = get_shard_limits()
+    return (configured[0] if shard_rows is None else shard_rows,
+            configured[1] if shard_bytes is None else shard_bytes)
 
 
 def convert_df_dates_to_str_or_none(df, cols):
@@ -215,10 +1481,17 @@ def convert_df_dates_to_str_or_none(df, cols):
     return df
 
 
-def get_fixture_dataframe(table_name):
-    """Function to get a fixture dataframe from the masters_fixture_file."""
+def get_fixture_dataframe(table_name, workbook=None):
+    """Function to get a fixture dataframe from the masters_fixture_file.
 
-    sfile = current_app.extensions['sqlafixtures'].file
+    Parameters:
+        table_name (str): name of the sheet to read.
+        workbook (pd.ExcelFile): the opened fixtures file. If None, open the fixtures file.
+    """
+
+    import pandas as pd
+
+    sfile = workbook if workbook is not None else current_app.extensions['sqlafixtures'].file
     df = pd.read_excel(sfile, sheet_name=table_name)
     # Drop all rows with NaN
     df = df.dropna(how='all')
@@ -234,35 +1507,68 @@ def format_datetime(data):
     return data.date().__str__()
 
 
-def create_fixture_from_db(model):
-    """Create a fixture from a model in the db."""
+def create_fixture_from_db(model, fixtures_directory=None, keys=None):
+    """Create a fixture from a model in the db.
+
+    Parameters:
+        model (object): The model object for the fixture to create from the db.
+        fixtures_directory (str): directory to write the fixture to. If None, use
+            get_fixtures_directory().
+        keys (list of tuple): sorted primary keys of the rows to export, see
+            find_subset_keys. If None, every row.
+
+    Notes:
+        Rows are fetched with a server side cursor where the driver supports one, in
+        batches of app.config['SQLAFIXTURES_BATCH_SIZE'], and written as they arrive,
+        so memory use does not grow with the size of the table.
+
+        With app.config['SQLAFIXTURES_SHARD_ROWS'] or ['SQLAFIXTURES_SHARD_BYTES'], a
+        table over a cap is written in numbered shards, see
+        formats.write_fixture_shards. Each shard is rendered in memory first, so
+        unchanged shards keep their mtime.
+
+        The rows and bytes written are added to the metrics collected by the current
+        thread, see metrics.get_current_metrics.
+    """
 
     db = current_app.extensions['sqlafixtures'].db
+    batch_size = current_app.extensions['sqlafixtures'].batch_size
+    fixture_format = formats.get_format(get_fixtures_format())
 
-    fixtures_directory = get_fixtures_directory()
+    if fixtures_directory is None:
+        fixtures_directory = get_fixtures_directory()
 
     click.echo('Creating fixture from db for "{model}".'.format(model=model))
     tablename = model.__tablename__
-    fixture = {}
-    fixture['table'] = {}
-    fixture['table']['name'] = tablename
-    fixture['records'] = []
-    cols = [col.name for col in model.__table__.columns]
-    statement = 'SELECT * FROM {}'.format(model.__tablename__)
-    rows = db.session.execute(statement)
-    [fixture['records'].append(dict(row)) for row in rows]
-    sfile = os.path.join(fixtures_directory, tablename + '.json')
-    with open(sfile, 'w') as outfile:
-        json.dump(fixture, outfile, indent=4, default=json_encoder)
-
-
-def json_encoder(obj):
-    """JSON encode for objects."""
+    table = model.__table__
+    codec = type_codecs.get_table_codec(table)
+    cols = [col.name for col in table.columns]
+    shard_rows, shard_bytes = get_shard_limits()
+    sfiles = [os.path.join(fixtures_directory, tablename + fixture_format.extension)]
+    with db.engine.connect() as conn:
+        if keys is None:
+            rows = conn.execution_options(stream_results=True).execute(table.select())
+            batches = iter(lambda: rows.fetchmany(batch_size), [])
+        else:
+            # selected by primary key with IN, in chunks sized to the bind parameters
+            batches = subset.select_rows(conn, table, keys)
+        records = (codec.encode(dict(row)) for batch in batches for row in batch)
+        table_metrics = metrics.get_current_metrics()
+        if table_metrics is not None:
+            records = _count_records(records, table_metrics)
+        if shard_rows or shard_bytes:
+            sfiles, written = formats.write_fixture_shards(
+                fixtures_directory, tablename, fixture_format, cols, records,
+                shard_rows, shard_bytes)
+        else:
+            with open(sfiles[0], 'w') as outfile:
+                fixture_format.write(outfile, tablename, cols, records)
+    formats.remove_other_fixtures(fixtures_directory, tablename, *sfiles)
+    if table_metrics is not None:
+        table_metrics.bytes += sum(os.path.getsize(sfile) for sfile in sfiles)
 
-    if type(obj) == dt.date:
-        return obj.__str__()
-    if type(obj) == dt.datetime:
-        return obj.strftime(DATETIME_FORMAT)
 
-    # if isinstance(obj, dt.date):
-    #     return obj.__str__()
+def _count_records(records, table_metrics):
+    for record in records:
+        table_metrics.rows += 1
+        yield record
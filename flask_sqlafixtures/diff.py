@@ -0,0 +1,244 @@
+import decimal
+import hashlib
+from sqlalchemy import select, tuple_, types
+from flask_sqlafixtures import upsert
+
+
+class TableDiff(object):
+    """Counts of the changes applied to a table by diff_batches.
+
+    Parameters:
+        table (sqlalchemy Table): the diffed table.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+        # primary keys of the fixture records, kept for delete_missing_rows
+        self.keys = None
+
+    def __str__(self):
+        return '{table}: {inserted} inserted, {updated} updated, {deleted} deleted, ' \
+            '{unchanged} unchanged'.format(
+                table=self.table.name, inserted=self.inserted, updated=self.updated,
+                deleted=self.deleted, unchanged=self.unchanged)
+
+
+class DiffLoader(object):
+    """Load function for seed applying only the differences with the table contents.
+
+    Parameters:
+        delete (boolean): True - rows missing from the fixture are deleted by
+            delete_missing.
+
+    Notes:
+        Called as load(conn, table, batches) like insert_batches, it returns the number
+        of rows inserted or updated. Deletes are applied by delete_missing once every
+        table is loaded, children before parents.
+    """
+
+    def __init__(self, delete=False):
+        self.delete = delete
+        self.diffs = []
+
+    def __call__(self, conn, table, batches):
+        table_diff = diff_batches(conn, table, batches, keep_keys=self.delete)
+        self.diffs.append(table_diff)
+        return table_diff.inserted + table_diff.updated
+
+    def delete_missing(self, conn):
+        """Delete the rows missing from the fixtures. Return the number of rows deleted."""
+
+        count = 0
+        if self.delete:
+            for table_diff in reversed(self.diffs):
+                count += delete_missing_rows(conn, table_diff)
+        return count
+
+
+def diff_batches(conn, table, batches, keep_keys=False):
+    """Insert the new records and update the changed records of each batch.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection used for the statements.
+        table (sqlalchemy Table): the table to seed.
+        batches (iterable of list of dict): decoded records.
+        keep_keys (boolean): True - keep the primary keys of the records, see
+            delete_missing_rows.
+
+    Returns:
+        TableDiff
+
+    Notes:
+        For each batch, the rows with the same primary keys are selected and the digest
+        of each record is compared with the digest of its row, over the columns of the
+        record normalized by their type, see get_normalizers. Only new and changed
+        records are upserted. Tables without a primary key
+        and records without their primary key values are upserted as they are.
+    """
+
+    table_diff = TableDiff(table)
+    pk_names = [col.name for col in table.primary_key]
+    if keep_keys:
+        table_diff.keys = set()
+    for batch in batches:
+        if not pk_names:
+            upsert.upsert(conn, table, batch)
+            table_diff.inserted += len(batch)
+            continue
+        columns = list(batch[0])
+        normalizers = get_normalizers(table, columns)
+        keyed = {}
+        changed = []
+        for record in batch:
+            key = tuple(record.get(name) for name in pk_names)
+            if None in key:
+                changed.append(record)
+                table_diff.inserted += 1
+            else:
+                keyed[key] = record
+        if keep_keys:
+            table_diff.keys.update(keyed)
+        digests = select_row_digests(conn, table, columns, list(keyed))
+        for key, record in keyed.items():
+            digest = digests.get(key)
+            if digest is None:
+                table_diff.inserted += 1
+            elif digest != row_digest((record[name] for name in columns), normalizers):
+                table_diff.updated += 1
+            else:
+                table_diff.unchanged += 1
+                continue
+            changed.append(record)
+        upsert.upsert(conn, table, changed)
+    return table_diff
+
+
+def select_row_digests(conn, table, columns, keys):
+    """Return {primary key: row digest} of the rows of table with the given keys.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the seeded database.
+        table (sqlalchemy Table): the table to read.
+        columns (list of str): names of the columns the digests are computed over.
+        keys (list of tuple): primary key values.
+
+    Notes:
+        Keys are selected with IN, in chunks sized to the bind parameter limit of the
+        dialect.
+    """
+
+    pk_cols = list(table.primary_key)
+    # labelled, a column both in the key and in columns is selected twice
+    labels = [col.label('pk_{}'.format(index)) for index, col in enumerate(pk_cols)]
+    cols = [table.columns[name] for name in columns]
+    normalizers = get_normalizers(table, columns)
+    digests = {}
+    for chunk in chunk_keys(conn, pk_cols, keys):
+        where = where_keys(pk_cols, chunk)
+        for row in conn.execute(select(labels + cols).where(where)):
+            key = tuple(row[:len(pk_cols)])
+            digests[key] = row_digest(row[len(pk_cols):], normalizers)
+    return digests
+
+
+def row_digest(values, normalizers=None):
+    """Return the digest of a sequence of column values.
+
+    Parameters:
+        values (iterable): the values of the columns.
+        normalizers (list of function): the normalizer of each column, or None for
+            none, see get_normalizers.
+    """
+
+    if normalizers is not None:
+        values = [normalize(value) if normalize is not None and value is not None
+                  else value for value, normalize in zip(values, normalizers)]
+    return hashlib.blake2b(repr(tuple(values)).encode('utf-8'), digest_size=16).digest()
+
+
+def get_normalizers(table, columns):
+    """Return the normalizer of the values of each of columns, or None for none.
+
+    Notes:
+        The value of a fixture and the value read back for a numeric column may
+        differ in type for the same number, ex: 2 in the fixture of a Float column
+        stored as 2.0, or a Decimal read as a float. Their repr, and so the digest of
+        their row, would differ and the row would be updated by every diff. Numbers
+        are converted to the python type of their column first: int, float, or a
+        normalized Decimal for Numeric columns with asdecimal.
+    """
+
+    return [_get_normalizer(table.columns[name].type) for name in columns]
+
+
+def _get_normalizer(type_):
+    if isinstance(type_, types.Boolean):
+        return _normalizer(bool)
+    if isinstance(type_, types.Integer):
+        return _normalizer(int)
+    if isinstance(type_, types.Numeric):
+        return _normalizer(_to_decimal if type_.asdecimal else float)
+    return None
+
+
+def _normalizer(convert):
+    """Return convert, keeping values it can not convert as they are."""
+
+    def normalize(value):
+        try:
+            return convert(value)
+        except (TypeError, ValueError, decimal.InvalidOperation):
+            return value
+    return normalize
+
+
+def _to_decimal(value):
+    # repr of a float is its shortest exact decimal, ex: 2.1 and not 2.100000000000000088
+    if isinstance(value, float):
+        value = repr(value)
+    return decimal.Decimal(value).normalize()
+
+
+def delete_missing_rows(conn, table_diff, batch_size=1000):
+    """Delete the rows of a diffed table whose primary key is not in the fixture.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection used for the statements.
+        table_diff (TableDiff): diff_batches result with its keys kept.
+        batch_size (int): number of primary keys fetched at a time.
+
+    Returns:
+        count (int): number of rows deleted.
+    """
+
+    table = table_diff.table
+    pk_cols = list(table.primary_key)
+    if not pk_cols or table_diff.keys is None:
+        return 0
+    rows = conn.execute(select(pk_cols))
+    missing = [tuple(row) for batch in iter(lambda: rows.fetchmany(batch_size), [])
+               for row in batch if tuple(row) not in table_diff.keys]
+    for chunk in chunk_keys(conn, pk_cols, missing):
+        conn.execute(table.delete().where(where_keys(pk_cols, chunk)))
+    table_diff.deleted += len(missing)
+    return len(missing)
+
+
+def chunk_keys(conn, pk_cols, keys):
+    """Yield lists of keys sized to the bind parameter limit of the dialect."""
+
+    chunk_size = max(1, upsert.get_max_bind_params(conn.dialect) // len(pk_cols))
+    for start in range(0, len(keys), chunk_size):
+        yield keys[start:start + chunk_size]
+
+
+def where_keys(pk_cols, keys):
+    """Return the condition selecting the rows whose pk_cols values are in keys."""
+
+    if len(pk_cols) == 1:
+        return pk_cols[0].in_([key[0] for key in keys])
+    return tuple_(*pk_cols).in_(keys)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+import simplejson as json
+
+FINGERPRINTS_FILENAME = '.sqlafixtures_fingerprints.json'
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# parts every sheet reads its values through: cell strings, number formats (dates)
+SHARED_PARTS = ('xl/sharedStrings.xml', 'xl/styles.xml')
+
+
+def get_sheet_fingerprints(path):
+    """Return {sheet name: fingerprint} for the xlsx workbook at path.
+
+    Parameters:
+        path (str): path to the workbook.
+
+    Returns:
+        dict of sheet name to a hex digest, empty when path is not an xlsx zip
+        (ex: xls). Sheets are then always regenerated.
+
+    Notes:
+        Only the zip directory and workbook.xml are read. A fingerprint covers the CRC
+        and size of the sheet part, of the shared strings and styles parts, and the
+        date1904 setting of the workbook, so a changed value in a sheet or in the parts
+        its values are read through changes the fingerprint of that sheet.
+    """
+
+    try:
+        workbook = zipfile.ZipFile(path)
+    except (IOError, OSError, zipfile.BadZipfile):
+        return {}
+    with workbook:
+        infos = {info.filename: info for info in workbook.infolist()}
+        try:
+            sheets = _get_sheet_parts(workbook)
+            date1904 = _get_date1904(workbook)
+        except (KeyError, ElementTree.ParseError):
+            return {}
+        shared = [_describe_part(infos.get(name)) for name in SHARED_PARTS]
+        fingerprints = {}
+        for name, part in sheets.items():
+            digest = hashlib.sha256()
+            for item in [_describe_part(infos.get(part)), date1904] + shared:
+                digest.update(item.encode('utf-8'))
+                digest.update(b'\0')
+            fingerprints[name] = digest.hexdigest()
+    return fingerprints
+
+
+def _get_sheet_parts(workbook):
+    """Return {sheet name: zip member name of the sheet part}."""
+
+    rels = ElementTree.fromstring(workbook.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels.iter(PKG_REL_NS + 'Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            targets[rel.get('Id')] = target.lstrip('/')
+        else:
+            targets[rel.get('Id')] = posixpath.normpath(posixpath.join('xl', target))
+
+    root = ElementTree.fromstring(workbook.read('xl/workbook.xml'))
+    return {sheet.get('name'): targets.get(sheet.get(REL_NS + 'id'))
+            for sheet in root.iter(MAIN_NS + 'sheet')}
+
+
+def _get_date1904(workbook):
+    root = ElementTree.fromstring(workbook.read('xl/workbook.xml'))
+    properties = root.find(MAIN_NS + 'workbookPr')
+    return properties.get('date1904', '') if properties is not None else ''
+
+
+def _describe_part(info):
+    if info is None:
+        return ''
+    return '{}:{}:{}'.format(info.filename, info.CRC, info.file_size)
+
+
+def fingerprint_model(sheet_fingerprint, table, fixture_format, shard_limits=(None, None)):
+    """Return the fingerprint of the fixture created for table from a sheet.
+
+    Parameters:
+        sheet_fingerprint (str): fingerprint of the sheet, see get_sheet_fingerprints.
+        table (sqlalchemy Table): the table of the model the fixture is created for.
+        fixture_format (str): name of the format the fixture is written in.
+        shard_limits (tuple): (shard_rows, shard_bytes) the fixture is split with.
+    """
+
+    digest = hashlib.sha256()
+    parts = [sheet_fingerprint, fixture_format, 'shards:{}:{}'.format(*shard_limits)]
+    parts += ['{}:{!r}'.format(col.name, col.type) for col in table.columns]
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_fingerprints(directory):
+    """Return the {table name: fingerprint} saved in directory, or {}."""
+
+    path = os.path.join(directory, FINGERPRINTS_FILENAME)
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_fingerprints(directory, fingerprints):
+    """Save {table name: fingerprint} in directory, replacing the file atomically."""
+
+    path = os.path.join(directory, FINGERPRINTS_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(fingerprints, fp, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,493 @@
+import io
+import os
+import re
+import datetime as dt
+import simplejson as json
+from flask_sqlafixtures.type_codecs import DATETIME_FORMAT
+
+READ_CHUNK_SIZE = 64 * 1024
+RECORD_INDENT = ' ' * 8
+COMPACT_SEPARATORS = (',', ':')
+
+WHITESPACE = re.compile(r'\s*')
+
+DEFAULT_FORMAT = 'json'
+
+# shards of a fixture are named <table>.<number><extension>, ex: tools.0000.json
+SHARD_DIGITS = 4
+SHARD_NAME = re.compile(r'^(.+)\.(\d{4,})(\.[^.]+)$')
+
+# end of the records, see write_fixture_shards
+_END = object()
+
+# name -> format, in order of registration
+FORMATS = {}
+
+
+class FixtureFormatError(ValueError):
+    """Exception raised when a fixture file can not be parsed or its format is unknown."""
+
+    def __init__(self, message):
+        super(FixtureFormatError, self).__init__(message)
+        self.message = message
+
+
+class JSONFormat(object):
+    """{"table": {...}, "records": [{col: value, ...}, ...]} indented by 4 spaces."""
+
+    name = 'json'
+    extension = '.json'
+
+    def write(self, outfile, table_name, columns, records):
+        write_fixture(outfile, table_name, records)
+
+    def read(self, fp):
+        return iter_fixture_records(fp)
+
+
+class ColumnarFormat(JSONFormat):
+    """{"table": {...}, "columns": [col, ...], "rows": [[value, ...], ...]}
+
+    Column names are written once and each row is a compact array on its own line.
+    Read by the same reader as JSONFormat.
+    """
+
+    name = 'columnar'
+
+    def write(self, outfile, table_name, columns, records):
+        columns = list(columns)
+        outfile.write('{"table":')
+        outfile.write(json.dumps({'name': table_name}, separators=COMPACT_SEPARATORS))
+        outfile.write(',"columns":')
+        outfile.write(json.dumps(columns, separators=COMPACT_SEPARATORS))
+        outfile.write(',"rows":[')
+        separator = '\n'
+        for record in records:
+            outfile.write(separator)
+            outfile.write(json.dumps([record[name] for name in columns],
+                                     separators=COMPACT_SEPARATORS, default=json_encoder))
+            separator = ',\n'
+        outfile.write('\n]}\n')
+
+
+class JSONLinesFormat(object):
+    """A header line {"table": {...}, "columns": [...]} followed by one record per line.
+
+    Records can be appended to an existing file.
+    """
+
+    name = 'jsonl'
+    extension = '.jsonl'
+
+    def write(self, outfile, table_name, columns, records):
+        header = {'table': {'name': table_name}, 'columns': list(columns)}
+        outfile.write(json.dumps(header, separators=COMPACT_SEPARATORS) + '\n')
+        for record in records:
+            outfile.write(json.dumps(record, separators=COMPACT_SEPARATORS,
+                                     default=json_encoder) + '\n')
+
+    def read(self, fp):
+        # the first line written is the header, every later line a record, whatever
+        # its keys
+        header = True
+        for line in fp:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise FixtureFormatError('Fixture file has an invalid json line.')
+            if header:
+                header = False
+                continue
+            yield record
+
+
+def register_format(fixture_format):
+    """Register a fixture format.
+
+    Parameters:
+        fixture_format (object): with name, extension, write(outfile, table_name,
+            columns, records) and read(fp) returning an iterator of records. The first
+            format registered for an extension reads the files with that extension.
+    """
+
+    FORMATS[fixture_format.name] = fixture_format
+
+
+def get_format(name):
+    """Return the registered format called name."""
+
+    try:
+        return FORMATS[name]
+    except KeyError:
+        message = "Fixture format '{name}' is not registered.".format(name=name)
+        raise FixtureFormatError(message)
+
+
+def get_extensions(first=None):
+    """Return the registered extensions, starting with the extension of format first."""
+
+    extensions = [get_format(first).extension] if first else []
+    for fixture_format in FORMATS.values():
+        if fixture_format.extension not in extensions:
+            extensions.append(fixture_format.extension)
+    return extensions
+
+
+def get_reader(path):
+    """Return the format reading the file at path, detected from its extension."""
+
+    for fixture_format in FORMATS.values():
+        if path.endswith(fixture_format.extension):
+            return fixture_format
+    message = "No fixture format reads '{path}'.".format(path=path)
+    raise FixtureFormatError(message)
+
+
+def find_fixture_path(directory, table_name, preferred=DEFAULT_FORMAT):
+    """Return the path of the fixture file for table_name in directory.
+
+    Parameters:
+        directory (str): the fixtures directory.
+        table_name (str): name of the table.
+        preferred (str): name of the format checked first, and used for the path
+            returned when no fixture file exists.
+    """
+
+    for extension in get_extensions(preferred):
+        path = os.path.join(directory, table_name + extension)
+        if os.path.isfile(path):
+            return path
+    return os.path.join(directory, table_name + get_format(preferred).extension)
+
+
+def find_fixture_paths(directory, table_name, preferred=DEFAULT_FORMAT):
+    """Return the paths of the fixture files for table_name in directory.
+
+    Returns:
+        paths (list of str): the shards of the fixture in order, see get_shard_path, or
+            the path of its single fixture file, see find_fixture_path.
+    """
+
+    for extension in get_extensions(preferred):
+        path = os.path.join(directory, table_name + extension)
+        if os.path.isfile(path):
+            return [path]
+        shards = find_fixture_shards(directory, table_name, extension)
+        if shards:
+            return shards
+    return [os.path.join(directory, table_name + get_format(preferred).extension)]
+
+
+def get_shard_path(directory, table_name, index, extension):
+    """Return the path of shard number index of a fixture, ex: tools.0000.json"""
+
+    return os.path.join(directory, '{name}.{index:0{digits}d}{extension}'.format(
+        name=table_name, index=index, digits=SHARD_DIGITS, extension=extension))
+
+
+def get_shard_index(path):
+    """Return the shard number of the fixture file at path, or None if not a shard."""
+
+    match = SHARD_NAME.match(os.path.basename(path))
+    return int(match.group(2)) if match else None
+
+
+def find_fixture_shards(directory, table_name, extension):
+    """Return the paths of the shards of table_name with extension, by shard number."""
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    shards = []
+    for name in names:
+        match = SHARD_NAME.match(name)
+        if match and match.group(1) == table_name and match.group(3) == extension:
+            shards.append((int(match.group(2)), os.path.join(directory, name)))
+    return [path for index, path in sorted(shards)]
+
+
+def get_paths(path):
+    """Return the list of paths of a fixture given as one path or a list of shards."""
+
+    return [path] if isinstance(path, str) else list(path)
+
+
+def remove_other_fixtures(directory, table_name, *paths):
+    """Remove the fixture files and shards for table_name other than paths."""
+
+    others = []
+    for extension in get_extensions():
+        others.append(os.path.join(directory, table_name + extension))
+        others.extend(find_fixture_shards(directory, table_name, extension))
+    for other in others:
+        if other not in paths and os.path.isfile(other):
+            os.remove(other)
+
+
+def write_fixture_file(path, fixture_format, table_name, columns, records):
+    """Write a fixture file, leaving it untouched when its content would not change.
+
+    Parameters:
+        path (str): path of the fixture file.
+        fixture_format (object): a registered format.
+        table_name (str): name of the fixture table.
+        columns (list of str): names of the columns of the records.
+        records (iterable of dict): json serializable records.
+
+    Returns:
+        written (boolean): False when the file already held the same content.
+
+    Notes:
+        The fixture is rendered in memory first, so an unchanged file keeps its mtime.
+    """
+
+    outfile = io.StringIO()
+    fixture_format.write(outfile, table_name, columns, records)
+    return _write_if_changed(path, outfile.getvalue())
+
+
+def _write_if_changed(path, data):
+    """Write data to path unless the file already holds it. Return True if written."""
+
+    try:
+        with open(path) as fp:
+            if fp.read() == data:
+                return False
+    except (IOError, OSError):
+        pass
+    with open(path, 'w') as fp:
+        fp.write(data)
+    return True
+
+
+def write_fixture_shards(directory, table_name, fixture_format, columns, records,
+                         shard_rows=None, shard_bytes=None):
+    """Write a fixture split in numbered shard files, leaving unchanged shards untouched.
+
+    Parameters:
+        directory (str): the fixtures directory.
+        table_name (str): name of the fixture table.
+        fixture_format (object): a registered format.
+        columns (list of str): names of the columns of the records.
+        records (iterable of dict): json serializable records.
+        shard_rows (int): maximum number of records per shard. None or 0 for no cap.
+        shard_bytes (int): size a shard is closed at. None or 0 for no cap.
+
+    Returns:
+        (paths, written): paths (list of str) of the files of the fixture in order,
+            written (int) the number of them whose content changed.
+
+    Notes:
+        A fixture fitting in one shard is written to its single fixture file, ex:
+        tools.json, otherwise to tools.0000.json, tools.0001.json and so on. Each
+        shard is a complete fixture of its records.
+
+        A shard is closed once its size reaches shard_bytes, so it may go past it by
+        one record. Each shard is rendered in memory, as in write_fixture_file, so
+        memory use is bounded by the caps.
+    """
+
+    records = iter(records)
+    record = next(records, _END)
+    paths = []
+    written = 0
+    while record is not _END or not paths:
+        outfile = io.StringIO()
+        shard = _iter_shard_records(record, records, outfile, shard_rows, shard_bytes)
+        fixture_format.write(outfile, table_name, columns, shard)
+        record = next(records, _END)
+        if paths or record is not _END:
+            path = get_shard_path(directory, table_name, len(paths), fixture_format.extension)
+        else:
+            path = os.path.join(directory, table_name + fixture_format.extension)
+        written += _write_if_changed(path, outfile.getvalue())
+        paths.append(path)
+    return paths, written
+
+
+def _iter_shard_records(record, records, outfile, shard_rows, shard_bytes):
+    """Yield record then the next records until the shard written to outfile is full."""
+
+    if record is _END:
+        return
+    yield record
+    count = 1
+    while ((not shard_rows or count < shard_rows)
+           and (not shard_bytes or outfile.tell() < shard_bytes)):
+        record = next(records, _END)
+        if record is _END:
+            return
+        yield record
+        count += 1
+
+
+def read_fixture_records(path):
+    """Yield the records of the fixture file at path, whatever its format."""
+
+    fixture_format = get_reader(path)
+    with open(path) as fp:
+        for record in fixture_format.read(fp):
+            yield record
+
+
+def iter_fixture_records(fp, chunk_size=READ_CHUNK_SIZE):
+    """Yield the records of a fixture file one at a time.
+
+    Parameters:
+        fp (file): open fixture file.
+        chunk_size (int): number of characters read from fp at a time.
+
+    Returns:
+        generator of dict records.
+
+    Notes:
+        Only the 'records' array, or the 'rows' array of the columnar format, is
+        streamed. Other top level keys ('table') are decoded and discarded.
+    """
+
+    reader = _FixtureReader(fp, chunk_size)
+    columns = None
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'records':
+            for record in reader.array():
+                yield record
+        elif key == 'rows':
+            if columns is None:
+                raise FixtureFormatError("Fixture file has 'rows' before 'columns'.")
+            for row in reader.array():
+                yield dict(zip(columns, row))
+        elif key == 'columns':
+            columns = reader.value()
+        else:
+            reader.value()
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
+
+
+class _FixtureReader(object):
+    """Buffered reader decoding one json value at a time from a file."""
+
+    def __init__(self, fp, chunk_size=READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk into the buffer. Return False at end of file."""
+
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non whitespace character, or '' at end of file."""
+
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            message = "Expected '{char}' in fixture file, found '{found}'.".format(
+                char=char, found=found)
+            raise FixtureFormatError(message)
+        self.pos += 1
+
+    def array(self):
+        """Yield the values of the next json array one at a time."""
+
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.expect(',')
+
+    def value(self):
+        """Decode and return the next json value."""
+
+        self.peek()
+        while True:
+            try:
+                data, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise FixtureFormatError('Fixture file is not valid json.')
+            else:
+                # a value ending at the buffer boundary may be a truncated number
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return data
+            self.fill()
+
+
+def write_fixture(outfile, table_name, records):
+    """Write a fixture one record at a time.
+
+    Parameters:
+        outfile (file): file opened for writing.
+        table_name (str): name of the fixture table.
+        records (iterable of dict): json serializable records.
+
+    Notes:
+        The output is identical to json.dump(fixture, outfile, indent=4).
+    """
+
+    outfile.write('{\n    "table": {\n        "name": ')
+    outfile.write(json.dumps(table_name))
+    outfile.write('\n    },\n    "records": [')
+    separator = '\n'
+    for record in records:
+        outfile.write(separator + RECORD_INDENT)
+        outfile.write(json.dumps(record, indent=4, default=json_encoder).replace(
+            '\n', '\n' + RECORD_INDENT))
+        separator = ',\n'
+    if separator != '\n':
+        outfile.write('\n    ')
+    outfile.write(']\n}')
+
+
+def json_encoder(obj):
+    """JSON encode for objects.
+
+    Notes:
+        Column values are encoded by type_codecs before dumping. This handles dates
+        from types without a codec (ex: a TypeDecorator) and raises TypeError for
+        anything else rather than writing null.
+    """
+
+    if type(obj) == dt.date:
+        return obj.__str__()
+    if type(obj) == dt.datetime:
+        return obj.strftime(DATETIME_FORMAT)
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+register_format(JSONFormat())
+register_format(ColumnarFormat())
+register_format(JSONLinesFormat())
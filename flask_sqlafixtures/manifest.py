@@ -0,0 +1,145 @@
+"""Manifest of the fixtures of a directory, written by the create commands.
+
+manifest.json lists for each table its fixture files with their size and mtime, its
+row count, total size, content hash (see seed_state.hash_fixture), columns, foreign
+key level and position in the load order:
+
+    {
+        "version": 1,
+        "created": "2020-04-12T05:22:33",
+        "load_order": ["users", "tools"],
+        "tables": {
+            "users": {"files": [{"name": "users.json", "bytes": 312,
+                                 "mtime_ns": 1586668953000000000}],
+                      "format": "json", "rows": 2, "bytes": 312, "sha256": "...",
+                      "columns": ["id", "name"], "depends_on": [], "level": 0},
+            ...
+        }
+    }
+
+The manifest is read without opening the fixture files. A table entry is only trusted
+while the size and mtime of each of its files are unchanged, see get_fixture_hash.
+"""
+import datetime as dt
+import os
+import simplejson as json
+from flask_sqlafixtures import formats, seed_state
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def describe_fixture(paths, table, fixture_format, rows=None):
+    """Return the manifest entry of the fixture of table.
+
+    Parameters:
+        paths (list of str): paths of the fixture file, or of its shards in order.
+        table (sqlalchemy Table): the table of the fixture.
+        fixture_format (str): name of the format of the fixture.
+        rows (int): number of records of the fixture. If None, they are counted.
+    """
+
+    files = []
+    for path in paths:
+        stat = os.stat(path)
+        files.append({'name': os.path.basename(path), 'bytes': stat.st_size,
+                      'mtime_ns': stat.st_mtime_ns})
+    if rows is None:
+        rows = sum(1 for path in paths for record in formats.read_fixture_records(path))
+    return {
+        'files': files,
+        'format': fixture_format,
+        'rows': rows,
+        'bytes': sum(info['bytes'] for info in files),
+        'sha256': seed_state.hash_fixture(paths),
+        'columns': [col.name for col in table.columns],
+        'depends_on': sorted({fk.column.table.name for fk in table.foreign_keys
+                              if fk.column.table is not table}),
+    }
+
+
+def set_load_order(manifest, levels):
+    """Set the load order and the level of each table of manifest.
+
+    Parameters:
+        manifest (dict): a manifest, see load_manifest.
+        levels (list of list of str): names of the tables of each foreign key level,
+            see db_utils.group_tables_by_level. Tables missing from levels are dropped.
+    """
+
+    tables = manifest['tables']
+    order = []
+    for level, names in enumerate(levels):
+        for name in names:
+            if name in tables:
+                tables[name]['level'] = level
+                order.append(name)
+    manifest['tables'] = {name: tables[name] for name in order}
+    manifest['load_order'] = order
+    return manifest
+
+
+def get_fixture_hash(manifest, directory, table_name, paths):
+    """Return the sha256 of the fixture at paths recorded in manifest, or None.
+
+    Notes:
+        None unless the manifest lists the same files for the table, with the same
+        size and mtime.
+    """
+
+    entry = manifest.get('tables', {}).get(table_name)
+    if entry is None:
+        return None
+    if [os.path.join(directory, info['name']) for info in entry['files']] != paths:
+        return None
+    for path, info in zip(paths, entry['files']):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != info['bytes'] or stat.st_mtime_ns != info['mtime_ns']:
+            return None
+    return entry['sha256']
+
+
+def format_summary(manifest):
+    """Return the lines of a summary of manifest, one per table in load order."""
+
+    tables = manifest['tables']
+    lines = ['{count} tables, {rows} rows, {size} bytes, created {created}.'.format(
+        count=len(tables), rows=sum(entry['rows'] for entry in tables.values()),
+        size=sum(entry['bytes'] for entry in tables.values()),
+        created=manifest['created'])]
+    for name in manifest['load_order']:
+        entry = tables[name]
+        lines.append('{level} {name}: {rows} rows, {files} file(s), {size} bytes'.format(
+            level=entry['level'], name=name, rows=entry['rows'],
+            files=len(entry['files']), size=entry['bytes']))
+    return lines
+
+
+def load_manifest(directory):
+    """Return the manifest saved in directory, or {} when missing or unreadable."""
+
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    try:
+        with open(path) as fp:
+            manifest = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(directory, manifest):
+    """Save manifest in directory, replacing the file atomically."""
+
+    manifest = dict(manifest, version=MANIFEST_VERSION,
+                    created=dt.datetime.now().isoformat(timespec='seconds'))
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(manifest, fp, indent=4)
+    os.replace(tmp_path, path)
+    return manifest
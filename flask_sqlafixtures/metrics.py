@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import contextmanager
+import simplejson as json
+from sqlalchemy import event
+
+# metrics of the table being loaded or exported by the current thread
+_local = threading.local()
+
+
+class TableMetrics(object):
+    """Metrics of the seed or the export of one table.
+
+    Parameters:
+        name (str): name of the table.
+
+    Notes:
+        Times are in seconds. For a seed, bytes are the bytes of the fixture read,
+        parse_time the time spent reading and parsing records from it, convert_time
+        the time spent decoding them, and insert_time the time spent in the load
+        function less the time it waited for batches. With workers, parsing and
+        converting run in other threads and overlap the inserts.
+
+        For an export, bytes are the bytes of the fixture written. From xlsx,
+        parse_time is the time spent reading the sheet and convert_time the time spent
+        converting its values.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+        self.rows = 0
+        self.bytes = 0
+        self.parse_time = 0.
+        self.convert_time = 0.
+        self.insert_time = 0.
+        self.elapsed = 0.
+        self.statements = 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'parse_time': self.parse_time,
+            'convert_time': self.convert_time,
+            'insert_time': self.insert_time,
+            'elapsed': self.elapsed,
+            'statements': self.statements,
+        }
+
+    @contextmanager
+    def collect(self):
+        """Attribute the statements executed by the current thread to this table.
+
+        Notes:
+            The elapsed time of the block is added to elapsed. Functions called in the
+            block find the metrics with get_current_metrics.
+        """
+
+        previous = getattr(_local, 'metrics', None)
+        _local.metrics = self
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.elapsed += time.perf_counter() - start
+            _local.metrics = previous
+
+    def load(self, load, conn, table, batches):
+        """Call load(conn, table, batches), timing the inserts. Return its count."""
+
+        batches = _TimedBatches(batches)
+        start = time.perf_counter()
+        with self.collect():
+            count = load(conn, table, batches)
+        self.insert_time += time.perf_counter() - start - batches.waited
+        self.rows += count
+        return count
+
+
+class _TimedBatches(object):
+    """Iterator over batches keeping the time spent waiting for each batch."""
+
+    def __init__(self, batches):
+        self.batches = iter(batches)
+        self.waited = 0.
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.batches)
+        finally:
+            self.waited += time.perf_counter() - start
+
+
+class Report(object):
+    """Metrics of a seed or of a create_fixtures run, table by table.
+
+    Parameters:
+        operation (str): 'seed' or 'create_fixtures'.
+
+    Attributes:
+        tables (list of TableMetrics): in the order the tables were started.
+        count (int): number of records seeded or exported.
+        statements (int): number of statements executed, including the statements not
+            attributed to a table (seed state, deletes).
+        elapsed (float): seconds from the start to the end of the run.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.time()
+        self.elapsed = 0.
+        self.count = 0
+        self.statements = 0
+        self.tables = []
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        """Return the TableMetrics of the table named name, added when missing."""
+
+        with self._lock:
+            if name not in self._by_name:
+                self.add(TableMetrics(name))
+            return self._by_name[name]
+
+    def add(self, metrics):
+        """Add the TableMetrics of a table, ex: returned by a worker process."""
+
+        self._by_name[metrics.name] = metrics
+        self.tables.append(metrics)
+
+    def to_dict(self):
+        return {
+            'operation': self.operation,
+            'started': self.started,
+            'elapsed': self.elapsed,
+            'count': self.count,
+            'statements': self.statements,
+            'tables': [metrics.to_dict() for metrics in self.tables],
+        }
+
+    def save(self, path):
+        """Save the report as json."""
+
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=4)
+
+    @contextmanager
+    def count_statements(self, engine):
+        """Count the statements executed on engine while the block runs.
+
+        Notes:
+            Statements are counted with the before_cursor_execute event of the engine.
+            An executemany is one statement. Each statement is also attributed to the
+            table whose metrics are collected by the executing thread.
+        """
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context,
+                                  executemany):
+            metrics = get_current_metrics()
+            with self._lock:
+                self.statements += 1
+                if metrics is not None:
+                    metrics.statements += 1
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield self
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def get_current_metrics():
+    """Return the TableMetrics collected by the current thread, or None."""
+
+    return getattr(_local, 'metrics', None)
@@ -0,0 +1,146 @@
+"""pytest plugin seeding the fixture tables once per session.
+
+Enable it in the conftest.py of the tests and provide the app::
+
+    pytest_plugins = ['flask_sqlafixtures.pytest_plugin']
+
+    @pytest.fixture(scope='session')
+    def sqlafixtures_app():
+        return create_app(TestConfig)
+
+Tests then use the sqlafixtures_session fixture. It is a session bound to a connection
+inside a transaction that is rolled back when the test ends, and it is also set as
+db.session for the duration of the test.
+"""
+from contextlib import contextmanager
+import pytest
+from flask import current_app
+from sqlalchemy import event
+from flask_sqlafixtures import db_utils, snapshots
+
+MARKER = 'sqlafixtures'
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        '{}(*model_names): only the fixture tables of model_names (and the tables they '
+        'reference) hold rows during the test.'.format(MARKER))
+
+
+@pytest.fixture(scope='session')
+def sqlafixtures_app():
+    """The app under test. Override in conftest.py with a session scoped fixture."""
+
+    raise pytest.UsageError(
+        "Define a session scoped 'sqlafixtures_app' fixture returning the Flask app.")
+
+
+@pytest.fixture(scope='session')
+def sqlafixtures_db(sqlafixtures_app):
+    """The flask_sqlalchemy db of the app, seeded once for the session."""
+
+    with sqlafixtures_app.app_context():
+        seed_session_database()
+        yield sqlafixtures_app.extensions['sqlafixtures'].db
+
+
+@pytest.fixture
+def sqlafixtures_session(request, sqlafixtures_db):
+    """A session whose changes are rolled back at the end of the test."""
+
+    marker = request.node.get_closest_marker(MARKER)
+    model_names = list(marker.args) if marker is not None else None
+    with transaction_scope(sqlafixtures_db, model_names) as session:
+        yield session
+
+
+def seed_session_database(model_names=[]):
+    """Create the schema and seed the fixtures of the app database.
+
+    Notes:
+        The database is restored from a snapshot where the dialect supports it (see
+        flask_sqlafixtures.snapshots), so the seed itself runs once per change of the
+        schema or fixtures. Other dialects are created and seeded directly.
+    """
+
+    try:
+        snapshots.restore_snapshot(model_names)
+    except snapshots.SnapshotError:
+        db = current_app.extensions['sqlafixtures'].db
+        db.create_all()
+        db_utils.seed(model_names)
+
+
+@contextmanager
+def transaction_scope(db, model_names=None):
+    """Run a block in an outer transaction that is rolled back when the block exits.
+
+    Parameters:
+        db (flask_sqlalchemy SQLAlchemy): db of the app.
+        model_names (list of str): if not None, rows of the other fixture tables are
+            deleted inside the transaction, except for tables referenced by the tables
+            of model_names.
+
+    Returns:
+        context manager giving the session, also set as db.session.
+
+    Notes:
+        The session works inside a SAVEPOINT, which is restarted whenever the code
+        under test commits or rolls back, so commits are visible to the test but never
+        leave the outer transaction.
+    """
+
+    connection = db.engine.connect()
+    transaction = db_utils.begin_transaction(connection)
+    if model_names is not None:
+        clear_other_tables(connection, db.metadata, model_names)
+    session = db.create_scoped_session(options={'bind': connection, 'binds': {}})
+    session.begin_nested()
+
+    @event.listens_for(session(), 'after_transaction_end')
+    def restart_savepoint(sess, trans):
+        if trans.nested and not trans._parent.nested:
+            sess.expire_all()
+            sess.begin_nested()
+
+    original = db.session
+    db.session = session
+    try:
+        yield session
+    finally:
+        db.session = original
+        # the SAVEPOINT is rolled back for the outer transaction to be the current one
+        # again, and must not be restarted
+        event.remove(session(), 'after_transaction_end', restart_savepoint)
+        session.rollback()
+        session.remove()
+        transaction.rollback()
+        connection.close()
+
+
+def clear_other_tables(conn, metadata, model_names):
+    """Delete the rows of the fixture tables not needed by the models of model_names."""
+
+    kept = set()
+    if model_names:
+        kept = get_referenced_tables(
+            [mdl.__table__ for mdl in db_utils.get_fixture_models(model_names)])
+    for model in reversed(db_utils.sort_models_by_dependency(
+            db_utils.get_fixture_models(), metadata)):
+        if model.__table__ not in kept:
+            conn.execute(model.__table__.delete())
+
+
+def get_referenced_tables(tables):
+    """Return the set of tables and of the tables they reference, recursively."""
+
+    referenced = set()
+    pending = list(tables)
+    while pending:
+        table = pending.pop()
+        if table in referenced:
+            continue
+        referenced.add(table)
+        pending.extend(fk.column.table for fk in table.foreign_keys)
+    return referenced
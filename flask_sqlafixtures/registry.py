@@ -0,0 +1,124 @@
+import importlib
+import threading
+from contextlib import contextmanager
+from flask_sqlafixtures.db_utils import ModelNameError
+
+
+class FixtureRegistry(object):
+    """Fixture models of the configured modules, indexed by model name, table and module.
+
+    Parameters:
+        modules (list of str): names of the modules listing their fixture models in
+            module.FIXTURES, ex: app.config['SQLAFIXTURES_MODULES'].
+
+    Notes:
+        Created by SQLAFixtures.init_app. The modules are imported on first use, not
+        at init_app, since they usually import the app extensions themselves. Models
+        are kept in the order of the modules and of their FIXTURES lists.
+    """
+
+    def __init__(self, modules):
+        self.modules = list(modules)
+        self._lock = threading.Lock()
+        self._models = None
+        self._by_table = None
+        self._by_module = None
+
+    def _load(self):
+        if self._models is not None:
+            return
+        with self._lock:
+            if self._models is not None:
+                return
+            models = {}
+            by_table = {}
+            by_module = {}
+            for module_name in self.modules:
+                module = importlib.import_module(module_name)
+                by_module[module_name] = []
+                for model_name in getattr(module, 'FIXTURES'):
+                    if model_name in models:
+                        message = "Model '{name}' is defined as a fixture twice.".format(
+                            name=model_name)
+                        raise ModelNameError(message)
+                    model = getattr(module, model_name)
+                    models[model_name] = model
+                    by_table[model.__table__.name] = model
+                    by_module[module_name].append(model)
+            self._by_table = by_table
+            self._by_module = by_module
+            self._models = models
+
+    @property
+    def models(self):
+        """{model name: model} of every fixture model."""
+
+        self._load()
+        return self._models
+
+    def get_models(self, model_names=[], excludes=[]):
+        """Return the fixture models named in model_names, all if empty, less excludes.
+
+        Raises:
+            ModelNameError: for a name of model_names that is not a fixture model.
+        """
+
+        models = self.models
+        for name in model_names:
+            if name not in models and name not in excludes:
+                message = "Model '{name}' is not defined as a fixture.".format(name=name)
+                raise ModelNameError(message)
+        selected = set(model_names)
+        excluded = set(excludes)
+        return [model for name, model in models.items()
+                if (not selected or name in selected) and name not in excluded]
+
+    def get_model(self, model_name):
+        """Return the fixture model named model_name."""
+
+        return self.get_models([model_name])[0]
+
+    def get_model_by_table(self, table_name):
+        """Return the fixture model of the table named table_name, or None."""
+
+        self._load()
+        return self._by_table.get(table_name)
+
+    @contextmanager
+    def temporary_models(self, models):
+        """Add models to the fixture models while the block runs.
+
+        Parameters:
+            models (dict): {model name: model} of models outside the configured
+                modules, ex: the model of the benchmark table, see bench_fixtures.
+
+        Raises:
+            ModelNameError: for a name or a table of models that is already a fixture.
+
+        Notes:
+            The indexes are replaced, not changed in place, and the previous ones are
+            put back when the block exits, also on error.
+        """
+
+        self._load()
+        with self._lock:
+            saved = self._models, self._by_table
+            for name, model in models.items():
+                if name in saved[0] or model.__table__.name in saved[1]:
+                    message = "Model '{name}' is defined as a fixture twice.".format(
+                        name=name)
+                    raise ModelNameError(message)
+            self._models = dict(saved[0], **models)
+            self._by_table = dict(saved[1], **{model.__table__.name: model
+                                               for model in models.values()})
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._models, self._by_table = saved
+
+    def get_module_models(self, module_name):
+        """Return the fixture models of a configured module."""
+
+        self._load()
+        return list(self._by_module[module_name])
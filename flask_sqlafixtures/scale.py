@@ -0,0 +1,363 @@
+"""Synthetic load-test fixtures, scaled up from the fixtures of the models.
+
+Each table is scaled to factor copies of the records of its fixture. Copy 0 holds the
+records as they are, copy k the same records with their keys moved out of the way:
+
+- an integer primary or unique key column is offset by k times the span of its values,
+  so the keys of copy k are the keys of copy 0 shifted past those of copy k - 1.
+- a string primary or unique key column gets the suffix '-k'.
+- a foreign key column to a scaled table gets the change of the column it references,
+  so the rows of copy k reference the rows of copy k of their parents. Foreign keys to
+  tables that are not scaled keep their values.
+- the other columns, dates included, keep the values of the record copied, so the
+  distribution of each column and the order of the dates of a row are unchanged.
+
+Each batch is built in numpy columns of batch_size values, allocated once per table:
+the values of its rows are taken from the columns of the fixture into them and their
+keys changed in place. Batches are written as they are built, so memory use is bounded
+by the source fixtures and one batch. numpy is imported when scaling, not with the
+module.
+"""
+import os
+import time
+import click
+from flask import current_app
+from sqlalchemy import UniqueConstraint
+from flask_sqlafixtures import db_utils, formats, manifest, metrics
+
+OFFSET = 'offset'
+SUFFIX = 'suffix'
+
+
+class ScaleError(ValueError):
+    """Exception raised when fixtures can not be scaled."""
+
+    def __init__(self, message):
+        super(ScaleError, self).__init__(message)
+        self.message = message
+
+
+class TableScaler(object):
+    """Scaled copies of the records of the fixture of a table.
+
+    Parameters:
+        table (sqlalchemy Table): the table of the fixture.
+        records (list of dict): records as read from the fixture.
+
+    Attributes:
+        columns (list of str): names of the columns found in the records.
+        count (int): number of records of one copy.
+        plans (dict): {column name: (OFFSET, step) or (SUFFIX, None)} of the key
+            columns changed in each copy, see plan_keys.
+        references (dict): {column name: (TableScaler, column name)} of the foreign
+            key columns to scaled tables, see plan_references.
+    """
+
+    def __init__(self, table, records):
+        import numpy as np
+
+        self.table = table
+        self.columns = [col.name for col in table.columns
+                        if any(col.name in record for record in records)]
+        self.count = len(records)
+        self.values = {}
+        for name in self.columns:
+            values = np.empty(self.count, dtype=object)
+            for index, record in enumerate(records):
+                values[index] = record.get(name)
+            self.values[name] = values
+        self.plans = {}
+        self.references = {}
+
+    def plan_keys(self):
+        """Plan the change of each primary or unique key column of the table.
+
+        Notes:
+            Integer and string columns are changed. Foreign key columns follow the
+            columns they reference instead, see plan_references.
+        """
+
+        for key in get_unique_keys(self.table):
+            for col in key:
+                if col.name in self.columns and not col.foreign_keys:
+                    plan = self._plan_column(col)
+                    if plan is not None:
+                        self.plans[col.name] = plan
+
+    def plan_references(self, scalers):
+        """Plan the foreign key columns to the tables of scalers, {table: TableScaler}."""
+
+        for col in self.table.columns:
+            if col.name not in self.columns:
+                continue
+            for fk in col.foreign_keys:
+                if fk.column.table in scalers:
+                    self.references[col.name] = (scalers[fk.column.table], fk.column.name)
+                    break
+
+    def check_keys(self):
+        """Raise ScaleError for a unique key none of whose columns change in each copy."""
+
+        for key in get_unique_keys(self.table):
+            if not self.count or any(self.get_plan(col.name) for col in key):
+                continue
+            message = "Unique key ({columns}) of '{table}' can not be kept unique.".format(
+                columns=', '.join(col.name for col in key), table=self.table.name)
+            raise ScaleError(message)
+
+    def get_plan(self, name):
+        """Return the change of column name in each copy, or None when unchanged."""
+
+        if name in self.references:
+            parent, parent_name = self.references[name]
+            return parent.plans.get(parent_name)
+        return self.plans.get(name)
+
+    def iter_batches(self, factor, batch_size=db_utils.DEFAULT_BATCH_SIZE):
+        """Yield lists of batch_size records of factor copies of the records.
+
+        Notes:
+            Records are numbered across the copies, record i being record i % count
+            of copy i // count, and cut in batches of batch_size, the last one
+            shorter. One array of batch_size values is allocated per column and
+            filled again for each batch, see scale_column.
+        """
+
+        import numpy as np
+
+        total = self.count * factor
+        if not total:
+            return
+        batch_size = min(batch_size, total)
+        columns = {name: np.empty(batch_size, dtype=object) for name in self.columns}
+        for start in range(0, total, batch_size):
+            copies, rows = np.divmod(np.arange(start, min(start + batch_size, total)),
+                                     self.count)
+            values = [self.scale_column(name, rows, copies, columns[name][:len(rows)])
+                      for name in self.columns]
+            yield [dict(zip(self.columns, row))
+                   for row in zip(*(column.tolist() for column in values))]
+
+    def scale_column(self, name, rows, copies, out):
+        """Put the values of column name of records rows of copies in out. Return out.
+
+        Parameters:
+            name (str): name of the column.
+            rows (numpy array of int): numbers of the records in the fixture.
+            copies (numpy array of int): numbers of the copies of each record, in
+                increasing order.
+            out (numpy array of object): array of len(rows) values the column is
+                written to.
+        """
+
+        import numpy as np
+
+        np.take(self.values[name], rows, out=out, mode='clip')
+        plan = self.get_plan(name)
+        if plan is None:
+            return out
+        notnull = np.not_equal(out, None)
+        kind, step = plan
+        if kind == OFFSET:
+            out[notnull] = out[notnull].astype(np.int64) + copies[notnull] * step
+        else:
+            first = copies[0]
+            suffixes = np.array(['-{}'.format(copy) if copy else ''
+                                 for copy in range(first, copies[-1] + 1)], dtype=object)
+            out[notnull] = (out[notnull].astype(str).astype(object)
+                            + suffixes[copies[notnull] - first])
+        return out
+
+    def _plan_column(self, col):
+        """Return the change of the key column col in each copy, None if unsupported."""
+
+        import numpy as np
+
+        try:
+            python_type = col.type.python_type
+        except NotImplementedError:
+            return None
+        if issubclass(python_type, str):
+            return SUFFIX, None
+        if not issubclass(python_type, int) or issubclass(python_type, bool):
+            return None
+        values = self.values[col.name]
+        keys = values[np.not_equal(values, None)].astype(np.int64)
+        step = int(keys.max() - keys.min() + 1) if len(keys) else 1
+        return OFFSET, step
+
+
+def get_unique_keys(table):
+    """Return the list of the columns of each unique key of table, primary key first."""
+
+    keys = []
+    if len(table.primary_key):
+        keys.append(list(table.primary_key))
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            keys.append(list(constraint.columns))
+    for index in table.indexes:
+        if index.unique:
+            keys.append(list(index.columns))
+    unique = []
+    for key in keys:
+        if key and key not in unique:
+            unique.append(key)
+    return unique
+
+
+def read_scalers(tables, directory, preferred=formats.DEFAULT_FORMAT):
+    """Return {table: TableScaler} of the tables with a fixture in directory, planned.
+
+    Parameters:
+        tables (list of sqlalchemy Table): tables in foreign key dependency order.
+        directory (str): the fixtures directory the records are read from.
+        preferred (str): name of the format checked first.
+    """
+
+    scalers = {}
+    for table in tables:
+        paths = formats.find_fixture_paths(directory, table.name, preferred)
+        if not all(os.path.isfile(path) for path in paths):
+            click.echo('No fixture for "{table}", not scaled.'.format(table=table.name))
+            continue
+        records = [record for path in paths for record in formats.read_fixture_records(path)]
+        scalers[table] = TableScaler(table, records)
+    for scaler in scalers.values():
+        scaler.plan_keys()
+    for scaler in scalers.values():
+        scaler.plan_references(scalers)
+    for scaler in scalers.values():
+        scaler.check_keys()
+    return scalers
+
+
+def scale_fixtures(model_names=[], excludes=[], factor=10, output_directory=None,
+                   to_db=False, batch_size=None, report=None):
+    """Scale the fixtures of models to factor times their records.
+
+    Parameters:
+        model_names (list of str): names of models to scale. If empty, scale all.
+        excludes (list of str): names of models to exclude.
+        factor (int): number of copies of the records of each fixture, 1 or more.
+        output_directory (str): directory the scaled fixtures are written to. If None,
+            'x<factor>' in the fixtures directory.
+        to_db (boolean): True - load the scaled records into the database instead of
+            writing fixtures.
+        batch_size (int): number of records built and written per batch. If None, use
+            app.config['SQLAFIXTURES_BATCH_SIZE'].
+        report (metrics.Report): report the rows of each table are collected in. If
+            None, a new one.
+
+    Returns:
+        report (metrics.Report): report.count is the number of records written.
+
+    Notes:
+        Fixtures are written in the format of app.config['SQLAFIXTURES_FORMAT'],
+        in shards when over app.config['SQLAFIXTURES_SHARD_ROWS'] or
+        ['SQLAFIXTURES_SHARD_BYTES'], with a manifest. Seed them by pointing
+        SQLAFIXTURES_DIRECTORY to the output directory.
+
+        Into the database, tables are loaded in foreign key dependency order in one
+        transaction. Existing rows with the same primary key are updated.
+    """
+
+    if factor < 1:
+        raise ScaleError('The scale factor must be 1 or more, found {}.'.format(factor))
+    db = current_app.extensions['sqlafixtures'].db
+    fixtures_directory = db_utils.get_fixtures_directory()
+    if batch_size is None:
+        batch_size = current_app.extensions['sqlafixtures'].batch_size
+    if report is None:
+        report = metrics.Report('scale_fixtures')
+    if output_directory is None:
+        output_directory = os.path.join(fixtures_directory, 'x{}'.format(factor))
+    if not to_db and os.path.realpath(output_directory) == os.path.realpath(
+            fixtures_directory):
+        raise ScaleError('The scaled fixtures can not replace the fixtures they are '
+                         'scaled from.')
+
+    models = db_utils.sort_models_by_dependency(
+        db_utils.get_fixture_models(model_names, excludes), db.metadata)
+    tables = [model.__table__ for model in models]
+    scalers = read_scalers(tables, fixtures_directory, db_utils.get_fixtures_format())
+    scalers = [scalers[table] for table in tables if table in scalers]
+
+    start = time.perf_counter()
+    with report.count_statements(db.engine):
+        try:
+            if to_db:
+                _load_scaled(db.engine, scalers, factor, batch_size, report)
+            else:
+                _write_scaled(output_directory, scalers, factor, batch_size, report)
+        finally:
+            report.elapsed = time.perf_counter() - start
+    report.count = sum(table_metrics.rows for table_metrics in report.tables)
+    click.echo('Scaled {count} tables x{factor}: {rows} records in {elapsed:.2f}s.'.format(
+        count=len(scalers), factor=factor, rows=report.count, elapsed=report.elapsed))
+    return report
+
+
+def _write_scaled(directory, scalers, factor, batch_size, report):
+    """Write the scaled fixtures of scalers in directory, with their manifest."""
+
+    format_name = db_utils.get_fixtures_format()
+    fixture_format = formats.get_format(format_name)
+    shard_rows, shard_bytes = db_utils.get_shard_limits()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    entries = {}
+    for scaler in scalers:
+        table = scaler.table
+        table_metrics = report.table(table.name)
+        click.echo('Scaling fixture for "{table}" to {rows} records.'.format(
+            table=table.name, rows=scaler.count * factor))
+        with table_metrics.collect():
+            records = (record for batch in scaler.iter_batches(factor, batch_size)
+                       for record in batch)
+            if shard_rows or shard_bytes:
+                paths, written = formats.write_fixture_shards(
+                    directory, table.name, fixture_format, scaler.columns, records,
+                    shard_rows, shard_bytes)
+            else:
+                # streamed to the file, a scaled fixture is not rendered in memory
+                paths = [os.path.join(directory, table.name + fixture_format.extension)]
+                with open(paths[0], 'w') as fp:
+                    fixture_format.write(fp, table.name, scaler.columns, records)
+            formats.remove_other_fixtures(directory, table.name, *paths)
+        table_metrics.rows = scaler.count * factor
+        table_metrics.bytes = sum(os.path.getsize(path) for path in paths)
+        table_metrics.status = 'created'
+        entries[table.name] = manifest.describe_fixture(
+            paths, table, format_name, table_metrics.rows)
+    levels = db_utils.group_tables_by_level([scaler.table for scaler in scalers])
+    manifest.save_manifest(directory, manifest.set_load_order(
+        {'tables': entries}, [[table.name for table in level] for level in levels]))
+
+
+def _load_scaled(engine, scalers, factor, batch_size, report):
+    """Load the scaled records of scalers into the database in one transaction."""
+
+    with engine.connect() as conn:
+        with db_utils.begin_transaction(conn):
+            for scaler in scalers:
+                table = scaler.table
+                click.echo('Loading {rows} scaled records into "{table}".'.format(
+                    table=table.name, rows=scaler.count * factor))
+                batches = db_utils.decode_batches(
+                    table, scaler.iter_batches(factor, batch_size))
+                report.table(table.name).load(db_utils.insert_batches, conn, table, batches)
+                report.table(table.name).status = 'loaded'
+
+
+def parse_factor(value):
+    """Return the scale factor of a string, ex: '100' or '100x'."""
+
+    try:
+        factor = int(value.lower().rstrip('x'))
+    except ValueError:
+        factor = 0
+    if factor < 1:
+        message = "Invalid factor '{}', expected a number of copies, ex: 100.".format(value)
+        raise ScaleError(message)
+    return factor
@@ -0,0 +1,153 @@
+import datetime as dt
+import hashlib
+import os
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select
+from sqlalchemy.schema import CreateTable
+from flask_sqlafixtures import formats
+
+STATE_TABLE_NAME = 'sqlafixtures_state'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# kept out of the application metadata so create_all / drop_all leave it alone
+metadata = MetaData()
+
+state_table = Table(
+    STATE_TABLE_NAME, metadata,
+    Column('table_name', String(255), primary_key=True),
+    Column('fixture_hash', String(64), nullable=False),
+    Column('schema_hash', String(64), nullable=False),
+    Column('row_count', Integer, nullable=False),
+    Column('seeded_at', DateTime, nullable=False),
+)
+
+
+class TableState(object):
+    """Hashes of the fixture file and the schema a table is seeded from.
+
+    Parameters:
+        fixture_hash (str): sha256 of the fixture file content.
+        schema_hash (str): sha256 of the CREATE TABLE statement of the table.
+    """
+
+    def __init__(self, fixture_hash, schema_hash):
+        self.fixture_hash = fixture_hash
+        self.schema_hash = schema_hash
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of the file at path."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_fixture(path):
+    """Return the sha256 hex digest of a fixture given as one path or a list of shards.
+
+    Notes:
+        The digest of a single file is its hash_file digest. For shards, it covers the
+        name and the content of each shard, in order.
+    """
+
+    paths = formats.get_paths(path)
+    if len(paths) == 1:
+        return hash_file(paths[0])
+    digest = hashlib.sha256()
+    for shard in paths:
+        digest.update(os.path.basename(shard).encode('utf-8'))
+        digest.update(hash_file(shard).encode('ascii'))
+    return digest.hexdigest()
+
+
+def hash_schema(table, dialect):
+    """Return the sha256 hex digest of the CREATE TABLE statement of table for dialect."""
+
+    ddl = str(CreateTable(table).compile(dialect=dialect))
+    return hashlib.sha256(ddl.encode('utf-8')).hexdigest()
+
+
+def get_table_states(dialect, paths, hashes={}):
+    """Return {table: TableState} for the tables whose fixture file exists.
+
+    Parameters:
+        dialect (sqlalchemy Dialect): dialect the tables are seeded with.
+        paths (dict): {table: path to its fixture file, or list of its shards}
+        hashes (dict): {table: hash_fixture of its fixture} already known, ex: from
+            the manifest. The other fixtures are hashed.
+    """
+
+    states = {}
+    for table, path in paths.items():
+        try:
+            fixture_hash = hashes.get(table) or hash_fixture(path)
+        except (IOError, OSError):
+            continue
+        states[table] = TableState(fixture_hash, hash_schema(table, dialect))
+    return states
+
+
+def find_unchanged_tables(conn, states):
+    """Return the tables whose fixture and schema are unchanged since they were seeded.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the seeded database.
+        states (dict): {table: TableState} of the fixtures about to be seeded.
+
+    Returns:
+        set of sqlalchemy Table
+
+    Notes:
+        A table is only unchanged when its row count still matches the count recorded
+        after the last load, so a table emptied or reset since is seeded again.
+    """
+
+    if not states or not state_table.exists(bind=conn):
+        return set()
+
+    names = [table.name for table in states]
+    rows = conn.execute(
+        select([state_table]).where(state_table.c.table_name.in_(names)))
+    recorded = {row['table_name']: row for row in rows}
+
+    unchanged = set()
+    for table, state in states.items():
+        row = recorded.get(table.name)
+        if row is None:
+            continue
+        if (row['fixture_hash'], row['schema_hash']) != (state.fixture_hash,
+                                                          state.schema_hash):
+            continue
+        if count_rows(conn, table) != row['row_count']:
+            continue
+        unchanged.add(table)
+    return unchanged
+
+
+def record_table_state(conn, table, state):
+    """Record the state of a table seeded on conn, in the same transaction.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection the table was seeded on.
+        table (sqlalchemy Table): the seeded table.
+        state (TableState): hashes of the fixture and schema it was seeded from.
+
+    Notes:
+        The state table is created by seed before the load transaction begins, as some
+        databases commit on DDL.
+    """
+
+    conn.execute(state_table.delete().where(state_table.c.table_name == table.name))
+    conn.execute(state_table.insert().values(
+        table_name=table.name,
+        fixture_hash=state.fixture_hash,
+        schema_hash=state.schema_hash,
+        row_count=count_rows(conn, table),
+        seeded_at=dt.datetime.utcnow(),
+    ))
+
+
+def count_rows(conn, table):
+    return conn.execute(select([func.count()]).select_from(table)).scalar()
@@ -0,0 +1,40 @@
+"""Signals sent while seeding and creating fixtures.
+
+Receivers are connected as for the signals of Flask, which need blinker::
+
+    from flask_sqlafixtures import signals
+
+    @signals.table_loaded.connect
+    def log_table(app, metrics):
+        app.logger.info('%s: %s rows', metrics.name, metrics.rows)
+
+The sender is the app, or None outside of an app context.
+
+seed_started: tables (list of str), mode (str)
+table_loaded: metrics (TableMetrics). Sent once the table is written, before the
+    transaction holding it is committed.
+table_skipped: metrics (TableMetrics) of a table unchanged since the last seed.
+seed_finished: report (Report)
+export_started: model_names (list of str), from_file (boolean)
+fixture_created: metrics (TableMetrics)
+export_finished: report (Report)
+"""
+from flask import current_app, has_app_context
+from flask.signals import Namespace
+
+_signals = Namespace()
+
+seed_started = _signals.signal('seed-started')
+table_loaded = _signals.signal('table-loaded')
+table_skipped = _signals.signal('table-skipped')
+seed_finished = _signals.signal('seed-finished')
+export_started = _signals.signal('export-started')
+fixture_created = _signals.signal('fixture-created')
+export_finished = _signals.signal('export-finished')
+
+
+def send(signal, **kwargs):
+    """Send signal from the current app, or from None outside of an app context."""
+
+    sender = current_app._get_current_object() if has_app_context() else None
+    signal.send(sender, **kwargs)
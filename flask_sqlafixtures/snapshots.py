@@ -0,0 +1,316 @@
+import glob
+import hashlib
+import os
+import sqlite3
+from flask import current_app
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import StaticPool
+from flask_sqlafixtures import db_utils, formats, manifest, seed_state
+
+SNAPSHOTS_DIRNAME = '.snapshots'
+TEMPLATE_PREFIX = 'template-'
+
+
+class SnapshotError(db_utils.Error):
+    """Exception raised when a template can not be built or cloned for a database."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def get_worker_id():
+    """Return the pytest-xdist worker id ('gw0', ...), or None outside of xdist."""
+
+    return os.environ.get('PYTEST_XDIST_WORKER')
+
+
+def get_worker_database_uri(uri, worker_id=None):
+    """Return the database uri of a pytest-xdist worker, so each worker has its own clone.
+
+    Parameters:
+        uri (str): database uri of the tests, ex: app.config['SQLALCHEMY_DATABASE_URI'].
+        worker_id (str): the worker id. If None, use get_worker_id().
+
+    Returns:
+        uri with the worker id appended to the SQLite file name or the database name.
+        In memory SQLite databases, and uris outside of xdist, are returned as is.
+    """
+
+    worker_id = worker_id or get_worker_id()
+    if not worker_id:
+        return uri
+    url = make_url(uri)
+    if not url.database or url.database == ':memory:':
+        return uri
+    if url.get_backend_name() == 'sqlite':
+        root, ext = os.path.splitext(url.database)
+        database = '{}_{}{}'.format(root, worker_id, ext)
+    else:
+        database = '{}_{}'.format(url.database, worker_id)
+    return str(_set_database(url, database))
+
+
+def _set_database(url, database):
+    if hasattr(url, 'set'):
+        return url.set(database=database)
+    url = make_url(str(url))
+    url.database = database
+    return url
+
+
+def get_snapshot_key(metadata, paths, dialect, hashes={}):
+    """Return the key of the template seeded from the fixtures at paths.
+
+    Parameters:
+        metadata (sqlalchemy MetaData): metadata of the database schema.
+        paths (dict): {table: path to its fixture file, or list of its shards}
+        dialect (sqlalchemy Dialect): dialect of the database.
+        hashes (dict): {table: hash_fixture of its fixture} already known, ex: from
+            the manifest. The other fixtures are hashed.
+
+    Notes:
+        The key covers the CREATE TABLE statement of every table of metadata and the
+        content of every fixture file, so a change to either builds a new template.
+    """
+
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(seed_state.hash_schema(table, dialect).encode('ascii'))
+    for table in sorted(paths, key=lambda table: table.name):
+        digest.update(table.name.encode('utf-8'))
+        try:
+            fixture_hash = hashes.get(table) or seed_state.hash_fixture(paths[table])
+            digest.update(fixture_hash.encode('ascii'))
+        except (IOError, OSError):
+            digest.update(b'missing')
+    return digest.hexdigest()
+
+
+def restore_snapshot(model_names=[], directory=None):
+    """Replace the contents of the app database with a seeded template.
+
+    Parameters:
+        model_names (list of str): names of the models seeded in the template. If
+            empty, all fixture models.
+        directory (str): directory the SQLite templates are kept in. Default is
+            '.snapshots' in the fixtures directory.
+
+    Returns:
+        key (str): key of the template, see get_snapshot_key.
+
+    Notes:
+        The template is built once per key: the schema is created with
+        metadata.create_all and the fixtures are seeded into it. Later calls only
+        clone it, which is much cheaper than create_all and seed.
+
+        SQLite - the template is built in memory and saved to a file with the backup
+        API. A clone is a backup of that file into the app database, in memory or not.
+
+        PostgreSQL - the template is a database named after the app database and the
+        key. A clone drops the app database and creates it again with
+        CREATE DATABASE ... TEMPLATE. The engine of the app is disposed first. The
+        templates of other keys are dropped when a new one is built.
+
+        Use get_worker_database_uri in the test configuration to give each pytest-xdist
+        worker its own database.
+    """
+
+    db = current_app.extensions['sqlafixtures'].db
+    engine = db.engine
+    fixtures_directory = db_utils.get_fixtures_directory()
+    tables = [mdl.__table__ for mdl in db_utils.sort_models_by_dependency(
+        db_utils.get_fixture_models(model_names), db.metadata)]
+    preferred = db_utils.get_fixtures_format()
+    paths = {table: formats.find_fixture_paths(fixtures_directory, table.name, preferred)
+             for table in tables}
+    planned = manifest.load_manifest(fixtures_directory)
+    hashes = {table: manifest.get_fixture_hash(
+        planned, fixtures_directory, table.name, paths[table]) for table in tables}
+    key = get_snapshot_key(db.metadata, paths, engine.dialect, hashes)
+    batch_size = current_app.extensions['sqlafixtures'].batch_size
+
+    dialect_name = engine.dialect.name
+    if dialect_name == 'sqlite':
+        if directory is None:
+            directory = os.path.join(fixtures_directory, SNAPSHOTS_DIRNAME)
+        template = get_sqlite_template(
+            directory, key, db.metadata, tables, paths, batch_size)
+        clone_sqlite_template(template, engine)
+    elif dialect_name == 'postgresql':
+        template = get_postgresql_template(
+            engine, key, db.metadata, tables, paths, batch_size)
+        clone_postgresql_template(engine, template)
+    else:
+        message = "Snapshots are not supported for '{}'.".format(dialect_name)
+        raise SnapshotError(message)
+    return key
+
+
+def get_sqlite_template(directory, key, metadata, tables, paths,
+                        batch_size=db_utils.DEFAULT_BATCH_SIZE):
+    """Return the path of the SQLite template for key, building it when missing.
+
+    Notes:
+        Templates of other keys in directory are removed. The template is written to a
+        temporary file and renamed, so concurrent pytest-xdist workers building the
+        same key never read a partial file.
+    """
+
+    path = os.path.join(directory, '{}{}.sqlite3'.format(TEMPLATE_PREFIX, key))
+    if os.path.isfile(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    try:
+        build_template(engine, metadata, tables, paths, batch_size)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        raw = engine.raw_connection()
+        try:
+            target = sqlite3.connect(tmp_path)
+            try:
+                raw.connection.backup(target)
+            finally:
+                target.close()
+        finally:
+            raw.close()
+    finally:
+        engine.dispose()
+    os.replace(tmp_path, path)
+
+    for stale in glob.glob(os.path.join(directory, TEMPLATE_PREFIX + '*.sqlite3')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:  # removed by another worker
+                pass
+    return path
+
+
+def clone_sqlite_template(path, engine):
+    """Replace the contents of the SQLite database of engine with the template at path."""
+
+    raw = engine.raw_connection()
+    try:
+        source = sqlite3.connect(path)
+        try:
+            source.backup(raw.connection)
+        finally:
+            source.close()
+    finally:
+        raw.close()
+
+
+def build_template(engine, metadata, tables, paths, batch_size=db_utils.DEFAULT_BATCH_SIZE):
+    """Create the schema of metadata on engine and seed the fixtures into it.
+
+    Notes:
+        The seed state of each table is recorded, so a seed run on a clone skips the
+        tables it already holds.
+    """
+
+    metadata.create_all(engine)
+    seed_state.state_table.create(engine, checkfirst=True)
+    tables = [table for table in tables
+              if all(os.path.isfile(path) for path in formats.get_paths(paths[table]))]
+    states = seed_state.get_table_states(engine.dialect, paths)
+    db_utils.seed_tables_by_level(engine, tables, paths, batch_size, 1, states)
+
+
+def get_postgresql_template(engine, key, metadata, tables, paths,
+                            batch_size=db_utils.DEFAULT_BATCH_SIZE):
+    """Return the name of the template database for key, creating it when missing.
+
+    Notes:
+        Once a new template is built, the templates of the app database for other keys
+        are dropped, see drop_postgresql_templates.
+    """
+
+    name = '{}_template_{}'.format(engine.url.database, key[:12])
+    admin = _get_admin_engine(engine)
+    try:
+        with admin.connect() as conn:
+            exists = conn.execute(
+                text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                name=name).scalar()
+            if exists:
+                return name
+            conn.execute('CREATE DATABASE "{}"'.format(name))
+        template_engine = create_engine(_set_database(engine.url, name))
+        try:
+            build_template(template_engine, metadata, tables, paths, batch_size)
+        except Exception:
+            template_engine.dispose()
+            with admin.connect() as conn:
+                conn.execute('DROP DATABASE "{}"'.format(name))
+            raise
+        template_engine.dispose()
+        with admin.connect() as conn:
+            drop_postgresql_templates(conn, engine.url.database, keep=name)
+    finally:
+        admin.dispose()
+    return name
+
+
+def list_postgresql_templates(conn, database):
+    """Return the names of the template databases of database, sorted.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the PostgreSQL server.
+        database (str): name of the app database, see get_postgresql_template.
+    """
+
+    prefix = '{}_template_'.format(database)
+    rows = conn.execute(
+        text('SELECT datname FROM pg_database WHERE left(datname, :length) = :prefix'),
+        length=len(prefix), prefix=prefix)
+    return sorted(row[0] for row in rows)
+
+
+def drop_postgresql_templates(conn, database, keep=None):
+    """Drop the template databases of database other than keep. Return their names.
+
+    Parameters:
+        conn (sqlalchemy Connection): autocommit connection to the PostgreSQL server.
+        database (str): name of the app database, see get_postgresql_template.
+        keep (str): name of the template to keep.
+
+    Notes:
+        A template another session is connected to, ex: while it is cloned, can not
+        be dropped. It is left for the next call.
+    """
+
+    dropped = []
+    for name in list_postgresql_templates(conn, database):
+        if name == keep:
+            continue
+        try:
+            conn.execute('DROP DATABASE IF EXISTS "{}"'.format(name))
+        except DBAPIError:
+            continue
+        dropped.append(name)
+    return dropped
+
+
+def clone_postgresql_template(engine, template):
+    """Recreate the database of engine from the template database."""
+
+    engine.dispose()
+    admin = _get_admin_engine(engine)
+    try:
+        with admin.connect() as conn:
+            conn.execute('DROP DATABASE IF EXISTS "{}"'.format(engine.url.database))
+            conn.execute('CREATE DATABASE "{}" TEMPLATE "{}"'.format(
+                engine.url.database, template))
+    finally:
+        admin.dispose()
+
+
+def _get_admin_engine(engine):
+    """Return an autocommit engine on the 'postgres' maintenance database."""
+
+    return create_engine(_set_database(engine.url, 'postgres'),
+                         isolation_level='AUTOCOMMIT')
@@ -0,0 +1,310 @@
+"""Referentially complete subsets of a database, exported by create_fixtures_from_db.
+
+The rows of root tables are selected with a where clause, a sample, or both. The
+subset is then closed over the foreign keys between the exported tables:
+
+1. children - rows referencing rows of the subset are added, from the roots down, so
+   an order comes with its lines and the lines with their details.
+2. parents - rows referenced by rows of the subset are added, from every row up, so
+   a line comes with its product and the product with its supplier.
+
+Parents pulled in by the second step are not followed down again, which would pull in
+most of the database. Every step selects the keys found by the step before with
+batched IN queries, sized to the bind parameter limit of the dialect, and root rows
+are read with keyset pagination, so no query scans a table once per row.
+"""
+import random
+from sqlalchemy import and_, select, text, tuple_
+from flask_sqlafixtures import diff
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class SubsetError(ValueError):
+    """Exception raised when a subset can not be selected."""
+
+    def __init__(self, message):
+        super(SubsetError, self).__init__(message)
+        self.message = message
+
+
+class Subset(object):
+    """Primary keys of the rows of each table of a subset.
+
+    Parameters:
+        tables (list of sqlalchemy Table): the exported tables. Foreign keys to other
+            tables are not followed.
+
+    Attributes:
+        keys (dict): {table: set of primary key tuples}
+    """
+
+    def __init__(self, tables):
+        self.keys = {table: set() for table in tables}
+
+    def add(self, table, keys):
+        """Add keys to the keys of table. Return the list of those not known before."""
+
+        known = self.keys[table]
+        added = []
+        for key in keys:
+            if key not in known:
+                known.add(key)
+                added.append(key)
+        return added
+
+    def get_keys(self, table):
+        """Return the sorted primary keys of table."""
+
+        return sorted(self.keys[table])
+
+
+def find_subset(conn, tables, where={}, sample={}, batch_size=DEFAULT_BATCH_SIZE, seed=0):
+    """Return the Subset selected from the roots and closed over the foreign keys.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the exported database.
+        tables (list of sqlalchemy Table): the exported tables.
+        where (dict): {table: SQL condition} selecting the root rows of table.
+        sample (dict): {table: sample} of the root rows of table, see sample_keys.
+            With a where clause, the rows are sampled among the rows matching it.
+        batch_size (int): number of keys read per keyset query.
+        seed (int): seed of the random sample, the same seed gives the same rows.
+    """
+
+    subset = Subset(tables)
+    for table in list(where) + list(sample):
+        if table not in subset.keys:
+            message = "Table '{}' is not exported.".format(table.name)
+            raise SubsetError(message)
+        _get_pk_cols(table)  # raises for a root without a primary key
+
+    found = {}
+    for table in tables:
+        if table in where or table in sample:
+            keys = iter_keys(conn, table, where.get(table), batch_size)
+            if table in sample:
+                keys = sample_keys(keys, sample[table], seed)
+            found[table] = subset.add(table, keys)
+
+    # children, from the roots down
+    while found:
+        referencing = {}
+        for parent, keys in found.items():
+            for child, constraint in _get_referencing(parent, subset.keys):
+                added = subset.add(child, select_referencing_keys(
+                    conn, child, constraint, keys))
+                referencing.setdefault(child, []).extend(added)
+        found = {table: keys for table, keys in referencing.items() if keys}
+
+    # parents, from every row up
+    found = {table: list(keys) for table, keys in subset.keys.items() if keys}
+    while found:
+        referenced = {}
+        for child, keys in found.items():
+            for constraint in child.foreign_key_constraints:
+                parent = constraint.referred_table
+                if parent not in subset.keys:
+                    continue
+                added = subset.add(parent, select_referenced_keys(
+                    conn, child, constraint, keys))
+                referenced.setdefault(parent, []).extend(added)
+        found = {table: keys for table, keys in referenced.items() if keys}
+    return subset
+
+
+def iter_keys(conn, table, where=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the primary keys of the rows of table matching where, in key order.
+
+    Notes:
+        Keys are read with keyset pagination: each query selects the next batch_size
+        keys after the last key read, so no cursor stays open on the server and no
+        query skips over rows with OFFSET.
+    """
+
+    pk_cols = _get_pk_cols(table)
+    last = None
+    while True:
+        conditions = []
+        if where:
+            conditions.append(text('({})'.format(where)))
+        if last is not None:
+            conditions.append(_after_key(pk_cols, last))
+        query = select(pk_cols).order_by(*pk_cols).limit(batch_size)
+        if conditions:
+            query = query.where(and_(*conditions))
+        rows = conn.execute(query).fetchall()
+        for row in rows:
+            yield tuple(row)
+        if len(rows) < batch_size:
+            return
+        last = tuple(rows[-1])
+
+
+def sample_keys(keys, sample, seed=0):
+    """Return a sorted random sample of keys.
+
+    Parameters:
+        keys (iterable of tuple): primary keys.
+        sample (int or float): an int is the number of keys kept, a float the fraction
+            of the keys kept.
+        seed (int): seed of the sample.
+
+    Notes:
+        Keys are read once. A fraction keeps each key with that probability, a number
+        keeps a reservoir of that many keys.
+    """
+
+    rng = random.Random(seed)
+    if isinstance(sample, float):
+        return sorted(key for key in keys if rng.random() < sample)
+    reservoir = []
+    for index, key in enumerate(keys):
+        if index < sample:
+            reservoir.append(key)
+            continue
+        position = rng.randrange(index + 1)
+        if position < sample:
+            reservoir[position] = key
+    return sorted(reservoir)
+
+
+def select_referencing_keys(conn, child, constraint, keys):
+    """Return the primary keys of the rows of child referencing rows with keys.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the exported database.
+        child (sqlalchemy Table): the referencing table.
+        constraint (sqlalchemy ForeignKeyConstraint): foreign key of child.
+        keys (list of tuple): primary keys of rows of the referred table.
+    """
+
+    referred = _get_referred_values(conn, constraint, keys)
+    columns = [element.parent for element in constraint.elements]
+    return _select_keys(conn, child, columns, referred)
+
+
+def select_referenced_keys(conn, child, constraint, keys):
+    """Return the primary keys of the rows referenced by the rows of child with keys.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the exported database.
+        child (sqlalchemy Table): the referencing table.
+        constraint (sqlalchemy ForeignKeyConstraint): foreign key of child.
+        keys (list of tuple): primary keys of rows of child.
+
+    Notes:
+        Rows whose foreign key holds a null are left out, they reference no row.
+    """
+
+    columns = [element.parent for element in constraint.elements]
+    values = set()
+    for rows in _select_in(conn, child, columns, _get_pk_cols(child), keys):
+        values.update(tuple(row) for row in rows if None not in tuple(row))
+    parent = constraint.referred_table
+    referred_cols = [element.column for element in constraint.elements]
+    if _same_columns(referred_cols, _get_pk_cols(parent)):
+        return sorted(values)
+    return _select_keys(conn, parent, referred_cols, sorted(values))
+
+
+def select_rows(conn, table, keys):
+    """Yield lists of the rows of table with keys, in key order.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection to the exported database.
+        table (sqlalchemy Table): the exported table.
+        keys (list of tuple): sorted primary keys.
+    """
+
+    pk_cols = _get_pk_cols(table)
+    for rows in _select_in(conn, table, list(table.columns), pk_cols, keys, pk_cols):
+        yield rows
+
+
+def _get_referred_values(conn, constraint, keys):
+    """Return the values of the referred columns of constraint in the rows with keys."""
+
+    parent = constraint.referred_table
+    pk_cols = _get_pk_cols(parent)
+    referred_cols = [element.column for element in constraint.elements]
+    if _same_columns(referred_cols, pk_cols):
+        return keys
+    values = set()
+    for rows in _select_in(conn, parent, referred_cols, pk_cols, keys):
+        values.update(tuple(row) for row in rows if None not in tuple(row))
+    return sorted(values)
+
+
+def _select_keys(conn, table, columns, values):
+    """Return the primary keys of the rows of table whose columns values are in values."""
+
+    keys = []
+    for rows in _select_in(conn, table, _get_pk_cols(table), columns, values):
+        keys.extend(tuple(row) for row in rows)
+    return keys
+
+
+def _select_in(conn, table, selected, columns, values, order_by=()):
+    """Yield the rows of selected columns whose columns values are in values, by chunk."""
+
+    for chunk in diff.chunk_keys(conn, columns, values):
+        query = select(selected).where(diff.where_keys(columns, chunk))
+        if order_by:
+            query = query.order_by(*order_by)
+        yield conn.execute(query).fetchall()
+
+
+def _get_referencing(parent, tables):
+    """Yield (table, foreign key constraint) of tables referencing parent."""
+
+    for table in tables:
+        for constraint in table.foreign_key_constraints:
+            if constraint.referred_table is parent:
+                yield table, constraint
+
+
+def _get_pk_cols(table):
+    pk_cols = list(table.primary_key)
+    if not pk_cols:
+        message = "Table '{}' has no primary key to select a subset.".format(table.name)
+        raise SubsetError(message)
+    return pk_cols
+
+
+def _same_columns(columns, others):
+    return len(columns) == len(others) and all(
+        column is other for column, other in zip(columns, others))
+
+
+def _after_key(pk_cols, key):
+    if len(pk_cols) == 1:
+        return pk_cols[0] > key[0]
+    return tuple_(*pk_cols) > tuple_(*key)
+
+
+def parse_model_options(values):
+    """Return {model name: value} of options given as 'Model:value', ex: 'Order:id > 10'."""
+
+    options = {}
+    for value in values:
+        name, separator, option = value.partition(':')
+        if not separator or not name.strip() or not option.strip():
+            message = "Expected 'Model:value', found '{}'.".format(value)
+            raise SubsetError(message)
+        options[name.strip()] = option.strip()
+    return options
+
+
+def parse_sample(value):
+    """Return the sample of a string: a number of rows, ex: '100', or a fraction, '0.01'."""
+
+    try:
+        sample = float(value) if '.' in value else int(value)
+    except ValueError:
+        sample = None
+    if sample is None or sample <= 0 or (isinstance(sample, float) and sample > 1):
+        message = "Invalid sample '{}', expected a number of rows or a fraction.".format(
+            value)
+        raise SubsetError(message)
+    return sample
@@ -0,0 +1,241 @@
+import base64
+import datetime as dt
+import decimal
+import enum
+import uuid
+from sqlalchemy import types
+from sqlalchemy.dialects import postgresql
+
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# sqlalchemy type class -> Codec, or None for types json handles natively
+CODECS = {}
+
+_table_codecs = {}
+
+
+class Codec(object):
+    """Functions converting a column value to and from its json value.
+
+    Parameters:
+        encode (function): encode(value, type_) returning a json serializable value.
+        decode (function): decode(data, type_) returning the value bound to the column.
+
+    Notes:
+        Neither function is called for None.
+    """
+
+    def __init__(self, encode, decode):
+        self.encode = encode
+        self.decode = decode
+
+
+class TableCodec(object):
+    """Encoders and decoders compiled for the columns of one table.
+
+    Only the columns with a codec are listed, so tables of native json types cost
+    nothing to encode or decode.
+    """
+
+    def __init__(self, table):
+        self.encoders = []
+        self.decoders = []
+        for col in table.columns:
+            codec = get_codec(col.type)
+            if codec is None:
+                continue
+            self.encoders.append((col.name, _bind(codec.encode, col.type)))
+            self.decoders.append((col.name, _bind(codec.decode, col.type)))
+
+    def encode(self, record):
+        """Encode a record in place and return it."""
+
+        for name, encoder in self.encoders:
+            value = record[name]
+            if value is not None:
+                record[name] = encoder(value)
+        return record
+
+    def decode_records(self, records):
+        """Decode a list of records in place and return it."""
+
+        for name, decoder in self.decoders:
+            for record in records:
+                value = record.get(name)
+                if value is not None:
+                    record[name] = decoder(value)
+        return records
+
+
+def _bind(function, type_):
+    """Return function with its type_ argument bound, skipping types that ignore it."""
+
+    if getattr(function, 'ignores_type', False):
+        return function
+    return lambda value: function(value, type_)
+
+
+def ignores_type(function):
+    """Mark a codec function as taking only the value, to save a call per value."""
+
+    function.ignores_type = True
+    return function
+
+
+def register_codec(type_class, encode=None, decode=None):
+    """Register the codec used for columns of type_class and its subclasses.
+
+    Parameters:
+        type_class (sqlalchemy type class): ex: sqlalchemy.Numeric
+        encode (function): encode(value, type_) returning a json serializable value.
+        decode (function): decode(data, type_) returning the value bound to the column.
+            Without encode and decode, values of type_class are left as they are.
+    """
+
+    if encode is None and decode is None:
+        CODECS[type_class] = None
+    else:
+        CODECS[type_class] = Codec(encode or _identity, decode or _identity)
+    _table_codecs.clear()
+
+
+def get_codec(type_):
+    """Return the Codec for a sqlalchemy type instance, or None."""
+
+    for cls in type(type_).__mro__:
+        if cls in CODECS:
+            return CODECS[cls]
+    return None
+
+
+def get_table_codec(table):
+    """Return the TableCodec for a table. The codec is compiled once per table."""
+
+    codec = _table_codecs.get(table)
+    if codec is None:
+        codec = _table_codecs[table] = TableCodec(table)
+    return codec
+
+
+@ignores_type
+def _identity(value):
+    return value
+
+
+@ignores_type
+def convert_str_to_date(data):
+    """Return dt.date parsed from an iso formatted string, or None."""
+
+    try:
+        return dt.date.fromisoformat(data)
+    except (ValueError, TypeError):
+        return _strptime(data, DATE_FORMAT, dt.date)
+
+
+@ignores_type
+def convert_str_to_datetime(data):
+    """Return dt.datetime parsed from an iso formatted string, or None."""
+
+    try:
+        return dt.datetime.fromisoformat(data)
+    except (ValueError, TypeError):
+        return _strptime(data, DATETIME_FORMAT, dt.datetime)
+
+
+def _strptime(data, date_format, col_type):
+    try:
+        data = dt.datetime.strptime(data, date_format)
+    except (ValueError, TypeError):  # ValueError for None, TypeError for not matching format
+        return None
+    if col_type == dt.date:
+        data = data.date()
+    return data
+
+
+@ignores_type
+def encode_isoformat(value):
+    return value.isoformat()
+
+
+@ignores_type
+def encode_datetime(value):
+    # microseconds and utc offset are only written when set, so plain values keep
+    # DATETIME_FORMAT
+    return value.isoformat(sep=' ')
+
+
+@ignores_type
+def decode_time(data):
+    return dt.time.fromisoformat(data)
+
+
+@ignores_type
+def encode_interval(value):
+    return value.total_seconds()
+
+
+@ignores_type
+def decode_interval(data):
+    return dt.timedelta(seconds=data)
+
+
+@ignores_type
+def encode_numeric(value):
+    # str keeps the exact Decimal, a json number would be read back as float
+    return str(value)
+
+
+def decode_numeric(data, type_):
+    if type_.asdecimal:
+        return decimal.Decimal(data if isinstance(data, str) else repr(data))
+    return float(data)
+
+
+@ignores_type
+def encode_uuid(value):
+    return str(value)
+
+
+def decode_uuid(data, type_):
+    if getattr(type_, 'as_uuid', True):
+        return uuid.UUID(data)
+    return data
+
+
+@ignores_type
+def encode_enum(value):
+    # sqlalchemy persists the member name of python enums
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def decode_enum(data, type_):
+    if type_.enum_class is not None and data in type_.enum_class.__members__:
+        return type_.enum_class[data]
+    return data
+
+
+@ignores_type
+def encode_binary(value):
+    return base64.b64encode(value).decode('ascii')
+
+
+@ignores_type
+def decode_binary(data):
+    return base64.b64decode(data)
+
+
+register_codec(types.Date, encode_isoformat, convert_str_to_date)
+register_codec(types.DateTime, encode_datetime, convert_str_to_datetime)
+register_codec(types.Time, encode_isoformat, decode_time)
+register_codec(types.Interval, encode_interval, decode_interval)
+register_codec(types.Numeric, encode_numeric, decode_numeric)
+register_codec(types.Float)
+register_codec(types.Enum, encode_enum, decode_enum)
+register_codec(types.JSON)
+register_codec(types.LargeBinary, encode_binary, decode_binary)
+register_codec(postgresql.UUID, encode_uuid, decode_uuid)
+if hasattr(types, 'Uuid'):
+    register_codec(types.Uuid, encode_uuid, decode_uuid)
@@ -0,0 +1,251 @@
+import sqlite3
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Insert
+
+DEFAULT_MAX_BIND_PARAMS = 999
+MAX_BIND_PARAMS = {
+    'sqlite': 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999,
+    'postgresql': 32767,
+    'mysql': 65535,
+}
+
+# INSERT ... ON CONFLICT DO UPDATE was added in SQLite 3.24
+SQLITE_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+MAX_CACHED_STATEMENTS = 64
+
+UPSERT_BUILDERS = {}
+
+# statements are built once per (table, dialect, columns, rows) and compiled once
+# through the connection compiled_cache. upsert only uses a few row counts per
+# table and columns, see get_statement_rows.
+_statements = {}
+_compiled_cache = {}
+# bind parameter names per (columns, rows), in the order of the row values
+_bind_names = {}
+
+
+class SQLiteUpsert(Insert):
+    """INSERT ... ON CONFLICT DO UPDATE for SQLite."""
+
+    inherit_cache = True
+
+    def __init__(self, table, conflict_target=(), update_columns=(), **kw):
+        super(SQLiteUpsert, self).__init__(table, **kw)
+        self.conflict_target = conflict_target
+        self.update_columns = update_columns
+
+
+@compiles(SQLiteUpsert, 'sqlite')
+def compile_sqlite_upsert(insert, compiler, **kw):
+    statement = compiler.visit_insert(insert, **kw)
+    quote = compiler.preparer.quote
+    target = ', '.join(quote(name) for name in insert.conflict_target)
+    if not insert.update_columns:
+        return '{} ON CONFLICT ({}) DO NOTHING'.format(statement, target)
+    updates = ', '.join('{0} = excluded.{0}'.format(quote(name))
+                        for name in insert.update_columns)
+    return '{} ON CONFLICT ({}) DO UPDATE SET {}'.format(statement, target, updates)
+
+
+def register_upsert(dialect_name, builder):
+    """Register an upsert statement builder for a dialect.
+
+    Parameters:
+        dialect_name (str): name of the sqlalchemy dialect, ex: 'sqlite'.
+        builder (function): builder(table, values, update_columns) returning the
+            statement. values is a list of dict of bind parameters, one per row.
+            update_columns is a list of non primary key column names.
+    """
+
+    UPSERT_BUILDERS[dialect_name] = builder
+    for key in [key for key in _statements if key[1] == dialect_name]:
+        del _statements[key]
+
+
+def build_sqlite_upsert(table, values, update_columns):
+    conflict_target = [col.name for col in table.primary_key]
+    return SQLiteUpsert(table, conflict_target, update_columns).values(values)
+
+
+def build_postgresql_upsert(table, values, update_columns):
+    statement = postgresql.insert(table).values(values)
+    index_elements = [col.name for col in table.primary_key]
+    if not update_columns:
+        return statement.on_conflict_do_nothing(index_elements=index_elements)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: statement.excluded[name] for name in update_columns})
+
+
+def build_mysql_upsert(table, values, update_columns):
+    statement = mysql.insert(table).values(values)
+    # updating a primary key column to itself is mysql's no-op on duplicate
+    names = update_columns or [col.name for col in table.primary_key]
+    return statement.on_duplicate_key_update(
+        [(name, statement.inserted[name]) for name in names])
+
+
+if SQLITE_UPSERT:
+    register_upsert('sqlite', build_sqlite_upsert)
+register_upsert('postgresql', build_postgresql_upsert)
+register_upsert('mysql', build_mysql_upsert)
+
+
+def get_max_bind_params(dialect):
+    """Return the maximum number of bind parameters per statement for dialect."""
+
+    return MAX_BIND_PARAMS.get(dialect.name, DEFAULT_MAX_BIND_PARAMS)
+
+
+def get_statement_rows(count, rows_per_statement):
+    """Return the number of rows of each statement upserting count records.
+
+    Notes:
+        Statements of rows_per_statement rows, then the rest in powers of two, largest
+        first. So at most one statement per power of two below rows_per_statement is
+        built and cached for a table, whatever the sizes of the batches upserted, ex:
+        for 13 records and 8 rows per statement, [8, 4, 1].
+    """
+
+    rows = [rows_per_statement] * (count // rows_per_statement)
+    rest = count % rows_per_statement
+    while rest:
+        size = 1 << (rest.bit_length() - 1)
+        rows.append(size)
+        rest -= size
+    return rows
+
+
+def get_bind_names(column_count, rows):
+    """Return the bind parameter names of a statement, row by row then column by column.
+
+    Notes:
+        The names match the statements of get_upsert_statement, ex: for 2 columns
+        and 2 rows, ['p0_0', 'p0_1', 'p1_0', 'p1_1']. They are built once per shape.
+    """
+
+    key = (column_count, rows)
+    names = _bind_names.get(key)
+    if names is None:
+        names = ['p{}_{}'.format(row, index)
+                 for row in range(rows) for index in range(column_count)]
+        if len(_bind_names) >= MAX_CACHED_STATEMENTS:
+            _bind_names.clear()
+        _bind_names[key] = names
+    return names
+
+
+def get_upsert_statement(table, dialect, columns, rows):
+    """Return a multi-row upsert statement for table.
+
+    Parameters:
+        table (sqlalchemy Table): the table to insert into.
+        dialect (sqlalchemy Dialect): the dialect of the connection.
+        columns (tuple of str): names of the columns being inserted.
+        rows (int): number of rows in the VALUES clause.
+
+    Returns:
+        statement with bind parameters named 'p<row>_<column index>'.
+
+    Notes:
+        Tables without a primary key, or dialects without a registered builder,
+        get a plain multi-row INSERT.
+    """
+
+    key = (table, dialect.name, columns, rows)
+    statement = _statements.get(key)
+    if statement is not None:
+        return statement
+
+    types = [table.columns[name].type for name in columns]
+    names = iter(get_bind_names(len(columns), rows))
+    values = [
+        {name: bindparam(next(names), type_=types[index])
+         for index, name in enumerate(columns)}
+        for row in range(rows)
+    ]
+    builder = UPSERT_BUILDERS.get(dialect.name)
+    if builder is None or not len(table.primary_key):
+        statement = table.insert().values(values)
+    else:
+        pk_names = set(col.name for col in table.primary_key)
+        update_columns = [name for name in columns if name not in pk_names]
+        statement = builder(table, values, update_columns)
+    if len(_statements) >= MAX_CACHED_STATEMENTS:
+        _statements.clear()
+        _compiled_cache.clear()
+    _statements[key] = statement
+    return statement
+
+
+def upsert(conn, table, records):
+    """Insert or update records in table using multi-row statements.
+
+    Parameters:
+        conn (sqlalchemy Connection): connection used for the statements.
+        table (sqlalchemy Table): the table to upsert into.
+        records (list of dict): records to upsert. All records have the same keys.
+
+    Returns:
+        statements (int): number of statements executed.
+
+    Notes:
+        On SQLite before 3.24, without ON CONFLICT DO UPDATE, records are upserted one
+        row at a time, see upsert_rows.
+    """
+
+    if not records:
+        return 0
+    if (conn.dialect.name == 'sqlite' and 'sqlite' not in UPSERT_BUILDERS
+            and len(table.primary_key)):
+        return upsert_rows(conn, table, records)
+    columns = tuple(records[0])
+    rows_per_statement = max(1, get_max_bind_params(conn.dialect) // len(columns))
+    conn = conn.execution_options(compiled_cache=_compiled_cache)
+
+    start = 0
+    statement_rows = get_statement_rows(len(records), rows_per_statement)
+    for rows in statement_rows:
+        chunk = records[start:start + rows]
+        start += rows
+        statement = get_upsert_statement(table, conn.dialect, columns, rows)
+        params = dict(zip(get_bind_names(len(columns), rows),
+                          (record[name] for record in chunk for name in columns)))
+        conn.execute(statement, params)
+    return len(statement_rows)
+
+
+def upsert_rows(conn, table, records):
+    """Upsert records one row at a time, with an UPDATE then an INSERT OR IGNORE.
+
+    Parameters:
+        conn (sqlalchemy Connection): SQLite connection used for the statements.
+        table (sqlalchemy Table): the table to upsert into, with a primary key.
+        records (list of dict): records to upsert. All records have the same keys.
+
+    Returns:
+        statements (int): number of statements executed, each run for every record.
+
+    Notes:
+        Rows are updated in place, not deleted and inserted again like INSERT OR
+        REPLACE would, so rows referencing them are kept.
+    """
+
+    columns = list(records[0])
+    pk_names = [col.name for col in table.primary_key]
+    update_columns = [name for name in columns if name not in pk_names]
+    statements = 0
+    if update_columns:
+        statement = table.update().where(
+            and_(*[col == bindparam('pk_' + col.name) for col in table.primary_key])
+        ).values({name: bindparam('set_' + name) for name in update_columns})
+        conn.execute(statement, [
+            dict([('pk_' + name, record.get(name)) for name in pk_names]
+                 + [('set_' + name, record[name]) for name in update_columns])
+            for record in records])
+        statements += 1
+    conn.execute(table.insert().prefix_with('OR IGNORE'), records)
+    return statements + 1
@@ -25,6 +25,9 @@ setup(
         'simplejson',
         'xlrd'
     ],
+    extras_require={
+        'xlsx': ['openpyxl']
+    },
     tests_require=[
         'pytest'
     ],
@@ -3,10 +3,13 @@ from app import create_app
 from app.extensions import db as _db
 from config import DevConfig, TestConfig
 from app.users.models import User, Tool
+from flask_sqlafixtures import db_utils
 import pandas as pd
 import numpy as np
 import datetime as dt
 
+pytest_plugins = ['pytester']
+
 
 @pytest.fixture
 def app_object():
@@ -76,6 +79,24 @@ def db(app):
     _db.drop_all()
 
 
+@pytest.fixture
+def fixtures_directory(tmp_path, monkeypatch):
+    """tmp_path, returned by db_utils.get_fixtures_directory for the test."""
+
+    monkeypatch.setattr(db_utils, 'get_fixtures_directory', lambda: str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def echo_messages(monkeypatch):
+    """List of the messages db_utils prints with click.echo during the test."""
+
+    messages = []
+    monkeypatch.setattr(db_utils.click, 'echo',
+                        lambda message='', *args, **kwargs: messages.append(message))
+    return messages
+
+
 @pytest.fixture
 def user(db):
     user = User(name='Jason')
@@ -0,0 +1,80 @@
+"""pytest-benchmark group of the sqlafixtures throughput phases.
+
+Skipped unless pytest-benchmark is installed. Run with:
+
+    pytest tests/test_benchmarks.py --benchmark-group-by=group,param
+
+SQLAFIXTURES_BENCH_SIZES sets the numbers of rows, ex: 1k,10k,100k,1M.
+"""
+import os
+import pytest
+from flask_sqlafixtures import bench, db_utils
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = bench.parse_sizes(os.environ.get('SQLAFIXTURES_BENCH_SIZES', '1k,10k'))
+
+
+@pytest.fixture
+def bench_app(app):
+    with app.app_context():
+        yield app
+        table = bench.make_bench_table()
+        table.drop(app.extensions['sqlafixtures'].db.engine, checkfirst=True)
+
+
+@pytest.fixture
+def bench_table():
+    return bench.make_bench_table()
+
+
+@pytest.mark.benchmark(group='sqlafixtures-seed')
+@pytest.mark.parametrize('bulk', [False, True], ids=['normal', 'bulk'])
+@pytest.mark.parametrize('size', SIZES)
+def test_bench_seed(benchmark, bench_app, bench_table, tmp_path, size, bulk):
+    engine = bench_app.extensions['sqlafixtures'].db.engine
+    path = bench.write_bench_fixture(
+        str(tmp_path), bench_table, size, db_utils.get_fixtures_format())
+    benchmark.extra_info['rows'] = size
+    benchmark.pedantic(bench.load_fixture,
+                       args=(engine, bench_table, path, db_utils.DEFAULT_BATCH_SIZE, bulk),
+                       rounds=3)
+
+
+@pytest.mark.benchmark(group='sqlafixtures-formats')
+@pytest.mark.parametrize('fixture_format', ['json', 'columnar', 'jsonl'])
+@pytest.mark.parametrize('size', SIZES)
+def test_bench_read_formats(benchmark, bench_table, tmp_path, size, fixture_format):
+    path = bench.write_bench_fixture(str(tmp_path), bench_table, size, fixture_format)
+    benchmark.extra_info['rows'] = size
+    benchmark.extra_info['bytes'] = os.path.getsize(path)
+    benchmark.pedantic(bench.read_fixture, args=(path,), rounds=3)
+
+
+@pytest.mark.benchmark(group='sqlafixtures-export')
+@pytest.mark.parametrize('size', SIZES)
+def test_bench_export(benchmark, bench_app, bench_table, tmp_path, size):
+    engine = bench_app.extensions['sqlafixtures'].db.engine
+    (tmp_path / 'export').mkdir()
+    path = bench.write_bench_fixture(
+        str(tmp_path), bench_table, size, db_utils.get_fixtures_format())
+    bench.load_fixture(engine, bench_table, path)
+    benchmark.extra_info['rows'] = size
+    benchmark.pedantic(bench.export_fixture,
+                       args=(bench.BenchModel(bench_table), str(tmp_path / 'export')),
+                       rounds=3)
+
+
+@pytest.mark.benchmark(group='sqlafixtures-xlsx')
+@pytest.mark.parametrize('size', [size for size in SIZES if size <= bench.XLSX_MAX_ROWS])
+def test_bench_xlsx(benchmark, bench_app, bench_table, tmp_path, size):
+    if not bench.has_xlsx_support():
+        pytest.skip(bench.XLSX_MISSING)
+    (tmp_path / 'xlsx').mkdir()
+    workbook = bench.write_bench_workbook(
+        str(tmp_path / 'fixtures_file.xlsx'), bench_table, size)
+    benchmark.extra_info['rows'] = size
+    benchmark.pedantic(bench.convert_workbook,
+                       args=(bench.BenchModel(bench_table), workbook,
+                             str(tmp_path / 'xlsx'), db_utils.get_fixtures_format()),
+                       rounds=3)
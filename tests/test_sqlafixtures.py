@@ -1,15 +1,17 @@
+import io
 import os
 from pathlib import Path
 import sys
 import shutil
 import simplejson as json
 import time
+import pytest
 from click.testing import CliRunner
 from flask_sqlafixtures import SQLAFixtures
-from flask_sqlafixtures import commands, db_utils
+from flask_sqlafixtures import bench, commands, db_utils, diff, fingerprints, formats, manifest, metrics, pytest_plugin, registry, scale, seed_state, signals, snapshots, subset, type_codecs, upsert
 from flask import current_app
 from flask.cli import with_appcontext
-from unittest.mock import MagicMock, Mock
+from unittest.mock import ANY, MagicMock, Mock
 import datetime as dt
 from app.users.models import User, Tool
 from app.extensions import fixtures
@@ -17,6 +19,12 @@ from app.extensions import fixtures
 BASEDIR = Path(__file__).parent.parent
 
 
+def _exit_parser(path, batch_size, parsed):
+    """Stand in for db_utils._parse_fixture, exiting before any batch is parsed."""
+
+    os._exit(3)
+
+
 class Test_Config:
     """Test configuration."""
 
@@ -131,6 +139,67 @@ class TestSQLAFixtures:
         modules = fixtures.get_fixtures_modules(app_object)
         assert modules == []
 
+    def test_get_batch_size_configured(self, app_object):
+        """Test get_batch_size when SQLAFIXTURES_BATCH_SIZE is configured."""
+
+        app_object.config['SQLAFIXTURES_BATCH_SIZE'] = 50
+
+        fixtures = SQLAFixtures(app_object)
+        batch_size = fixtures.get_batch_size(app_object)
+        assert batch_size == 50
+
+    def test_get_batch_size_not_configured(self, app_object):
+        """Test get_batch_size when SQLAFIXTURES_BATCH_SIZE is not configured."""
+
+        fixtures = SQLAFixtures(app_object)
+        batch_size = fixtures.get_batch_size(app_object)
+        assert batch_size == db_utils.DEFAULT_BATCH_SIZE
+
+    def test_get_fixtures_format_configured(self, app_object):
+        """Test get_fixtures_format when SQLAFIXTURES_FORMAT is configured."""
+
+        app_object.config['SQLAFIXTURES_FORMAT'] = 'jsonl'
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_fixtures_format(app_object) == 'jsonl'
+
+    def test_get_fixtures_format_not_configured(self, app_object):
+        """Test get_fixtures_format when SQLAFIXTURES_FORMAT is not configured."""
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_fixtures_format(app_object) == 'json'
+
+    def test_get_queue_size_configured(self, app_object):
+        """Test get_queue_size when SQLAFIXTURES_QUEUE_SIZE is configured."""
+
+        app_object.config['SQLAFIXTURES_QUEUE_SIZE'] = 8
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_queue_size(app_object) == 8
+
+    def test_get_queue_size_not_configured(self, app_object):
+        """Test get_queue_size when SQLAFIXTURES_QUEUE_SIZE is not configured."""
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_queue_size(app_object) == db_utils.DEFAULT_QUEUE_SIZE
+
+    def test_get_shard_limits_configured(self, app_object):
+        """Test get_shard_rows and get_shard_bytes when configured."""
+
+        app_object.config['SQLAFIXTURES_SHARD_ROWS'] = 100000
+        app_object.config['SQLAFIXTURES_SHARD_BYTES'] = 1 << 26
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_shard_rows(app_object) == 100000
+        assert fixtures.get_shard_bytes(app_object) == 1 << 26
+
+    def test_get_shard_limits_not_configured(self, app_object):
+        """Test get_shard_rows and get_shard_bytes when not configured."""
+
+        fixtures = SQLAFixtures(app_object)
+        assert fixtures.get_shard_rows(app_object) is None
+        assert fixtures.get_shard_bytes(app_object) is None
+
 
 class Test_SQLAFixtures_Commands:
     """Test sqlafixtures.command."""
@@ -212,7 +281,7 @@ class Test_SQLAFixtures_Commands:
         result = runner.invoke(
             commands.seed, catch_exceptions=False)
         assert not result.exception
-        db_utils.seed.assert_called_with([])
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
         db_utils.seed = seed
 
     def test_seed_multiple_single_model(self):
@@ -224,7 +293,7 @@ class Test_SQLAFixtures_Commands:
         result = runner.invoke(
             commands.seed, ['--models', 'User'], catch_exceptions=False)
         assert not result.exception
-        db_utils.seed.assert_called_with(['User'])
+        db_utils.seed.assert_called_with(['User'], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
         db_utils.seed = seed
 
     def test_seed_multiple_model_names(self):
@@ -236,7 +305,104 @@ class Test_SQLAFixtures_Commands:
         result = runner.invoke(
             commands.seed, ['--models', 'User,Tool'], catch_exceptions=False)
         assert not result.exception
-        db_utils.seed.assert_called_with(['User', 'Tool'])
+        db_utils.seed.assert_called_with(['User', 'Tool'], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_batch_size(self):
+        """Test seed with batch size."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--batch-size', '500'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=500, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_savepoints(self):
+        """Test seed with savepoints."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--savepoints'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=True, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_bulk(self):
+        """Test seed with bulk."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--bulk'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=False, bulk=True, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_workers(self):
+        """Test seed with workers."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--workers', '3'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with(
+            [], batch_size=None, savepoints=False, bulk=False, workers=3, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_force(self):
+        """Test seed with force."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--force'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=False, bulk=False, workers=1, force=True, mode='upsert', delete=False, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_mode_diff_delete(self):
+        """Test seed with mode diff and delete."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--mode', 'diff', '--delete'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='diff', delete=True, report=ANY, queue_size=None, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_queue_size(self):
+        """Test seed with queue size."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--queue-size', '0'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with([], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=0, shards=None)
+        db_utils.seed = seed
+
+    def test_seed_shards(self):
+        """Test seed with a range of shards."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.seed, ['--models', 'Tool', '--shards', '0-3'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.seed.assert_called_with(['Tool'], batch_size=None, savepoints=False, bulk=False, workers=1, force=False, mode='upsert', delete=False, report=ANY, queue_size=None, shards=[0, 1, 2, 3])
         db_utils.seed = seed
 
     def test_create_fixtures_from_xlsx_no_models_no_exclues(self, app):
@@ -248,7 +414,7 @@ class Test_SQLAFixtures_Commands:
         result = runner.invoke(
             commands.create_fixtures_from_xlsx, catch_exceptions=False)
         assert not result.exception
-        db_utils.create_fixtures.assert_called_with([], [], from_file=True)
+        db_utils.create_fixtures.assert_called_with([], [], from_file=True, workers=1, force=False, report=ANY)
         assert result.output == 'Completed creating fixtures from xlsx\n'
         db_utils.create_fixtures = create_fixtures
 
@@ -262,7 +428,7 @@ class Test_SQLAFixtures_Commands:
             commands.create_fixtures_from_xlsx, ['--models', 'User', '--excludes', 'Tool'], catch_exceptions=False)
         assert not result.exception
         db_utils.create_fixtures.assert_called_with(
-            ['User'], ['Tool'], from_file=True)
+            ['User'], ['Tool'], from_file=True, workers=1, force=False, report=ANY)
         assert result.output == 'Completed creating fixtures from xlsx\n'
         db_utils.create_fixtures = create_fixtures
 
@@ -276,10 +442,23 @@ class Test_SQLAFixtures_Commands:
             commands.create_fixtures_from_xlsx, ['--models', 'User,Tool', '--excludes', 'Boat,Car'], catch_exceptions=False)
         assert not result.exception
         db_utils.create_fixtures.assert_called_with(
-            ['User', 'Tool'], ['Boat', 'Car'], from_file=True)
+            ['User', 'Tool'], ['Boat', 'Car'], from_file=True, workers=1, force=False, report=ANY)
         assert result.output == 'Completed creating fixtures from xlsx\n'
         db_utils.create_fixtures = create_fixtures
 
+    def test_create_fixtures_from_xlsx_force(self):
+        """Test create_fixtures_from_xlsx with force."""
+
+        create_fixtures = db_utils.create_fixtures
+        db_utils.create_fixtures = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.create_fixtures_from_xlsx, ['--force'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.create_fixtures.assert_called_with(
+            [], [], from_file=True, workers=1, force=True, report=ANY)
+        db_utils.create_fixtures = create_fixtures
+
     def test_create_fixtures_from_db_no_models_no_excludes(self):
         """Test create_fixtures_from_db with no models no exludes."""
 
@@ -289,7 +468,8 @@ class Test_SQLAFixtures_Commands:
         result = runner.invoke(
             commands.create_fixtures_from_db, catch_exceptions=False)
         assert not result.exception
-        db_utils.create_fixtures.assert_called_with([], [], from_file=False)
+        db_utils.create_fixtures.assert_called_with(
+            [], [], from_file=False, workers=1, report=ANY, where={}, sample={})
         assert result.output == 'Completed creating fixtures from db\n'
         db_utils.create_fixtures = create_fixtures
 
@@ -303,7 +483,8 @@ class Test_SQLAFixtures_Commands:
             commands.create_fixtures_from_db, ['--models', 'User', '--excludes', 'Tool'], catch_exceptions=False)
         assert not result.exception
         db_utils.create_fixtures.assert_called_with(
-            ['User'], ['Tool'], from_file=False)
+            ['User'], ['Tool'], from_file=False, workers=1, report=ANY,
+            where={}, sample={})
         assert result.output == 'Completed creating fixtures from db\n'
         db_utils.create_fixtures = create_fixtures
 
@@ -318,7 +499,21 @@ class Test_SQLAFixtures_Commands:
         assert not result.exception
         assert result.output == 'Completed creating fixtures from db\n'
         db_utils.create_fixtures.assert_called_with(
-            ['User', 'Tool'], ['Boat', 'Car'], from_file=False)
+            ['User', 'Tool'], ['Boat', 'Car'], from_file=False, workers=1, report=ANY,
+            where={}, sample={})
+        db_utils.create_fixtures = create_fixtures
+
+    def test_create_fixtures_from_db_workers(self):
+        """Test create_fixtures_from_db with workers."""
+
+        create_fixtures = db_utils.create_fixtures
+        db_utils.create_fixtures = MagicMock()
+        runner = CliRunner()
+        result = runner.invoke(
+            commands.create_fixtures_from_db, ['--workers', '4'], catch_exceptions=False)
+        assert not result.exception
+        db_utils.create_fixtures.assert_called_with(
+            [], [], from_file=False, workers=4, report=ANY, where={}, sample={})
         db_utils.create_fixtures = create_fixtures
 
     def test_check_sqlafixtures_is_initialized_not(self, app):
@@ -346,7 +541,7 @@ class Test_SQLAFixtures_Commands:
         with app.app_context():
             results = commands.check_fixtures_file_exists()
         assert results == False
-        os.path.isfile == isfile
+        os.path.isfile = isfile
 
     def test_check_sqlafixtures_file_exists_configured_valid_file(self, app):
         """Test check_sqlafixtures_is_iexists when configured with a valid file."""
@@ -357,7 +552,7 @@ class Test_SQLAFixtures_Commands:
         with app.app_context():
             results = commands.check_fixtures_file_exists()
         assert results == True
-        os.path.isfile == isfile
+        os.path.isfile = isfile
 
 
 class Test_SQLAFixtures_DB_Utils:
@@ -423,6 +618,367 @@ class Test_SQLAFixtures_DB_Utils:
 
         db_utils.get_fixtures_directory = get_fixtures_directory
 
+    def test_seed_batch_size(self, app, db):
+        """Test seed with a batch size smaller than the number of records."""
+
+        base_dir = Path(app.root_path).parent
+        test_dir = os.path.join(base_dir, 'tests', 'data')
+
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=test_dir)
+
+        with app.app_context():
+            db_utils.seed(['Tool'], batch_size=1)
+        rows = list(db.session.execute('SELECT id, name FROM tools'))
+        assert rows == [(1, 'screw driver'), (2, 'hammer')]
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
+    def test_sort_models_by_dependency(self, app):
+        """Test sort_models_by_dependency."""
+
+        from app.extensions import db
+        models = db_utils.sort_models_by_dependency([User, Tool], db.metadata)
+        assert models == [Tool, User]
+
+    def test_seed_rolls_back_on_error(self, app, db, tmp_path):
+        """Test seed rolls back every table when one table fails."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        (tmp_path / 'users.json').write_text('{"records": [')
+
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
+
+        with app.app_context():
+            try:
+                db_utils.seed()
+                assert False
+            except db_utils.FixtureFormatError:
+                pass
+        assert list(db.session.execute('SELECT * FROM tools')) == []
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
+    def test_seed_savepoints(self, app, db, tmp_path):
+        """Test seed with savepoints keeps the tables that loaded."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        (tmp_path / 'users.json').write_text('{"records": [')
+
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
+
+        with app.app_context():
+            try:
+                db_utils.seed(savepoints=True, bulk=False)
+                assert False
+            except db_utils.SeedError as e:
+                assert e.message == 'Failed to seed tables: users.'
+        rows = list(db.session.execute('SELECT id FROM tools'))
+        assert rows == [(1,), (2,)]
+        assert list(db.session.execute('SELECT * FROM users')) == []
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
+    def test_seed_bulk(self, app, db):
+        """Test seed in bulk mode restores the connection settings."""
+
+        base_dir = Path(app.root_path).parent
+        test_dir = os.path.join(base_dir, 'tests', 'data')
+
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=test_dir)
+
+        synchronous = db.session.execute('PRAGMA synchronous').scalar()
+        with app.app_context():
+            report = db_utils.seed(bulk=True)
+        assert report.count == 4
+        assert db.session.execute('PRAGMA synchronous').scalar() == synchronous
+        rows = list(db.session.execute('SELECT id, name FROM users'))
+        assert rows == [(1, 'Jason'), (2, 'Sheila')]
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
+    def test_sqlite_bulk_load(self, tmp_path):
+        """Test sqlite_bulk_load applies and restores the pragmas on a file database."""
+
+        from sqlalchemy import create_engine
+        engine = create_engine('sqlite:///' + str(tmp_path / 'bulk.db'))
+        with engine.connect() as conn:
+            with db_utils.sqlite_bulk_load(conn):
+                assert conn.execute('PRAGMA journal_mode').scalar() == 'memory'
+                assert conn.execute('PRAGMA synchronous').scalar() == 0
+                assert conn.execute('PRAGMA cache_size').scalar() == -65536
+            assert conn.execute('PRAGMA journal_mode').scalar() == 'delete'
+            assert conn.execute('PRAGMA synchronous').scalar() == 2
+            assert conn.execute('PRAGMA cache_size').scalar() == -2000
+        engine.dispose()
+
+    def test_seed_table_order_by_pk(self, app, tmp_path):
+        """Test seed_table sorts each batch by primary key."""
+
+        path = tmp_path / 'users.json'
+        path.write_text('{"records": [{"id": 3, "name": "c"}, {"id": 1, "name": "a"}]}')
+        upsert_records = upsert.upsert
+        upsert.upsert = MagicMock()
+        try:
+            db_utils.seed_table(None, User.__table__, str(path), order_by_pk=True)
+            records = upsert.upsert.call_args[0][2]
+        finally:
+            upsert.upsert = upsert_records
+        assert [record['id'] for record in records] == [1, 3]
+
+    def test_seed_table_order_by_pk_none(self, app, tmp_path):
+        """Test seed_table sorts records without a primary key value last."""
+
+        path = tmp_path / 'users.json'
+        path.write_text('{"records": [{"id": 3, "name": "c"}, {"id": null, "name": "n"}, '
+                        '{"name": "m"}, {"id": 1, "name": "a"}]}')
+        upsert_records = upsert.upsert
+        upsert.upsert = MagicMock()
+        try:
+            db_utils.seed_table(None, User.__table__, str(path), order_by_pk=True)
+            records = upsert.upsert.call_args[0][2]
+        finally:
+            upsert.upsert = upsert_records
+        assert [record['name'] for record in records] == ['a', 'c', 'n', 'm']
+
+    def test_seed_workers(self, app, db):
+        """Test seed with workers on SQLite prefetches and inserts in one transaction."""
+
+        base_dir = Path(app.root_path).parent
+        test_dir = os.path.join(base_dir, 'tests', 'data')
+
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=test_dir)
+
+        with app.app_context():
+            report = db_utils.seed(workers=2, batch_size=1)
+        assert report.count == 4
+        rows = list(db.session.execute('SELECT id, name FROM tools'))
+        assert rows == [(1, 'screw driver'), (2, 'hammer')]
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
+    def test_seed_tables_by_level(self, app, tmp_path):
+        """Test seed_tables_by_level on separate connections."""
+
+        from sqlalchemy import create_engine
+        base_dir = Path(app.root_path).parent
+        test_dir = os.path.join(base_dir, 'tests', 'data')
+        engine = create_engine('sqlite:///' + str(tmp_path / 'levels.db'))
+        tables = [Tool.__table__, User.__table__]
+        User.metadata.create_all(engine, tables=tables)
+        paths = {table: os.path.join(test_dir, table.name + '.json') for table in tables}
+
+        count = db_utils.seed_tables_by_level(engine, tables, paths, workers=2)
+        assert count == 4
+        assert list(engine.execute('SELECT name FROM users')) == [('Jason',), ('Sheila',)]
+        engine.dispose()
+
+    def test_group_tables_by_level(self):
+        """Test group_tables_by_level."""
+
+        from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+        metadata = MetaData()
+        parent = Table('parent', metadata, Column('id', Integer, primary_key=True))
+        other = Table('other', metadata, Column('id', Integer, primary_key=True))
+        child = Table('child', metadata, Column('id', Integer, primary_key=True),
+                      Column('parent_id', ForeignKey('parent.id')),
+                      Column('child_id', ForeignKey('child.id')))
+        grandchild = Table('grandchild', metadata, Column('id', Integer, primary_key=True),
+                           Column('child_id', ForeignKey('child.id')),
+                           Column('other_id', ForeignKey('other.id')))
+        levels = db_utils.group_tables_by_level(metadata.sorted_tables)
+        assert levels == [[other, parent], [child], [grandchild]]
+
+    def test_prefetch_batches(self):
+        """Test prefetch_batches keeps the order and stops workers closed early."""
+
+        sources = [('a', [[1], [2], [3], [4]]), ('b', [[5]]), ('c', [[6]])]
+        sources = [(name, (batch for batch in batches)) for name, batches in sources]
+        with db_utils.prefetch_batches(sources, workers=2, queue_size=1) as prefetched:
+            result = []
+            for name, batches in prefetched:
+                for batch in batches:
+                    result.append(batch)
+                    if name == 'a':
+                        break
+                batches.close()
+        assert result == [[1], [5], [6]]
+
+    def test_prefetch_batches_error(self, tmp_path):
+        """Test prefetch_batches raises a worker error in the consumer."""
+
+        path = tmp_path / 'users.json'
+        path.write_text('{"records": [{"id": 1, "name": "a"},')
+        sources = [(User.__table__, db_utils.read_fixture_batches(
+            User.__table__, str(path), batch_size=1))]
+        with db_utils.prefetch_batches(sources, workers=2) as prefetched:
+            table, batches = prefetched[0]
+            try:
+                list(batches)
+                assert False
+            except db_utils.FixtureFormatError:
+                pass
+            batches.close()
+
+    def pipeline(self, tables, paths, **kwargs):
+        """Read the fixtures of tables with pipeline_batches, forcing child processes."""
+
+        min_bytes = db_utils.PROCESS_PARSE_MIN_BYTES
+        get_cpu_count = db_utils.get_cpu_count
+        db_utils.PROCESS_PARSE_MIN_BYTES = 0
+        db_utils.get_cpu_count = MagicMock(return_value=2)
+        try:
+            with db_utils.pipeline_batches(tables, paths, **kwargs) as sources:
+                return [(table, batches, list(batches)) for table, batches in sources]
+        finally:
+            db_utils.PROCESS_PARSE_MIN_BYTES = min_bytes
+            db_utils.get_cpu_count = get_cpu_count
+
+    def test_pipeline_batches(self, app):
+        """Test pipeline_batches parses fixtures in child processes, in order."""
+
+        test_dir = str(BASEDIR / 'tests' / 'data')
+        tables = [Tool.__table__, User.__table__]
+        paths = {table: os.path.join(test_dir, table.name + '.json') for table in tables}
+        report = metrics.Report('seed')
+
+        result = self.pipeline(tables, paths, batch_size=1, queue_size=1, report=report)
+        assert [type(batches) for table, batches, read in result] == [
+            db_utils.ParsedBatches, db_utils.ParsedBatches]
+        tools = result[0][2]
+        assert [[record['id'] for record in batch] for batch in tools] == [[1], [2]]
+        assert tools[0][0]['added'] == dt.date(2020, 3, 29)
+        assert [record['name'] for batch in result[1][2] for record in batch] == [
+            'Jason', 'Sheila']
+        assert result[0][1].ahead == [result[1][1]]
+        tools_metrics = report.table('tools')
+        assert tools_metrics.bytes == os.path.getsize(paths[Tool.__table__])
+        assert tools_metrics.parse_time > 0
+        assert result[0][1].process is None and result[0][1].queue is None
+
+    def test_pipeline_batches_small_fixtures(self, app):
+        """Test fixtures under PROCESS_PARSE_MIN_BYTES are read by the consumer."""
+
+        test_dir = str(BASEDIR / 'tests' / 'data')
+        tables = [Tool.__table__]
+        paths = {Tool.__table__: os.path.join(test_dir, 'tools.json')}
+        get_cpu_count = db_utils.get_cpu_count
+        db_utils.get_cpu_count = MagicMock(return_value=2)
+        try:
+            with db_utils.pipeline_batches(tables, paths) as sources:
+                table, batches = sources[0]
+                assert not isinstance(batches, db_utils.ParsedBatches)
+                assert len(list(batches)[0]) == 2
+        finally:
+            db_utils.get_cpu_count = get_cpu_count
+
+    def test_pipeline_batches_error(self, tmp_path):
+        """Test an error of a child process is raised in the consumer."""
+
+        path = tmp_path / 'users.json'
+        path.write_text('{"records": [{"id": 1, "name": "a"},')
+        try:
+            self.pipeline([User.__table__], {User.__table__: str(path)}, batch_size=1)
+            assert False
+        except db_utils.FixtureFormatError:
+            pass
+
+    def test_parsed_batches_exit(self, tmp_path):
+        """Test a child process exiting without its batches raises SeedError."""
+
+        path = str(BASEDIR / 'tests' / 'data' / 'users.json')
+        parse_fixture = db_utils._parse_fixture
+        db_utils._parse_fixture = _exit_parser
+        batches = db_utils.ParsedBatches(User.__table__, path)
+        try:
+            list(batches)
+            assert False
+        except db_utils.SeedError as e:
+            assert e.message == 'Parsing "{}" stopped with exit code 3.'.format(path)
+        finally:
+            db_utils._parse_fixture = parse_fixture
+            batches.close()
+
+    def test_parsed_batches_lazy(self):
+        """Test the queue and child process of a fixture only exist while it is parsed."""
+
+        path = str(BASEDIR / 'tests' / 'data' / 'users.json')
+        batches = db_utils.ParsedBatches(User.__table__, path, batch_size=1)
+        assert batches.queue is None and batches.process is None
+        try:
+            assert [record['name'] for batch in batches for record in batch] == [
+                'Jason', 'Sheila']
+            assert batches.process is not None
+        finally:
+            batches.close()
+        assert batches.queue is None and batches.process is None
+        batches.start()
+        assert batches.process is None
+
+    def test_seed_pipeline(self, app, db):
+        """Test seed with fixtures parsed in child processes."""
+
+        test_dir = str(BASEDIR / 'tests' / 'data')
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        min_bytes = db_utils.PROCESS_PARSE_MIN_BYTES
+        get_cpu_count = db_utils.get_cpu_count
+        db_utils.get_fixtures_directory = MagicMock(return_value=test_dir)
+        db_utils.PROCESS_PARSE_MIN_BYTES = 0
+        db_utils.get_cpu_count = MagicMock(return_value=2)
+        try:
+            with app.app_context():
+                report = db_utils.seed(batch_size=1, queue_size=1)
+        finally:
+            db_utils.get_fixtures_directory = get_fixtures_directory
+            db_utils.PROCESS_PARSE_MIN_BYTES = min_bytes
+            db_utils.get_cpu_count = get_cpu_count
+        assert report.count == 4
+        rows = list(db.session.execute('SELECT id, name, added FROM tools'))
+        assert rows == [(1, 'screw driver', '2020-03-29'), (2, 'hammer', '2020-04-19')]
+
+    def test_iter_fixture_records(self, app, records):
+        """Test iter_fixture_records reads the records of a fixture file."""
+
+        base_dir = Path(app.root_path).parent
+        path = os.path.join(base_dir, 'tests', 'data', 'tools.json')
+        with open(path) as fp:
+            result = list(db_utils.iter_fixture_records(fp, chunk_size=7))
+        assert result == records
+
+    def test_iter_fixture_records_empty(self):
+        """Test iter_fixture_records with no records."""
+
+        fp = io.StringIO('{"table": {"name": "tools"}, "records": []}')
+        assert list(db_utils.iter_fixture_records(fp)) == []
+
+    def test_iter_fixture_records_records_first(self):
+        """Test iter_fixture_records when 'records' is before 'table'."""
+
+        fp = io.StringIO('{"records": [{"id": 12345}], "table": {"name": "x"}}')
+        assert list(db_utils.iter_fixture_records(fp, chunk_size=3)) == [{'id': 12345}]
+
+    def test_iter_fixture_records_invalid(self):
+        """Test iter_fixture_records with a truncated file."""
+
+        fp = io.StringIO('{"table": {"name": "tools"}, "records": [{"id": 1}')
+        try:
+            list(db_utils.iter_fixture_records(fp))
+            assert False
+        except db_utils.FixtureFormatError as e:
+            assert e.message
+
+    def test_iter_batches(self):
+        """Test iter_batches."""
+
+        batches = list(db_utils.iter_batches(range(5), 2))
+        assert batches == [[0, 1], [2, 3], [4]]
+
     def test_convert_str_to_datetime_or_date_date_none(self):
         """Test convert_str_to_datetime_or_date date with None."""
 
@@ -478,25 +1034,71 @@ class Test_SQLAFixtures_DB_Utils:
         assert records[0]['added'] == dt.date(2020, 3, 29)
         assert records[0]['last_seen'] == dt.datetime(2020, 4, 12, 5, 22, 33)
 
-    def test_create_fixtures_file(self, app):
+    def test_format_fixture_record_dates_microseconds(self, cols):
+        """Test format_fixture_record_dates with a datetime exported with microseconds."""
+
+        records = [{'id': 1, 'name': 'saw', 'added': None,
+                    'last_seen': '2020-04-12 05:22:33.000000'}]
+        records = db_utils.format_fixture_record_dates(cols, records)
+        assert records[0]['added'] == None
+        assert records[0]['last_seen'] == dt.datetime(2020, 4, 12, 5, 22, 33)
+
+    def test_get_conversion_plan(self):
+        """Test get_conversion_plan only lists date and datetime columns."""
+
+        plan = db_utils.get_conversion_plan(Tool.__table__)
+        assert plan == [('added', db_utils.convert_str_to_date),
+                        ('last_seen', db_utils.convert_str_to_datetime)]
+        assert db_utils.get_conversion_plan(Tool.__table__) is plan
+        assert db_utils.get_conversion_plan(User.__table__) == []
+
+    def test_convert_str_to_date(self):
+        """Test convert_str_to_date falls back to DATE_FORMAT."""
+
+        assert db_utils.convert_str_to_date('2020-07-04') == dt.date(2020, 7, 4)
+        assert db_utils.convert_str_to_date('2020-7-4') == dt.date(2020, 7, 4)
+        assert db_utils.convert_str_to_date(None) == None
+
+    def test_convert_str_to_datetime(self):
+        """Test convert_str_to_datetime falls back to DATETIME_FORMAT."""
+
+        assert db_utils.convert_str_to_datetime(
+            '2021-05-27 23:11:31') == dt.datetime(2021, 5, 27, 23, 11, 31)
+        assert db_utils.convert_str_to_datetime(
+            '2021-5-27 23:11:31') == dt.datetime(2021, 5, 27, 23, 11, 31)
+        assert db_utils.convert_str_to_datetime('') == None
+
+    def test_create_fixtures_file(self, app, tmp_path):
         """Test create_fixtures from file."""
 
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
         get_fixture_models = db_utils.get_fixture_models
         create_fixture_from_file = db_utils.create_fixture_from_file
         create_fixture_from_db = db_utils.create_fixture_from_db
 
-        db_utils.get_fixture_models = MagicMock(return_value=[User])
+        open_fixtures_workbook = db_utils.open_fixtures_workbook
+
+        db_utils.get_fixture_models = MagicMock(return_value=[User, Tool])
         db_utils.create_fixture_from_file = MagicMock()
         db_utils.create_fixture_from_db = MagicMock()
+        db_utils.open_fixtures_workbook = MagicMock()
+        workbook = db_utils.open_fixtures_workbook.return_value.__enter__.return_value
 
-        db_utils.create_fixtures(['User'], [], from_file=True)
+        with app.app_context():
+            db_utils.create_fixtures(['User', 'Tool'], [], from_file=True)
 
-        db_utils.create_fixture_from_file.assert_called_with(User)
+        db_utils.open_fixtures_workbook.assert_called_once_with()
+        db_utils.create_fixture_from_file.assert_any_call(User, workbook)
+        db_utils.create_fixture_from_file.assert_called_with(Tool, workbook)
         db_utils.create_fixture_from_db.assert_not_called()
 
+        db_utils.get_fixtures_directory = get_fixtures_directory
+
         db_utils.get_fixture_models = get_fixture_models
         db_utils.create_fixture_from_file = create_fixture_from_file
         db_utils.create_fixture_from_db = create_fixture_from_db
+        db_utils.open_fixtures_workbook = open_fixtures_workbook
 
     def test_create_fixtures_db(self, app):
         """Test create_fixtures from db."""
@@ -518,6 +1120,70 @@ class Test_SQLAFixtures_DB_Utils:
         db_utils.create_fixture_from_file = create_fixture_from_file
         db_utils.create_fixture_from_db = create_fixture_from_db
 
+    def test_create_fixtures_file_workers(self, app, tmp_path):
+        """Test create_fixtures from file in a process pool."""
+
+        base_dir = Path(app.root_path).parent
+        app.extensions['sqlafixtures'].file = os.path.join(
+            base_dir, 'tests', 'data', 'fixtures_file.xlsx')
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
+
+        with app.app_context():
+            db_utils.create_fixtures([], [], from_file=True, workers=2)
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+        users = json.load(open(str(tmp_path / 'users.json')))
+        tools = json.load(open(str(tmp_path / 'tools.json')))
+        assert [record['name'] for record in users['records']] == ['Jason', 'Sheila', 'Maiyan']
+        assert tools['records'][0]['added'] == '2020-03-29'
+
+    def test_create_fixtures_db_workers(self, tmp_path):
+        """Test create_fixtures from db in a thread pool."""
+
+        from config import TestConfig
+
+        class FileConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+
+        from app import create_app
+        from app.extensions import db
+        app = create_app(FileConfig)
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(name='Jason'))
+            db.session.add(Tool(name='hammer', added=dt.date(2020, 4, 19)))
+            db.session.commit()
+            db_utils.create_fixtures([], [], from_file=False, workers=2)
+            db.session.remove()
+            db.engine.dispose()
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+        users = json.load(open(str(tmp_path / 'users.json')))
+        tools = json.load(open(str(tmp_path / 'tools.json')))
+        assert users['records'] == [{'id': 1, 'name': 'Jason'}]
+        assert tools['records'][0]['added'] == '2020-04-19'
+
+    def test_create_fixtures_errors(self, app):
+        """Test create_fixtures raises the errors of every failed model."""
+
+        create_fixture_from_db = db_utils.create_fixture_from_db
+        db_utils.create_fixture_from_db = MagicMock(
+            side_effect=[ValueError('bad user'), None])
+
+        with app.app_context():
+            try:
+                db_utils.create_fixtures([], [], from_file=False)
+                assert False
+            except db_utils.FixtureCreationError as e:
+                assert list(e.errors) == ['User']
+                assert e.message == 'Failed to create fixtures: User: bad user'
+        assert db_utils.create_fixture_from_db.call_count == 2
+
+        db_utils.create_fixture_from_db = create_fixture_from_db
+
     def test_get_fixtures_dataframe_users(self, app):
         """Test get_fixtures_dataframe."""
 
@@ -550,6 +1216,20 @@ class Test_SQLAFixtures_DB_Utils:
         assert df['last_seen'][1].to_pydatetime(
         ) == dt.datetime(2020, 5, 7, 23, 30, 5)
 
+    def test_get_fixtures_dataframe_workbook(self, app):
+        """Test get_fixtures_dataframe from an opened workbook."""
+
+        base_dir = Path(app.root_path).parent
+        test_dir = os.path.join(base_dir, 'tests', 'data')
+        app.extensions['sqlafixtures'].file = os.path.join(test_dir, 'fixtures_file.xlsx')
+        with app.app_context():
+            with db_utils.open_fixtures_workbook() as workbook:
+                users = db_utils.get_fixture_dataframe('users', workbook)
+                tools = db_utils.get_fixture_dataframe('tools', workbook)
+
+        assert list(users['name']) == ['Jason', 'Sheila', 'Maiyan']
+        assert list(tools['id']) == [1, 2]
+
     def test_convert_df_dates_to_str(self, tools_df):
         """Test convert_df_dates to str."""
 
@@ -643,6 +1323,44 @@ class Test_SQLAFixtures_DB_Utils:
         result = db_utils.json_encoder(date)
         assert result == '2020-05-06 17:55:06'
 
+    def test_write_fixture(self, records):
+        """Test write_fixture writes the same bytes as json.dump with indent=4."""
+
+        for fixture_records in (records, [], [{'note': 'line\nbreak', 'data': {'a': [1]}}]):
+            outfile = io.StringIO()
+            db_utils.write_fixture(outfile, 'tools', iter(fixture_records))
+            expected = json.dumps(
+                {'table': {'name': 'tools'}, 'records': fixture_records}, indent=4)
+            assert outfile.getvalue() == expected
+
+    def test_create_fixture_from_db_batches(self, app, db, tool, tmp_path):
+        """Test create_fixture_from_db fetching in batches."""
+
+        db.session.add(Tool(name='hammer', added=dt.date(2020, 4, 19)))
+        db.session.add(Tool(name='saw'))
+        db.session.commit()
+        app.extensions['sqlafixtures'].batch_size = 2
+        get_fixtures_directory = db_utils.get_fixtures_directory
+        db_utils.get_fixtures_directory = MagicMock(return_value=str(tmp_path))
+
+        with app.app_context():
+            db_utils.create_fixture_from_db(Tool)
+
+        db_utils.get_fixtures_directory = get_fixtures_directory
+        fixture = json.load(open(str(tmp_path / 'tools.json')))
+        assert [record['name'] for record in fixture['records']] == [
+            'screw driver', 'hammer', 'saw']
+        assert fixture['records'][0]['last_seen'] == '2020-04-12 05:22:33'
+
+    def test_json_encoder_unknown_type(self):
+        """Test json_encoder raises TypeError for unknown objects."""
+
+        try:
+            db_utils.json_encoder(object())
+            assert False
+        except TypeError:
+            pass
+
     def test_create_fixture_from_db(self, app, db, tool):
 
         base_dir = Path(app.root_path).parent
@@ -661,3 +1379,2057 @@ class Test_SQLAFixtures_DB_Utils:
         assert os.path.isfile(json_file) == True
 
         db_utils.get_fixtures_directory = get_fixtures_directory
+        os.path.join = join
+
+
+class Test_SQLAFixtures_Upsert:
+    """Test sqlafixtures.upsert."""
+
+    def test_upsert_updates_existing_rows(self, app, db, tool):
+        """Test upsert inserts new rows and updates rows with the same primary key."""
+
+        records = [
+            {'id': 1, 'name': 'drill', 'added': None, 'last_seen': None},
+            {'id': 2, 'name': 'hammer', 'added': dt.date(2020, 4, 19), 'last_seen': None},
+        ]
+        with db.engine.connect() as conn:
+            statements = upsert.upsert(conn, Tool.__table__, records)
+        assert statements == 1
+        rows = list(db.session.execute('SELECT id, name, added FROM tools'))
+        assert rows == [(1, 'drill', None), (2, 'hammer', '2020-04-19')]
+
+    def test_upsert_splits_by_bind_params(self, app, db):
+        """Test upsert sizes statements to the dialect bind parameter limit."""
+
+        records = [{'id': i, 'name': str(i)} for i in range(1, 6)]
+        max_bind_params = upsert.MAX_BIND_PARAMS['sqlite']
+        upsert.MAX_BIND_PARAMS['sqlite'] = 4
+        try:
+            with db.engine.connect() as conn:
+                statements = upsert.upsert(conn, User.__table__, records)
+        finally:
+            upsert.MAX_BIND_PARAMS['sqlite'] = max_bind_params
+        assert statements == 3
+        assert len(list(db.session.execute('SELECT * FROM users'))) == 5
+
+    def test_upsert_reuses_statements(self):
+        """Test get_upsert_statement returns the cached statement."""
+
+        from sqlalchemy.dialects import sqlite
+        dialect = sqlite.dialect()
+        first = upsert.get_upsert_statement(User.__table__, dialect, ('id', 'name'), 2)
+        second = upsert.get_upsert_statement(User.__table__, dialect, ('id', 'name'), 2)
+        assert first is second
+
+    def test_get_statement_rows(self):
+        """Test get_statement_rows splits the rest of the records in powers of two."""
+
+        assert upsert.get_statement_rows(0, 8) == []
+        assert upsert.get_statement_rows(8, 8) == [8]
+        assert upsert.get_statement_rows(13, 8) == [8, 4, 1]
+        assert upsert.get_statement_rows(23, 8) == [8, 8, 4, 2, 1]
+        assert upsert.get_statement_rows(3, 1) == [1, 1, 1]
+
+    def test_upsert_statement_shapes(self, app, db):
+        """Test upsert builds a few statements whatever the sizes of the batches."""
+
+        upsert._statements.clear()
+        with db.engine.connect() as conn:
+            for count in range(1, 101):
+                records = [{'id': i, 'name': str(i)} for i in range(1, count + 1)]
+                upsert.upsert(conn, User.__table__, records)
+        rows = sorted(key[3] for key in upsert._statements if key[0] is User.__table__)
+        assert rows == [1, 2, 4, 8, 16, 32, 64]
+        assert len(list(db.session.execute('SELECT * FROM users'))) == 100
+
+    def test_upsert_rows(self, app, db, tool):
+        """Test upsert falls back to upsert_rows on SQLite without ON CONFLICT."""
+
+        records = [
+            {'id': 1, 'name': 'drill', 'added': None, 'last_seen': None},
+            {'id': 2, 'name': 'hammer', 'added': dt.date(2020, 4, 19), 'last_seen': None},
+        ]
+        builder = upsert.UPSERT_BUILDERS.pop('sqlite')
+        try:
+            with db.engine.connect() as conn:
+                statements = upsert.upsert(conn, Tool.__table__, records)
+                assert upsert.upsert(conn, Tool.__table__, [{'id': 2}]) == 1
+        finally:
+            upsert.register_upsert('sqlite', builder)
+        assert statements == 2
+        rows = list(db.session.execute('SELECT id, name, added FROM tools'))
+        assert rows == [(1, 'drill', None), (2, 'hammer', '2020-04-19')]
+
+    def test_get_bind_names(self):
+        """Test get_bind_names returns the cached names in row order."""
+
+        names = upsert.get_bind_names(2, 2)
+        assert names == ['p0_0', 'p0_1', 'p1_0', 'p1_1']
+        assert upsert.get_bind_names(2, 2) is names
+
+    def test_sqlite_upsert_sql(self):
+        """Test the compiled SQLite upsert."""
+
+        from sqlalchemy.dialects import sqlite
+        statement = upsert.get_upsert_statement(
+            User.__table__, sqlite.dialect(), ('id', 'name'), 2)
+        sql = str(statement.compile(dialect=sqlite.dialect()))
+        assert sql == (
+            'INSERT INTO users (id, name) VALUES (?, ?), (?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name')
+
+    def test_postgresql_upsert_sql(self):
+        """Test the compiled PostgreSQL upsert."""
+
+        from sqlalchemy.dialects import postgresql
+        statement = upsert.get_upsert_statement(
+            User.__table__, postgresql.dialect(), ('id', 'name'), 1)
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        assert sql == (
+            'INSERT INTO users (id, name) VALUES (%(p0_0)s, %(p0_1)s) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name')
+
+    def test_mysql_upsert_sql(self):
+        """Test the compiled MySQL upsert."""
+
+        from sqlalchemy.dialects import mysql
+        statement = upsert.get_upsert_statement(
+            User.__table__, mysql.dialect(), ('id', 'name'), 1)
+        sql = str(statement.compile(dialect=mysql.dialect()))
+        assert sql == (
+            'INSERT INTO users (id, name) VALUES (%s, %s) '
+            'ON DUPLICATE KEY UPDATE name = VALUES(name)')
+
+    def test_register_upsert(self):
+        """Test register_upsert replaces the builder for a dialect."""
+
+        from sqlalchemy.dialects import postgresql
+        builder = upsert.UPSERT_BUILDERS['postgresql']
+        upsert.register_upsert('postgresql', lambda table, values, cols: 'custom')
+        try:
+            statement = upsert.get_upsert_statement(
+                User.__table__, postgresql.dialect(), ('id', 'name'), 3)
+        finally:
+            upsert.register_upsert('postgresql', builder)
+        assert statement == 'custom'
+
+
+class Test_SQLAFixtures_Type_Codecs:
+    """Test sqlafixtures.type_codecs."""
+
+    @classmethod
+    def setup_class(cls):
+        import decimal
+        import enum
+        import uuid
+        from sqlalchemy import (Column, Date, DateTime, Enum, Float, Integer, Interval,
+                                JSON, LargeBinary, MetaData, Numeric, Table, Time)
+        from sqlalchemy.dialects import postgresql
+
+        class Color(enum.Enum):
+            red = 1
+            blue = 2
+
+        cls.Color = Color
+        cls.table = Table(
+            'codecs', MetaData(),
+            Column('id', Integer, primary_key=True),
+            Column('price', Numeric(10, 2)),
+            Column('ratio', Float),
+            Column('added', Date),
+            Column('last_seen', DateTime),
+            Column('opens', Time),
+            Column('duration', Interval),
+            Column('color', Enum(Color)),
+            Column('data', JSON),
+            Column('blob', LargeBinary),
+            Column('key', postgresql.UUID(as_uuid=True)),
+        )
+        cls.record = {
+            'id': 1,
+            'price': decimal.Decimal('10.10'),
+            'ratio': 0.5,
+            'added': dt.date(2020, 3, 29),
+            'last_seen': dt.datetime(2020, 4, 12, 5, 22, 33, 120),
+            'opens': dt.time(8, 30),
+            'duration': dt.timedelta(days=2, microseconds=7),
+            'color': Color.blue,
+            'data': {'a': [1, 2]},
+            'blob': b'\x00\xff',
+            'key': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        }
+
+    def test_encode(self):
+        """Test TableCodec.encode writes json values."""
+
+        codec = type_codecs.get_table_codec(self.table)
+        record = codec.encode(dict(self.record))
+        assert record == {
+            'id': 1,
+            'price': '10.10',
+            'ratio': 0.5,
+            'added': '2020-03-29',
+            'last_seen': '2020-04-12 05:22:33.000120',
+            'opens': '08:30:00',
+            'duration': 172800.000007,
+            'color': 'blue',
+            'data': {'a': [1, 2]},
+            'blob': 'AP8=',
+            'key': '12345678-1234-5678-1234-567812345678',
+        }
+
+    def test_round_trip(self):
+        """Test values survive encode, json and decode."""
+
+        codec = type_codecs.get_table_codec(self.table)
+        data = json.loads(json.dumps(codec.encode(dict(self.record))))
+        assert codec.decode_records([data]) == [self.record]
+
+    def test_decode_none(self):
+        """Test None is not decoded."""
+
+        codec = type_codecs.get_table_codec(self.table)
+        record = dict.fromkeys(self.record)
+        assert codec.decode_records([dict(record)]) == [record]
+
+    def test_table_codec_skips_native_columns(self):
+        """Test only columns with a codec are compiled."""
+
+        codec = type_codecs.get_table_codec(User.__table__)
+        assert codec.encoders == []
+        assert codec.decoders == []
+
+    def test_register_codec(self):
+        """Test register_codec for an application type."""
+
+        from sqlalchemy import Boolean
+        type_codecs.register_codec(Boolean, lambda value, type_: int(value),
+                                   lambda data, type_: bool(data))
+        try:
+            from sqlalchemy import Column, MetaData, Table
+            flags = Table('flags', MetaData(), Column('flag', Boolean))
+            codec = type_codecs.get_table_codec(flags)
+            assert codec.encode({'flag': True}) == {'flag': 1}
+            assert codec.decode_records([{'flag': 0}]) == [{'flag': False}]
+        finally:
+            del type_codecs.CODECS[Boolean]
+            type_codecs._table_codecs.clear()
+
+
+class Test_SQLAFixtures_Formats:
+    """Test sqlafixtures.formats."""
+
+    def write(self, name, records, columns=('id', 'name', 'added', 'last_seen')):
+        outfile = io.StringIO()
+        formats.get_format(name).write(outfile, 'tools', columns, iter(records))
+        return outfile.getvalue()
+
+    def test_columnar_round_trip(self, records):
+        """Test the columnar format is read back by iter_fixture_records."""
+
+        data = self.write('columnar', records)
+        assert data.splitlines()[1] == '[1,"screw driver","2020-03-29","2020-04-12 05:22:33"],'
+        assert list(formats.iter_fixture_records(io.StringIO(data), 16)) == records
+
+    def test_columnar_empty(self):
+        """Test the columnar format without records."""
+
+        data = self.write('columnar', [])
+        assert list(formats.iter_fixture_records(io.StringIO(data))) == []
+
+    def test_jsonl_round_trip(self, records):
+        """Test the jsonl format writes a header line and one line per record."""
+
+        data = self.write('jsonl', records)
+        lines = data.splitlines()
+        assert len(lines) == len(records) + 1
+        assert json.loads(lines[0]) == {
+            'table': {'name': 'tools'}, 'columns': ['id', 'name', 'added', 'last_seen']}
+        reader = formats.get_format('jsonl')
+        assert list(reader.read(io.StringIO(data + '\n'))) == records
+
+    def test_jsonl_records_like_header(self):
+        """Test the jsonl reader keeps records with 'table' and 'columns' keys."""
+
+        records = [{'table': 'a', 'columns': 2}, {'table': 'b', 'columns': 3}]
+        data = self.write('jsonl', records, columns=['table', 'columns'])
+        reader = formats.get_format('jsonl')
+        assert list(reader.read(io.StringIO('\n' + data))) == records
+
+    def test_jsonl_invalid(self):
+        """Test the jsonl reader raises FixtureFormatError for a broken line."""
+
+        reader = formats.get_format('jsonl')
+        try:
+            list(reader.read(io.StringIO('{"id": 1\n')))
+            assert False
+        except formats.FixtureFormatError as e:
+            assert e.message == 'Fixture file has an invalid json line.'
+
+    def test_compact_formats_are_smaller(self, records):
+        """Test the compact formats take less space than json."""
+
+        size = len(self.write('json', records))
+        assert len(self.write('jsonl', records)) < size
+        assert len(self.write('columnar', records)) < len(self.write('jsonl', records))
+
+    def test_get_format_unknown(self):
+        """Test get_format raises FixtureFormatError for unregistered names."""
+
+        try:
+            formats.get_format('yaml')
+            assert False
+        except formats.FixtureFormatError as e:
+            assert e.message == "Fixture format 'yaml' is not registered."
+
+    def test_find_fixture_path(self, tmp_path):
+        """Test find_fixture_path prefers the configured format and detects others."""
+
+        directory = str(tmp_path)
+        assert formats.find_fixture_path(directory, 'tools', 'jsonl') == str(
+            tmp_path / 'tools.jsonl')
+        (tmp_path / 'tools.json').write_text('{"records": []}')
+        assert formats.find_fixture_path(directory, 'tools', 'jsonl') == str(
+            tmp_path / 'tools.json')
+        (tmp_path / 'tools.jsonl').write_text('')
+        assert formats.find_fixture_path(directory, 'tools', 'jsonl') == str(
+            tmp_path / 'tools.jsonl')
+        assert formats.find_fixture_path(directory, 'tools') == str(
+            tmp_path / 'tools.json')
+
+    def test_read_fixture_records(self, records, tmp_path):
+        """Test read_fixture_records detects the format from the extension."""
+
+        (tmp_path / 'tools.jsonl').write_text(self.write('jsonl', records))
+        assert list(formats.read_fixture_records(str(tmp_path / 'tools.jsonl'))) == records
+
+    def test_create_and_seed_jsonl(self, app, db, tool, fixtures_directory):
+        """Test create_fixture_from_db and seed with SQLAFIXTURES_FORMAT = 'jsonl'."""
+
+        (fixtures_directory / 'tools.json').write_text('{"records": []}')
+        app.extensions['sqlafixtures'].format = 'jsonl'
+        with app.app_context():
+            db_utils.create_fixture_from_db(Tool)
+            assert sorted(os.listdir(str(fixtures_directory))) == ['tools.jsonl']
+            db.session.query(Tool).delete()
+            db.session.commit()
+            db_utils.seed(['Tool'])
+            tools = db.session.query(Tool).all()
+        assert [(t.name, t.added, t.last_seen) for t in tools] == [
+            ('screw driver', dt.date(2020, 3, 29), dt.datetime(2020, 4, 12, 5, 22, 33))]
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Shards:
+    """Test sharded fixture files."""
+
+    def add_tools(self, db):
+        db.session.add(Tool(name='hammer', added=dt.date(2020, 4, 19)))
+        db.session.add(Tool(name='saw'))
+        db.session.commit()
+
+    def create(self, app, tmp_path, shard_rows=None, shard_bytes=None, fixture_format='json'):
+        app.extensions['sqlafixtures'].shard_rows = shard_rows
+        app.extensions['sqlafixtures'].shard_bytes = shard_bytes
+        app.extensions['sqlafixtures'].format = fixture_format
+        with app.app_context():
+            db_utils.create_fixture_from_db(Tool)
+        return sorted(os.listdir(str(tmp_path)))
+
+    def seed(self, app, **kwargs):
+        with app.app_context():
+            return db_utils.seed(['Tool'], **kwargs)
+
+    def test_write_fixture_shards(self, records, tmp_path):
+        """Test write_fixture_shards caps the records of each shard."""
+
+        fixture_format = formats.get_format('json')
+        records = records * 2 + records[:1]
+        paths, written = formats.write_fixture_shards(
+            str(tmp_path), 'tools', fixture_format, [], iter(records), shard_rows=2)
+        assert [os.path.basename(path) for path in paths] == [
+            'tools.0000.json', 'tools.0001.json', 'tools.0002.json']
+        assert written == 3
+        assert [len(list(formats.read_fixture_records(path))) for path in paths] == [2, 2, 1]
+        assert formats.find_fixture_paths(str(tmp_path), 'tools', 'jsonl') == paths
+
+        paths, written = formats.write_fixture_shards(
+            str(tmp_path), 'tools', fixture_format, [], iter(records), shard_rows=2)
+        assert written == 0
+
+    def test_write_fixture_shards_bytes(self, records, tmp_path):
+        """Test write_fixture_shards closes a shard once it reaches shard_bytes."""
+
+        paths, written = formats.write_fixture_shards(
+            str(tmp_path), 'tools', formats.get_format('jsonl'),
+            ['id', 'name', 'added', 'last_seen'], iter(records * 2), shard_bytes=1)
+        assert [os.path.basename(path) for path in paths] == [
+            'tools.0000.jsonl', 'tools.0001.jsonl', 'tools.0002.jsonl', 'tools.0003.jsonl']
+        assert [list(formats.read_fixture_records(path)) for path in paths] == [
+            [record] for record in records * 2]
+
+    def test_write_fixture_shards_single(self, records, tmp_path):
+        """Test a fixture within the caps, or empty, is written to a single file."""
+
+        fixture_format = formats.get_format('json')
+        paths, written = formats.write_fixture_shards(
+            str(tmp_path), 'tools', fixture_format, [], iter(records), shard_rows=2)
+        assert paths == [str(tmp_path / 'tools.json')]
+        assert list(formats.read_fixture_records(paths[0])) == records
+        paths, written = formats.write_fixture_shards(
+            str(tmp_path), 'users', fixture_format, [], iter([]), shard_rows=1)
+        assert paths == [str(tmp_path / 'users.json')]
+        assert list(formats.read_fixture_records(paths[0])) == []
+
+    def test_get_shard_index(self):
+        """Test get_shard_index reads the shard number from the file name."""
+
+        assert formats.get_shard_index('/fixtures/tools.0012.json') == 12
+        assert formats.get_shard_index('/fixtures/tools.json') is None
+        assert formats.get_shard_path('/fixtures', 'tools', 3, '.jsonl') == (
+            '/fixtures/tools.0003.jsonl')
+
+    def test_parse_shards(self):
+        """Test parse_shards reads numbers and ranges."""
+
+        assert db_utils.parse_shards('0-3') == [0, 1, 2, 3]
+        assert db_utils.parse_shards('7, 1-2,2') == [1, 2, 7]
+        for value in ('a', '3-1', '-1'):
+            try:
+                db_utils.parse_shards(value)
+                assert False
+            except db_utils.SeedError as e:
+                assert e.message == "Invalid shards '{}'.".format(value)
+
+    def test_create_fixture_from_db_shards(self, app, db, tool, tmp_path):
+        """Test create_fixture_from_db splits a table over the cap in shards."""
+
+        self.add_tools(db)
+        (tmp_path / 'tools.json').write_text('{"records": []}')
+        (tmp_path / 'tools.0005.json').write_text('{"records": []}')
+        table_metrics = metrics.TableMetrics('tools')
+        with table_metrics.collect():
+            assert self.create(app, tmp_path, shard_rows=2) == [
+                'tools.0000.json', 'tools.0001.json']
+        assert table_metrics.rows == 3
+        assert table_metrics.bytes == sum(
+            os.path.getsize(str(tmp_path / name)) for name in os.listdir(str(tmp_path)))
+        names = [record['name'] for name in ('tools.0000.json', 'tools.0001.json')
+                 for record in formats.read_fixture_records(str(tmp_path / name))]
+        assert names == ['screw driver', 'hammer', 'saw']
+
+        assert self.create(app, tmp_path) == ['tools.json']
+
+    def test_create_fixture_from_file_shards(self, app, tmp_path):
+        """Test create_fixture_from_file writes shards, leaving unchanged shards alone."""
+
+        base_dir = Path(app.root_path).parent
+        workbook = str(base_dir / 'tests' / 'data' / 'fixtures_file.xlsx')
+        db_utils.create_fixture_from_file(Tool, workbook, str(tmp_path), 'json', 1)
+        assert sorted(os.listdir(str(tmp_path))) == ['tools.0000.json', 'tools.0001.json']
+        mtime = os.path.getmtime(str(tmp_path / 'tools.0000.json'))
+        time.sleep(0.01)
+        db_utils.create_fixture_from_file(Tool, workbook, str(tmp_path), 'json', 1)
+        assert os.path.getmtime(str(tmp_path / 'tools.0000.json')) == mtime
+
+    def test_seed_shards(self, app, db, tool, tmp_path):
+        """Test seed reads every shard in order, or the selected shards."""
+
+        self.add_tools(db)
+        self.create(app, tmp_path, shard_rows=2)
+        db.session.query(Tool).delete()
+        db.session.commit()
+
+        report = self.seed(app, shards=[1])
+        assert report.count == 1
+        assert [t.name for t in db.session.query(Tool).all()] == ['saw']
+
+        report = self.seed(app)
+        assert report.count == 3
+        assert report.table('tools').bytes == sum(
+            os.path.getsize(str(tmp_path / name)) for name in os.listdir(str(tmp_path)))
+        assert [t.name for t in db.session.query(Tool).order_by(Tool.id)] == [
+            'screw driver', 'hammer', 'saw']
+        assert self.seed(app).count == 0
+
+    def test_seed_command_invalid_shards(self):
+        """Test seed --shards reports an invalid value as a usage error."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock()
+        try:
+            result = CliRunner().invoke(commands.seed, ['--shards', '3-x'])
+            assert result.exit_code == 2
+            assert "Invalid shards '3-x'." in result.output
+            db_utils.seed.assert_not_called()
+        finally:
+            db_utils.seed = seed
+
+    def test_seed_shards_delete(self, app, tmp_path):
+        """Test seed refuses to delete missing rows from some of the shards."""
+
+        try:
+            self.seed(app, mode='diff', delete=True, shards=[0])
+            assert False
+        except db_utils.SeedError as e:
+            assert e.message == 'Deleting missing rows requires every shard.'
+
+    def test_pipeline_batches_shards(self, app, db, tool, tmp_path):
+        """Test the shards of a fixture are parsed by child processes, in order."""
+
+        self.add_tools(db)
+        self.create(app, tmp_path, shard_rows=1)
+        table = Tool.__table__
+        paths = {table: formats.find_fixture_paths(str(tmp_path), 'tools')}
+        min_bytes = db_utils.PROCESS_PARSE_MIN_BYTES
+        get_cpu_count = db_utils.get_cpu_count
+        db_utils.PROCESS_PARSE_MIN_BYTES = 0
+        db_utils.get_cpu_count = MagicMock(return_value=2)
+        try:
+            with db_utils.pipeline_batches([table], paths, workers=1) as sources:
+                batches = sources[0][1]
+                assert isinstance(batches, db_utils.ShardBatches)
+                shards = batches.shards
+                assert shards[0].ahead == [shards[1]]
+                assert all(shard.process is None for shard in shards)
+                names = []
+                for index, batch in enumerate(batches):
+                    names.extend(record['name'] for record in batch)
+                    # only the current shard and the one ahead hold a child process
+                    assert [shard.process is not None for shard in shards] == [
+                        index <= number <= index + 1 for number in range(len(shards))]
+        finally:
+            db_utils.PROCESS_PARSE_MIN_BYTES = min_bytes
+            db_utils.get_cpu_count = get_cpu_count
+        assert names == ['screw driver', 'hammer', 'saw']
+
+    def test_hash_fixture(self, tmp_path):
+        """Test hash_fixture of a single file and of shards."""
+
+        (tmp_path / 'tools.json').write_text('{"records": []}')
+        path = str(tmp_path / 'tools.json')
+        assert seed_state.hash_fixture(path) == seed_state.hash_file(path)
+        assert seed_state.hash_fixture([path]) == seed_state.hash_file(path)
+        assert seed_state.hash_fixture([path, path]) != seed_state.hash_file(path)
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Manifest:
+    """Test sqlafixtures.manifest."""
+
+    def run(self, app, function, *args, **kwargs):
+        with app.app_context():
+            return function(*args, **kwargs)
+
+    def test_create_fixtures_manifest(self, app, db, tool, tmp_path):
+        """Test create_fixtures writes the files, rows, hash and columns of each table."""
+
+        self.run(app, db_utils.create_fixtures, [])
+        saved = manifest.load_manifest(str(tmp_path))
+        assert sorted(saved['load_order']) == ['tools', 'users']
+        tools = saved['tables']['tools']
+        path = str(tmp_path / 'tools.json')
+        assert tools['files'] == [{'name': 'tools.json', 'bytes': os.path.getsize(path),
+                                   'mtime_ns': os.stat(path).st_mtime_ns}]
+        assert tools['rows'] == 1
+        assert tools['bytes'] == os.path.getsize(path)
+        assert tools['sha256'] == seed_state.hash_file(path)
+        assert tools['columns'] == ['id', 'name', 'added', 'last_seen']
+        assert tools['format'] == 'json'
+        assert tools['level'] == 0
+        assert saved['tables']['users']['rows'] == 0
+
+        self.run(app, db_utils.create_fixtures, ['User'],
+                 report=metrics.Report('create_fixtures'))
+        assert manifest.load_manifest(str(tmp_path))['tables']['tools'] == tools
+
+    def test_create_fixtures_manifest_failed(self, app, db, tool, tmp_path):
+        """Test the entry of a fixture that fails to be created is removed."""
+
+        self.run(app, db_utils.create_fixtures, [])
+        create_fixture_from_db = db_utils.create_fixture_from_db
+        db_utils.create_fixture_from_db = MagicMock(side_effect=ValueError('failed'))
+        try:
+            self.run(app, db_utils.create_fixtures, ['Tool'])
+            assert False
+        except db_utils.FixtureCreationError:
+            pass
+        finally:
+            db_utils.create_fixture_from_db = create_fixture_from_db
+        assert manifest.load_manifest(str(tmp_path))['load_order'] == ['users']
+
+    def test_seed_uses_manifest(self, app, db, tool, tmp_path, capsys):
+        """Test seed uses the hashes of the manifest for unchanged fixture files."""
+
+        self.run(app, db_utils.create_fixtures, [])
+        hash_fixture = seed_state.hash_fixture
+        seed_state.hash_fixture = MagicMock(side_effect=hash_fixture)
+        try:
+            capsys.readouterr()
+            report = self.run(app, db_utils.seed, force=True)
+            assert not seed_state.hash_fixture.called
+            assert 'Seeding 1 records of 2 tables' in capsys.readouterr().out
+            assert report.count == 1
+
+            (tmp_path / 'tools.json').write_text('{"records": []}')
+            self.run(app, db_utils.seed, force=True)
+            seed_state.hash_fixture.assert_called_once_with([str(tmp_path / 'tools.json')])
+        finally:
+            seed_state.hash_fixture = hash_fixture
+
+    def test_get_fixture_hash(self, tmp_path):
+        """Test get_fixture_hash only trusts entries of unchanged files."""
+
+        path = str(tmp_path / 'tools.json')
+        (tmp_path / 'tools.json').write_text('{"records": []}')
+        entry = manifest.describe_fixture([path], Tool.__table__, 'json')
+        saved = {'tables': {'tools': entry}}
+        assert entry['rows'] == 0
+        assert manifest.get_fixture_hash(saved, str(tmp_path), 'tools', [path]) == (
+            seed_state.hash_file(path))
+        assert manifest.get_fixture_hash(saved, str(tmp_path), 'users', [path]) is None
+        assert manifest.get_fixture_hash(
+            saved, str(tmp_path), 'tools', [str(tmp_path / 'tools.0000.json')]) is None
+        (tmp_path / 'tools.json').write_text('{"records": [{}]}')
+        assert manifest.get_fixture_hash(saved, str(tmp_path), 'tools', [path]) is None
+
+    def test_set_load_order(self):
+        """Test set_load_order follows the foreign key levels."""
+
+        from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+        metadata = MetaData()
+        parent = Table('parent', metadata, Column('id', Integer, primary_key=True))
+        child = Table('child', metadata, Column('id', Integer, primary_key=True),
+                      Column('parent_id', Integer, ForeignKey('parent.id')))
+        entries = {'child': {'rows': 1}, 'parent': {'rows': 2}, 'gone': {'rows': 3}}
+        levels = [[table.name for table in level]
+                  for level in db_utils.group_tables_by_level(metadata.sorted_tables)]
+        saved = manifest.set_load_order({'tables': entries}, levels)
+        assert saved['load_order'] == ['parent', 'child']
+        assert saved['tables'] == {'parent': {'rows': 2, 'level': 0},
+                                   'child': {'rows': 1, 'level': 1}}
+
+    def test_format_summary(self, tmp_path):
+        """Test the summary printed by check-sqlafixtures-config."""
+
+        saved = manifest.save_manifest(str(tmp_path), {
+            'load_order': ['users', 'tools'],
+            'tables': {
+                'users': {'rows': 2, 'bytes': 100, 'files': [{}], 'level': 0},
+                'tools': {'rows': 5, 'bytes': 300, 'files': [{}, {}], 'level': 1},
+            }})
+        assert manifest.load_manifest(str(tmp_path)) == saved
+        assert manifest.format_summary(saved) == [
+            '2 tables, 7 rows, 400 bytes, created {}.'.format(saved['created']),
+            '0 users: 2 rows, 1 file(s), 100 bytes',
+            '1 tools: 5 rows, 2 file(s), 300 bytes',
+        ]
+
+    def test_load_manifest_invalid(self, tmp_path):
+        """Test load_manifest ignores missing, invalid and other version manifests."""
+
+        assert manifest.load_manifest(str(tmp_path)) == {}
+        (tmp_path / manifest.MANIFEST_FILENAME).write_text('{')
+        assert manifest.load_manifest(str(tmp_path)) == {}
+        (tmp_path / manifest.MANIFEST_FILENAME).write_text('{"version": 0}')
+        assert manifest.load_manifest(str(tmp_path)) == {}
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Seed_State:
+    """Test sqlafixtures.seed_state."""
+
+    def seed(self, app, echo_messages, **kwargs):
+        del echo_messages[:]
+        with app.app_context():
+            count = db_utils.seed(['Tool'], **kwargs).count
+        return count, list(echo_messages)
+
+    def test_seed_skips_unchanged_tables(self, app, db, tmp_path, echo_messages):
+        """Test a second seed skips tables whose fixture and schema are unchanged."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+
+        count, messages = self.seed(app, echo_messages)
+        assert count == 2
+        count, messages = self.seed(app, echo_messages)
+        assert count == 0
+        assert messages[-1] == 'Skipped 1 unchanged tables: tools.'
+        count, messages = self.seed(app, echo_messages, force=True)
+        assert count == 2
+
+    def test_seed_reloads_changed_tables(self, app, db, tmp_path, echo_messages):
+        """Test seed reloads a table after its fixture or its rows changed."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        self.seed(app, echo_messages)
+
+        db.session.execute('DELETE FROM tools WHERE id = 2')
+        db.session.commit()
+        count, messages = self.seed(app, echo_messages)
+        assert count == 2
+
+        (tmp_path / 'tools.json').write_text('{"records": [{"id": 3, "name": "saw"}]}')
+        count, messages = self.seed(app, echo_messages)
+        assert count == 1
+        rows = list(db.session.execute('SELECT row_count FROM sqlafixtures_state'))
+        assert rows == [(3,)]
+
+    def test_seed_state_not_recorded_on_error(self, app, db, tmp_path, echo_messages):
+        """Test the state of a table is rolled back with the table."""
+
+        (tmp_path / 'tools.json').write_text('{"records": [')
+        try:
+            self.seed(app, echo_messages)
+            assert False
+        except db_utils.FixtureFormatError:
+            pass
+        assert list(db.session.execute('SELECT * FROM sqlafixtures_state')) == []
+
+    def test_hash_schema(self):
+        """Test hash_schema changes with the table definition."""
+
+        from sqlalchemy import Column, Integer, MetaData, String, Table
+        from sqlalchemy.dialects import sqlite
+        first = Table('tools', MetaData(), Column('id', Integer, primary_key=True))
+        second = Table('tools', MetaData(), Column('id', Integer, primary_key=True),
+                       Column('name', String(20)))
+        assert seed_state.hash_schema(first, sqlite.dialect()) == seed_state.hash_schema(
+            first, sqlite.dialect())
+        assert seed_state.hash_schema(first, sqlite.dialect()) != seed_state.hash_schema(
+            second, sqlite.dialect())
+
+    def test_get_table_states_missing_fixture(self, tmp_path):
+        """Test get_table_states leaves out tables without a fixture file."""
+
+        from sqlalchemy.dialects import sqlite
+        states = seed_state.get_table_states(
+            sqlite.dialect(), {Tool.__table__: str(tmp_path / 'tools.json')})
+        assert states == {}
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Fingerprints:
+    """Test sqlafixtures.fingerprints."""
+
+    def create(self, app, echo_messages, force=False):
+        base_dir = Path(app.root_path).parent
+        app.extensions['sqlafixtures'].file = os.path.join(
+            base_dir, 'tests', 'data', 'fixtures_file.xlsx')
+        del echo_messages[:]
+        with app.app_context():
+            db_utils.create_fixtures([], [], from_file=True, force=force)
+        return list(echo_messages)
+
+    def test_get_sheet_fingerprints(self, app):
+        """Test get_sheet_fingerprints returns one fingerprint per sheet."""
+
+        base_dir = Path(app.root_path).parent
+        sheets = fingerprints.get_sheet_fingerprints(
+            os.path.join(base_dir, 'tests', 'data', 'fixtures_file.xlsx'))
+        assert sorted(sheets) == ['tools', 'users']
+        assert sheets['tools'] != sheets['users']
+
+    def test_get_sheet_fingerprints_not_xlsx(self, app):
+        """Test get_sheet_fingerprints for a file that is not an xlsx workbook."""
+
+        base_dir = Path(app.root_path).parent
+        assert fingerprints.get_sheet_fingerprints(
+            os.path.join(base_dir, 'tests', 'data', 'tools.json')) == {}
+
+    def test_fingerprint_model(self):
+        """Test fingerprint_model changes with the model columns, format and shards."""
+
+        from sqlalchemy import Column, Integer, MetaData, String, Table
+        first = Table('tools', MetaData(), Column('id', Integer, primary_key=True))
+        second = Table('tools', MetaData(), Column('id', Integer, primary_key=True),
+                       Column('name', String(20)))
+        fingerprint = fingerprints.fingerprint_model('sheet', first, 'json')
+        assert fingerprint == fingerprints.fingerprint_model('sheet', first, 'json')
+        assert fingerprint != fingerprints.fingerprint_model('sheet', second, 'json')
+        assert fingerprint != fingerprints.fingerprint_model('sheet', first, 'jsonl')
+        assert fingerprint != fingerprints.fingerprint_model('other', first, 'json')
+        assert fingerprint == fingerprints.fingerprint_model(
+            'sheet', first, 'json', (None, None))
+        assert fingerprint != fingerprints.fingerprint_model('sheet', first, 'json', (1, None))
+        assert fingerprint != fingerprints.fingerprint_model('sheet', first, 'json', (None, 1))
+
+    def test_create_fixtures_skips_unchanged_sheets(self, app, tmp_path, echo_messages):
+        """Test create_fixtures from file only creates fixtures of changed sheets."""
+
+        self.create(app, echo_messages)
+        saved = fingerprints.load_fingerprints(str(tmp_path))
+        assert sorted(saved) == ['tools', 'users']
+
+        messages = self.create(app, echo_messages)
+        assert messages == ['Skipped 2 unchanged sheets: users, tools.']
+
+        saved['users'] = 'stale'
+        fingerprints.save_fingerprints(str(tmp_path), saved)
+        messages = self.create(app, echo_messages)
+        assert messages == ['Skipped 1 unchanged sheets: tools.',
+                            'Creating a fixture for "<class \'app.users.models.User\'>".',
+                            'Fixture for "<class \'app.users.models.User\'>" is unchanged.']
+        assert fingerprints.load_fingerprints(str(tmp_path))['users'] != 'stale'
+
+    def test_create_fixtures_shard_limits_changed(self, app, tmp_path, echo_messages):
+        """Test create_fixtures from file recreates the fixtures when a shard cap changes."""
+
+        self.create(app, echo_messages)
+        config = app.extensions['sqlafixtures']
+        config.shard_rows = 1
+        try:
+            messages = self.create(app, echo_messages)
+        finally:
+            config.shard_rows = None
+        assert not [message for message in messages if message.startswith('Skipped')]
+        assert not os.path.isfile(str(tmp_path / 'tools.json'))
+        assert len(formats.find_fixture_paths(str(tmp_path), 'tools')) == 2
+
+    def test_create_fixtures_missing_fixture(self, app, tmp_path, echo_messages):
+        """Test create_fixtures from file recreates a deleted fixture, and force."""
+
+        self.create(app, echo_messages)
+        os.remove(str(tmp_path / 'tools.json'))
+        messages = self.create(app, echo_messages)
+        assert messages[0] == 'Skipped 1 unchanged sheets: users.'
+        assert os.path.isfile(str(tmp_path / 'tools.json'))
+
+        messages = self.create(app, echo_messages, force=True)
+        assert not [message for message in messages if message.startswith('Skipped')]
+
+    def test_write_fixture_file(self, records, tmp_path):
+        """Test write_fixture_file leaves a file with the same content untouched."""
+
+        path = str(tmp_path / 'tools.json')
+        fixture_format = formats.get_format('json')
+        assert formats.write_fixture_file(path, fixture_format, 'tools', [], records)
+        mtime = os.stat(path).st_mtime_ns
+        assert not formats.write_fixture_file(path, fixture_format, 'tools', [], records)
+        assert os.stat(path).st_mtime_ns == mtime
+        assert formats.write_fixture_file(path, fixture_format, 'tools', [], records[:1])
+        assert len(json.load(open(path))['records']) == 1
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Diff:
+    """Test sqlafixtures.diff."""
+
+    def seed(self, app, echo_messages, **kwargs):
+        del echo_messages[:]
+        with app.app_context():
+            count = db_utils.seed(['Tool'], force=True, **kwargs).count
+        return count, list(echo_messages)
+
+    def test_diff_batches(self, app, db, tool):
+        """Test diff_batches writes only the new and changed records."""
+
+        batch = [
+            {'id': 1, 'name': 'screw driver', 'added': dt.date(2020, 3, 29),
+             'last_seen': dt.datetime(2020, 4, 12, 5, 22, 33)},
+            {'id': 2, 'name': 'hammer', 'added': None, 'last_seen': None},
+        ]
+        upserts = []
+        upsert_ = diff.upsert.upsert
+        diff.upsert.upsert = lambda conn, table, records: upserts.append(list(records))
+        try:
+            with db.engine.connect() as conn:
+                table_diff = diff.diff_batches(conn, Tool.__table__, [batch])
+        finally:
+            diff.upsert.upsert = upsert_
+        assert (table_diff.inserted, table_diff.updated, table_diff.unchanged) == (1, 0, 1)
+        assert upserts == [[batch[1]]]
+
+    def test_diff_batches_updates(self, app, db, tool):
+        """Test diff_batches updates a row with a changed column."""
+
+        batch = [{'id': 1, 'name': 'screw driver', 'added': dt.date(2020, 3, 30)}]
+        with db.engine.connect() as conn:
+            table_diff = diff.diff_batches(conn, Tool.__table__, [batch])
+        assert (table_diff.inserted, table_diff.updated, table_diff.unchanged) == (0, 1, 0)
+        assert list(db.session.execute('SELECT added, last_seen FROM tools')) == [
+            ('2020-03-30', '2020-04-12 05:22:33.000000')]
+
+    def test_seed_mode_diff(self, app, db, tmp_path, echo_messages):
+        """Test seed in diff mode, with and without delete."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        db.session.add(Tool(id=1, name='screw driver', added=dt.date(2020, 3, 29),
+                            last_seen=dt.datetime(2020, 4, 12, 5, 22, 33)))
+        db.session.add(Tool(id=3, name='saw'))
+        db.session.commit()
+
+        count, messages = self.seed(app, echo_messages, mode='diff')
+        assert count == 1
+        assert 'tools: 1 inserted, 0 updated, 0 deleted, 1 unchanged' in messages
+
+        count, messages = self.seed(app, echo_messages, mode='diff', delete=True)
+        assert count == 1
+        assert 'tools: 0 inserted, 0 updated, 1 deleted, 2 unchanged' in messages
+        assert list(db.session.execute('SELECT id FROM tools')) == [(1,), (2,)]
+        rows = list(db.session.execute('SELECT row_count FROM sqlafixtures_state'))
+        assert rows == [(2,)]
+
+    def test_seed_delete_requires_diff(self, app):
+        """Test seed raises SeedError for delete without mode diff."""
+
+        with app.app_context():
+            try:
+                db_utils.seed(delete=True)
+                assert False
+            except db_utils.SeedError as e:
+                assert e.message == "Deleting missing rows requires seed mode 'diff'."
+
+    def test_diff_batches_numeric_types(self):
+        """Test numbers equal to the stored values are unchanged whatever their type."""
+
+        import decimal
+        from sqlalchemy import (
+            Boolean, Column, Float, Integer, MetaData, Numeric, Table, create_engine)
+        engine = create_engine('sqlite://')
+        prices = Table('prices', MetaData(), Column('id', Integer, primary_key=True),
+                       Column('price', Float), Column('cost', Numeric(10, 2)),
+                       Column('count', Integer), Column('active', Boolean))
+        prices.create(engine)
+        with engine.connect() as conn:
+            conn.execute(prices.insert(), [
+                {'id': 1, 'price': 2.0, 'cost': decimal.Decimal('2.50'), 'count': 3,
+                 'active': True}])
+            batch = [{'id': 1, 'price': 2, 'cost': 2.5, 'count': 3.0, 'active': 1}]
+            table_diff = diff.diff_batches(conn, prices, [batch])
+            assert (table_diff.updated, table_diff.unchanged) == (0, 1)
+            batch = [{'id': 1, 'price': 2.5, 'cost': decimal.Decimal('2.5'), 'count': 3,
+                      'active': True}]
+            table_diff = diff.diff_batches(conn, prices, [batch])
+            assert (table_diff.updated, table_diff.unchanged) == (1, 0)
+
+    def test_row_digest_normalizers(self):
+        """Test row_digest converts the values of numeric columns to their type."""
+
+        from sqlalchemy import Column, Integer, MetaData, Numeric, String, Table
+        table = Table('t', MetaData(), Column('id', Integer, primary_key=True),
+                      Column('amount', Numeric(asdecimal=True)), Column('name', String))
+        normalizers = diff.get_normalizers(table, ['id', 'amount', 'name'])
+        assert normalizers[2] is None
+        assert diff.row_digest([1, 2.1, 'x'], normalizers) == diff.row_digest(
+            [1.0, '2.10', 'x'], normalizers)
+        assert diff.row_digest([1, None, 'x'], normalizers) != diff.row_digest(
+            [1, 0, 'x'], normalizers)
+        assert diff.row_digest(['a', 'b', 'x'], normalizers) == diff.row_digest(
+            ['a', 'b', 'x'], normalizers)
+
+    def test_composite_primary_key(self):
+        """Test select_row_digests and delete_missing_rows with a composite key."""
+
+        from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine
+        engine = create_engine('sqlite://')
+        pairs = Table('pairs', MetaData(), Column('a', Integer, primary_key=True),
+                      Column('b', Integer, primary_key=True), Column('name', String(20)))
+        pairs.create(engine)
+        with engine.connect() as conn:
+            conn.execute(pairs.insert(), [{'a': 1, 'b': 1, 'name': 'x'},
+                                          {'a': 1, 'b': 2, 'name': 'y'}])
+            batch = [{'a': 1, 'b': 1, 'name': 'x'}, {'a': 2, 'b': 1, 'name': 'z'}]
+            table_diff = diff.diff_batches(conn, pairs, [batch], keep_keys=True)
+            assert (table_diff.inserted, table_diff.unchanged) == (1, 1)
+            assert diff.delete_missing_rows(conn, table_diff) == 1
+            rows = list(conn.execute(pairs.select().order_by(pairs.c.a, pairs.c.b)))
+        assert rows == [(1, 1, 'x'), (2, 1, 'z')]
+
+
+class Test_SQLAFixtures_Subset:
+    """Test sqlafixtures.subset."""
+
+    def create_tables(self, engine):
+        from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+        metadata = MetaData()
+        customers = Table('customers', metadata, Column('id', Integer, primary_key=True),
+                          Column('name', String(20)))
+        products = Table('products', metadata, Column('id', Integer, primary_key=True),
+                         Column('name', String(20)))
+        orders = Table('orders', metadata, Column('id', Integer, primary_key=True),
+                       Column('customer_id', Integer, ForeignKey('customers.id')),
+                       Column('status', String(10)))
+        lines = Table('lines', metadata, Column('id', Integer, primary_key=True),
+                      Column('order_id', Integer, ForeignKey('orders.id')),
+                      Column('product_id', Integer, ForeignKey('products.id')))
+        metadata.create_all(engine)
+        with engine.connect() as conn:
+            conn.execute(customers.insert(), [{'id': 1, 'name': 'Ann'},
+                                              {'id': 2, 'name': 'Bob'}])
+            conn.execute(products.insert(), [{'id': i, 'name': 'p{}'.format(i)}
+                                             for i in (1, 2, 3)])
+            conn.execute(orders.insert(), [
+                {'id': 1, 'customer_id': 1, 'status': 'open'},
+                {'id': 2, 'customer_id': 2, 'status': 'closed'},
+                {'id': 3, 'customer_id': 1, 'status': 'closed'},
+                {'id': 4, 'customer_id': None, 'status': 'closed'}])
+            conn.execute(lines.insert(), [{'id': 1, 'order_id': 1, 'product_id': 1},
+                                          {'id': 2, 'order_id': 1, 'product_id': 2},
+                                          {'id': 3, 'order_id': 2, 'product_id': 3}])
+        return metadata
+
+    def test_parse_model_options(self):
+        """Test parse_model_options splits options on the first colon."""
+
+        assert subset.parse_model_options(["Order:status = 'a:b'", ' Tool : id > 1']) == {
+            'Order': "status = 'a:b'", 'Tool': 'id > 1'}
+        for value in ('Order', ':id > 1', 'Order: '):
+            try:
+                subset.parse_model_options([value])
+                assert False
+            except subset.SubsetError as e:
+                assert e.message == "Expected 'Model:value', found '{}'.".format(value)
+
+    def test_parse_sample(self):
+        """Test parse_sample returns a number of rows or a fraction."""
+
+        assert subset.parse_sample('100') == 100
+        assert subset.parse_sample('0.25') == 0.25
+        for value in ('0', '1.5', 'many', '-3'):
+            try:
+                subset.parse_sample(value)
+                assert False
+            except subset.SubsetError as e:
+                assert e.message == (
+                    "Invalid sample '{}', expected a number of rows or a fraction.".format(
+                        value))
+
+    def test_iter_keys(self):
+        """Test iter_keys reads every matching key with keyset pagination."""
+
+        from sqlalchemy import create_engine, event
+        engine = create_engine('sqlite://')
+        metadata = self.create_tables(engine)
+        orders = metadata.tables['orders']
+        statements = []
+        with engine.connect() as conn:
+            event.listen(conn, 'before_cursor_execute',
+                         lambda *args: statements.append(args[2]))
+            assert list(subset.iter_keys(conn, orders, batch_size=2)) == [
+                (1,), (2,), (3,), (4,)]
+            assert len(statements) == 3
+            assert list(subset.iter_keys(conn, orders, "status = 'closed'", 2)) == [
+                (2,), (3,), (4,)]
+
+    def test_sample_keys(self):
+        """Test sample_keys keeps a number or a fraction of the keys, the same each run."""
+
+        keys = [(i,) for i in range(100)]
+        sample = subset.sample_keys(iter(keys), 10, seed=3)
+        assert len(sample) == 10
+        assert sample == sorted(sample)
+        assert sample == subset.sample_keys(iter(keys), 10, seed=3)
+        assert subset.sample_keys(iter(keys), 200) == keys
+        assert subset.sample_keys(iter(keys), 1.) == keys
+        assert 20 < len(subset.sample_keys(iter(keys), .5)) < 80
+
+    def test_find_subset(self):
+        """Test find_subset adds the rows referencing the roots and the rows they reference."""
+
+        from sqlalchemy import create_engine
+        engine = create_engine('sqlite://')
+        tables = self.create_tables(engine).tables
+        with engine.connect() as conn:
+            found = subset.find_subset(conn, list(tables.values()),
+                                       where={tables['orders']: "status = 'open'"})
+        assert found.get_keys(tables['orders']) == [(1,)]
+        assert found.get_keys(tables['lines']) == [(1,), (2,)]
+        assert found.get_keys(tables['products']) == [(1,), (2,)]
+        assert found.get_keys(tables['customers']) == [(1,)]
+
+        with engine.connect() as conn:
+            found = subset.find_subset(conn, list(tables.values()),
+                                       where={tables['customers']: 'id = 2'})
+        assert found.get_keys(tables['orders']) == [(2,)]
+        assert found.get_keys(tables['lines']) == [(3,)]
+        assert found.get_keys(tables['products']) == [(3,)]
+
+    def test_find_subset_not_exported(self):
+        """Test find_subset raises SubsetError for a root that is not exported."""
+
+        from sqlalchemy import create_engine
+        engine = create_engine('sqlite://')
+        tables = self.create_tables(engine).tables
+        with engine.connect() as conn:
+            try:
+                subset.find_subset(conn, [tables['lines']], sample={tables['orders']: 1})
+                assert False
+            except subset.SubsetError as e:
+                assert e.message == "Table 'orders' is not exported."
+
+    def test_export_subset_seeds(self, app, tmp_path):
+        """Test an exported subset loads with foreign keys enforced."""
+
+        from sqlalchemy import create_engine, event
+        with app.app_context():
+            engine = current_app.extensions['sqlafixtures'].db.engine
+            metadata = self.create_tables(engine)
+            try:
+                tables = [metadata.tables[name] for name in
+                          ('customers', 'products', 'orders', 'lines')]
+                models = [type(table.name.title(), (), {
+                    '__table__': table, '__tablename__': table.name}) for table in tables]
+                keys = db_utils.find_subset_keys(models, sample={'Lines': 1})
+                for model in models:
+                    db_utils.create_fixture_from_db(model, str(tmp_path),
+                                                    keys[model.__table__])
+            finally:
+                metadata.drop_all(engine)
+
+        target = create_engine('sqlite://')
+        event.listen(target, 'connect',
+                     lambda dbapi_conn, record: dbapi_conn.execute('PRAGMA foreign_keys=ON'))
+        metadata.create_all(target)
+        with target.connect() as conn:
+            for table in tables:
+                path = str(tmp_path / (table.name + '.json'))
+                records = list(formats.read_fixture_records(path))
+                if records:
+                    conn.execute(table.insert(), records)
+            assert len(list(conn.execute(metadata.tables['lines'].select()))) == 1
+            assert len(list(conn.execute(metadata.tables['orders'].select()))) == 1
+            assert list(conn.execute('PRAGMA foreign_key_check')) == []
+
+    def test_create_fixtures_where(self, app, db, tool, fixtures_directory):
+        """Test create_fixtures exports the rows matching where."""
+
+        db.session.add(Tool(id=2, name='hammer'))
+        db.session.commit()
+        with app.app_context():
+            db_utils.create_fixtures(['Tool'], where={'Tool': "name = 'hammer'"})
+        records = list(formats.read_fixture_records(str(fixtures_directory / 'tools.json')))
+        assert [record['id'] for record in records] == [2]
+
+    def test_create_fixtures_subset_errors(self, app):
+        """Test create_fixtures raises for a subset from file or of a model not exported."""
+
+        with app.app_context():
+            try:
+                db_utils.create_fixtures([], from_file=True, sample={'Tool': 1})
+                assert False
+            except subset.SubsetError as e:
+                assert e.message == 'A subset can only be exported from the db.'
+            try:
+                db_utils.find_subset_keys([User], where={'Tool': 'id = 1'})
+                assert False
+            except db_utils.ModelNameError as e:
+                assert e.message == "Model 'Tool' is not exported."
+
+    def test_create_fixtures_from_db_subset_options(self):
+        """Test create_fixtures_from_db parses --where and --sample."""
+
+        create_fixtures = db_utils.create_fixtures
+        db_utils.create_fixtures = MagicMock()
+        runner = CliRunner()
+        try:
+            result = runner.invoke(
+                commands.create_fixtures_from_db,
+                ['--where', 'Tool:id > 1', '--sample', 'Tool:0.5', '--sample', 'User:10'],
+                catch_exceptions=False)
+            assert not result.exception
+            db_utils.create_fixtures.assert_called_with(
+                [], [], from_file=False, workers=1, report=ANY,
+                where={'Tool': 'id > 1'}, sample={'Tool': .5, 'User': 10})
+            result = runner.invoke(commands.create_fixtures_from_db, ['--sample', 'Tool:x'])
+            assert result.exit_code == 2
+            assert "Invalid sample 'x'" in result.output
+        finally:
+            db_utils.create_fixtures = create_fixtures
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Snapshots:
+    """Test sqlafixtures.snapshots."""
+
+    def restore(self, app):
+        with app.app_context():
+            return snapshots.restore_snapshot()
+
+    def test_restore_snapshot(self, app, db, tmp_path):
+        """Test restore_snapshot builds a template once and clones it."""
+
+        base_dir = Path(app.root_path).parent
+        for name in ('tools.json', 'users.json'):
+            shutil.copy(os.path.join(base_dir, 'tests', 'data', name), tmp_path)
+
+        key = self.restore(app)
+        template = tmp_path / '.snapshots' / 'template-{}.sqlite3'.format(key)
+        assert template.is_file()
+        assert list(db.session.execute('SELECT id, name FROM users')) == [
+            (1, 'Jason'), (2, 'Sheila')]
+
+        db.session.execute('DELETE FROM users')
+        db.session.commit()
+        mtime = template.stat().st_mtime_ns
+        assert self.restore(app) == key
+        assert template.stat().st_mtime_ns == mtime
+        assert len(list(db.session.execute('SELECT * FROM users'))) == 2
+        assert len(list(db.session.execute('SELECT * FROM sqlafixtures_state'))) == 2
+
+    def test_get_postgresql_template_drops_old_templates(self, monkeypatch):
+        """Test building a PostgreSQL template drops the templates of other keys."""
+
+        from sqlalchemy.engine.url import make_url
+        from sqlalchemy.exc import DBAPIError
+        databases = {'app', 'app_template_aaaaaaaaaaaa', 'app_template_bbbbbbbbbbbb',
+                     'app_gw0_template_cccccccccccc', 'other'}
+
+        def execute(statement, **params):
+            sql = str(statement)
+            if sql.startswith('SELECT 1'):
+                return MagicMock(**{'scalar.return_value': params['name'] in databases})
+            if sql.startswith('SELECT datname'):
+                return [(name,) for name in databases
+                        if name[:params['length']] == params['prefix']]
+            name = sql.split('"')[1]
+            if sql.startswith('CREATE'):
+                databases.add(name)
+            elif name == 'app_template_bbbbbbbbbbbb':
+                raise DBAPIError(sql, None, Exception('in use'))
+            else:
+                databases.discard(name)
+
+        conn = MagicMock(**{'execute.side_effect': execute})
+        admin = MagicMock()
+        admin.connect.return_value.__enter__.return_value = conn
+        monkeypatch.setattr(snapshots, '_get_admin_engine', lambda engine: admin)
+        monkeypatch.setattr(snapshots, 'create_engine', MagicMock())
+        monkeypatch.setattr(snapshots, 'build_template', MagicMock())
+        engine = MagicMock(url=make_url('postgresql://u@localhost/app'))
+
+        name = snapshots.get_postgresql_template(engine, '0123456789abcdef', None, [], {})
+        assert name == 'app_template_0123456789ab'
+        assert databases == {'app', name, 'app_template_bbbbbbbbbbbb',
+                             'app_gw0_template_cccccccccccc', 'other'}
+        assert snapshots.list_postgresql_templates(conn, 'app') == [
+            name, 'app_template_bbbbbbbbbbbb']
+        assert snapshots.drop_postgresql_templates(conn, 'app_gw0') == [
+            'app_gw0_template_cccccccccccc']
+        snapshots.build_template.assert_called_once()
+
+    def test_restore_snapshot_rebuilds(self, app, db, tmp_path):
+        """Test restore_snapshot builds a new template when a fixture changes."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        key = self.restore(app)
+
+        (tmp_path / 'users.json').write_text('{"records": [{"id": 7, "name": "Ann"}]}')
+        new_key = self.restore(app)
+        assert new_key != key
+        assert os.listdir(str(tmp_path / '.snapshots')) == [
+            'template-{}.sqlite3'.format(new_key)]
+        assert list(db.session.execute('SELECT id, name FROM users')) == [(7, 'Ann')]
+
+    def test_get_snapshot_key(self, app, tmp_path):
+        """Test get_snapshot_key changes with the schema and the fixtures."""
+
+        from sqlalchemy import Column, Integer, MetaData, Table
+        from sqlalchemy.dialects import sqlite
+        metadata = MetaData()
+        table = Table('tools', metadata, Column('id', Integer, primary_key=True))
+        path = tmp_path / 'tools.json'
+        path.write_text('{"records": []}')
+        paths = {table: str(path)}
+        key = snapshots.get_snapshot_key(metadata, paths, sqlite.dialect())
+        assert key == snapshots.get_snapshot_key(metadata, paths, sqlite.dialect())
+        path.write_text('{"records": [{"id": 1}]}')
+        assert key != snapshots.get_snapshot_key(metadata, paths, sqlite.dialect())
+
+    def test_get_worker_database_uri(self):
+        """Test get_worker_database_uri gives each xdist worker its own database."""
+
+        uri = snapshots.get_worker_database_uri
+        assert uri('sqlite:////tmp/app.db', 'gw1') == 'sqlite:////tmp/app_gw1.db'
+        assert uri('sqlite://', 'gw1') == 'sqlite://'
+        assert uri('postgresql://u@localhost/app', 'gw0') == 'postgresql://u@localhost/app_gw0'
+        environ = os.environ.pop('PYTEST_XDIST_WORKER', None)
+        try:
+            assert uri('sqlite:////tmp/app.db') == 'sqlite:////tmp/app.db'
+        finally:
+            if environ is not None:
+                os.environ['PYTEST_XDIST_WORKER'] = environ
+
+
+class Test_SQLAFixtures_Pytest_Plugin:
+    """Test sqlafixtures.pytest_plugin."""
+
+    def seed(self, app, fixtures_directory):
+        base_dir = Path(app.root_path).parent
+        for name in ('tools.json', 'users.json'):
+            shutil.copy(os.path.join(base_dir, 'tests', 'data', name), fixtures_directory)
+        with app.app_context():
+            db_utils.seed(force=True)
+
+    def test_transaction_scope_rolls_back(self, app, db, fixtures_directory):
+        """Test changes committed in transaction_scope are rolled back at exit."""
+
+        self.seed(app, fixtures_directory)
+        with app.app_context():
+            with pytest_plugin.transaction_scope(db) as session:
+                assert db.session is session
+                session.add(User(id=3, name='Maiyan'))
+                session.commit()
+                assert session.query(User).count() == 3
+                session.add(User(id=4, name='Ann'))
+                session.rollback()
+                assert session.query(User).count() == 3
+            assert db.session is not session
+            assert db.session.query(User).count() == 2
+
+    def test_transaction_scope_models(self, app, db, fixtures_directory):
+        """Test transaction_scope with model_names empties the other fixture tables."""
+
+        self.seed(app, fixtures_directory)
+        with app.app_context():
+            with pytest_plugin.transaction_scope(db, ['User']) as session:
+                assert session.query(User).count() == 2
+                assert session.query(Tool).count() == 0
+                session.rollback()
+                assert session.query(Tool).count() == 0
+            assert db.session.query(Tool).count() == 2
+
+    def test_get_referenced_tables(self):
+        """Test get_referenced_tables follows foreign keys."""
+
+        from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+        metadata = MetaData()
+        parent = Table('parent', metadata, Column('id', Integer, primary_key=True))
+        child = Table('child', metadata, Column('id', Integer, primary_key=True),
+                      Column('parent_id', ForeignKey('parent.id')))
+        other = Table('other', metadata, Column('id', Integer, primary_key=True))
+        assert pytest_plugin.get_referenced_tables([child]) == {child, parent}
+
+    def test_plugin(self, pytester, monkeypatch, app):
+        """Test the plugin fixtures and marker in a pytest run."""
+
+        base_dir = Path(app.root_path).parent
+        monkeypatch.setenv('PYTHONPATH', str(base_dir))
+        pytester.makeconftest('''
+            import os
+            import pytest
+            from app import create_app
+            from config import TestConfig
+
+            pytest_plugins = ['flask_sqlafixtures.pytest_plugin']
+
+            class PluginConfig(TestConfig):
+                SQLAFIXTURES_DIRECTORY = {directory!r}
+                SQLAFIXTURES_MODE = 'data'
+
+            @pytest.fixture(scope='session')
+            def sqlafixtures_app():
+                return create_app(PluginConfig)
+        '''.format(directory=str(pytester.path)))
+        shutil.copytree(os.path.join(base_dir, 'tests', 'data'), str(pytester.path / 'data'))
+        pytester.makepyfile('''
+            import pytest
+            from app.users.models import User, Tool
+
+            def test_commit(sqlafixtures_session):
+                sqlafixtures_session.add(User(id=3, name='Maiyan'))
+                sqlafixtures_session.commit()
+                assert sqlafixtures_session.query(User).count() == 3
+
+            def test_rolled_back(sqlafixtures_session):
+                assert sqlafixtures_session.query(User).count() == 2
+
+            @pytest.mark.sqlafixtures('Tool')
+            def test_marker(sqlafixtures_session):
+                assert sqlafixtures_session.query(User).count() == 0
+                assert sqlafixtures_session.query(Tool).count() == 2
+        ''')
+        result = pytester.runpytest_subprocess('-p', 'no:cacheprovider')
+        result.assert_outcomes(passed=3)
+
+
+class Test_SQLAFixtures_Registry:
+    """Test sqlafixtures.registry."""
+
+    @classmethod
+    def setup_class(cls):
+        import types
+        from sqlalchemy import Column, Integer, MetaData, Table
+
+        class Boat(object):
+            __table__ = Table('boats', MetaData(), Column('id', Integer, primary_key=True))
+
+        module = types.ModuleType('sqlafixtures_test_boats')
+        module.FIXTURES = ['Boat']
+        module.Boat = Boat
+        sys.modules[module.__name__] = module
+        cls.Boat = Boat
+
+    @classmethod
+    def teardown_class(cls):
+        del sys.modules['sqlafixtures_test_boats']
+
+    def test_get_models_across_modules(self):
+        """Test get_models finds names from any module, in configured order."""
+
+        fixtures = registry.FixtureRegistry(['app.users.models', 'sqlafixtures_test_boats'])
+        assert fixtures.get_models() == [User, Tool, self.Boat]
+        assert fixtures.get_models(['Boat', 'User']) == [User, self.Boat]
+        assert fixtures.get_models(excludes=['Tool']) == [User, self.Boat]
+        assert fixtures.get_model('Boat') is self.Boat
+
+    def test_temporary_models(self):
+        """Test temporary_models adds models while the block runs, then removes them."""
+
+        fixtures = registry.FixtureRegistry(['app.users.models'])
+        models = fixtures.models
+        with fixtures.temporary_models({'Boat': self.Boat}):
+            assert fixtures.get_models() == [User, Tool, self.Boat]
+            assert fixtures.get_model_by_table('boats') is self.Boat
+        assert fixtures.models is models
+        assert fixtures.get_model_by_table('boats') is None
+
+        try:
+            with fixtures.temporary_models({'Boat': self.Boat}):
+                raise RuntimeError('failed')
+        except RuntimeError:
+            pass
+        assert fixtures.get_models() == [User, Tool]
+
+        try:
+            with fixtures.temporary_models({'User': self.Boat}):
+                assert False
+        except db_utils.ModelNameError as e:
+            assert e.message == "Model 'User' is defined as a fixture twice."
+        assert fixtures.get_model('User') is User
+
+    def test_get_models_unknown_name(self):
+        """Test get_models raises ModelNameError for names not in any module."""
+
+        fixtures = registry.FixtureRegistry(['app.users.models', 'sqlafixtures_test_boats'])
+        try:
+            fixtures.get_models(['User', 'Truck'])
+            assert False
+        except db_utils.ModelNameError as e:
+            assert e.message == "Model 'Truck' is not defined as a fixture."
+
+    def test_indexes(self):
+        """Test the table and module indexes."""
+
+        fixtures = registry.FixtureRegistry(['app.users.models', 'sqlafixtures_test_boats'])
+        assert fixtures.get_model_by_table('tools') is Tool
+        assert fixtures.get_model_by_table('cars') is None
+        assert fixtures.get_module_models('app.users.models') == [User, Tool]
+
+    def test_modules_imported_once(self):
+        """Test the modules are imported on first use only."""
+
+        import importlib
+        import_module = importlib.import_module
+        importlib.import_module = MagicMock(side_effect=import_module)
+        try:
+            fixtures = registry.FixtureRegistry(['app.users.models'])
+            importlib.import_module.assert_not_called()
+            fixtures.get_models(['User'])
+            fixtures.get_models(['Tool'])
+        finally:
+            mock = importlib.import_module
+            importlib.import_module = import_module
+        mock.assert_called_once_with('app.users.models')
+
+    def test_duplicate_model_name(self):
+        """Test a model listed by two modules raises ModelNameError."""
+
+        fixtures = registry.FixtureRegistry(['sqlafixtures_test_boats', 'sqlafixtures_test_boats'])
+        try:
+            fixtures.get_models()
+            assert False
+        except db_utils.ModelNameError as e:
+            assert e.message == "Model 'Boat' is defined as a fixture twice."
+
+    def test_init_app_registry(self, app):
+        """Test init_app builds the registry used by get_fixture_models."""
+
+        fixtures_registry = app.extensions['sqlafixtures'].registry
+        assert fixtures_registry.modules == ['app.users.models']
+        with app.app_context():
+            assert db_utils.get_fixture_models(['Tool']) == [Tool]
+
+
+class Test_SQLAFixtures_Bench:
+    """Test sqlafixtures.bench."""
+
+    def test_run_benchmark(self, app, tmp_path):
+        """Test every phase reports its rows, rate, peak RSS and bytes."""
+
+        with app.app_context():
+            report = bench.run_benchmark([50, 120], directory=str(tmp_path))
+            engine = current_app.extensions['sqlafixtures'].db.engine
+            assert not engine.dialect.has_table(engine, bench.BENCH_TABLE_NAME)
+        assert report['dialect'] == 'sqlite'
+        assert report['format'] == 'json'
+        assert [(result['phase'], result['rows']) for result in report['results']] == [
+            ('seed', 50), ('bulk', 50), ('read-json', 50), ('read-columnar', 50),
+            ('read-jsonl', 50), ('export', 50), ('xlsx', 50),
+            ('seed', 120), ('bulk', 120), ('read-json', 120), ('read-columnar', 120),
+            ('read-jsonl', 120), ('export', 120), ('xlsx', 120)]
+        for result in report['results']:
+            assert result['rows_per_second'] > 0
+            assert result['bytes'] > 0
+            assert result['peak_rss'] > 0
+        seed, bulk = report['results'][:2]
+        assert bulk['speedup'] == bulk['rows_per_second'] / seed['rows_per_second']
+        assert 'x seed' in bench.format_result(bulk)
+        assert 'x seed' not in bench.format_result(seed)
+
+        exported = formats.read_fixture_records(
+            str(tmp_path / '120' / 'export' / 'sqlafixtures_bench.json'))
+        try:
+            records = list(exported)
+        finally:
+            exported.close()
+        table = bench.make_bench_table()
+        assert records == list(bench.generate_records(table, 120))
+
+    def test_run_benchmark_phases(self, app, tmp_path):
+        """Test the seed phase runs but is not reported when not selected."""
+
+        xlsx_max_rows = bench.XLSX_MAX_ROWS
+        bench.XLSX_MAX_ROWS = 10
+        try:
+            with app.app_context():
+                report = bench.run_benchmark(
+                    [20], ['export', 'xlsx'], directory=str(tmp_path))
+        finally:
+            bench.XLSX_MAX_ROWS = xlsx_max_rows
+        assert [result['phase'] for result in report['results']] == ['export']
+
+    def test_run_benchmark_seeds_with_seed(self, app, tmp_path):
+        """Test the seed phase runs db_utils.seed, as the seed command does."""
+
+        seed = db_utils.seed
+        db_utils.seed = mock_seed = MagicMock(side_effect=seed)
+        try:
+            with app.app_context():
+                report = bench.run_benchmark([30], ['seed'], directory=str(tmp_path),
+                                             batch_size=7)
+                sqlafixtures = current_app.extensions['sqlafixtures']
+                assert 'BenchModel' not in sqlafixtures.registry.models
+                assert bench.BENCH_TABLE_NAME not in sqlafixtures.db.metadata.tables
+                assert sqlafixtures.directory != str(tmp_path / '30' / 'seed')
+        finally:
+            db_utils.seed = seed
+        mock_seed.assert_called_once_with(
+            ['BenchModel'], batch_size=7, bulk=False, force=True)
+        assert report['results'][0]['rows'] == 30
+
+    def test_measure_formats(self, tmp_path):
+        """Test the same records are read in each format, compared with json."""
+
+        results = bench.measure_formats(str(tmp_path), bench.make_bench_table(), 200)
+        assert [result['phase'] for result in results] == [
+            'read-json', 'read-columnar', 'read-jsonl']
+        json_result = results[0]
+        assert 'speedup' not in json_result
+        for result in results[1:]:
+            assert result['baseline'] == 'read-json'
+            assert result['speedup'] == (
+                result['rows_per_second'] / json_result['rows_per_second'])
+            assert result['size_ratio'] == result['bytes'] / json_result['bytes']
+            assert result['size_ratio'] < 0.6
+            assert 'x read-json, ' in bench.format_result(result)
+        for name in ('columnar', 'jsonl'):
+            paths = formats.find_fixture_paths(
+                str(tmp_path / name), bench.BENCH_TABLE_NAME, name)
+            records = formats.read_fixture_records(paths[0])
+            try:
+                assert list(records) == list(
+                    bench.generate_records(bench.make_bench_table(), 200))
+            finally:
+                records.close()
+
+    def test_bench_fixtures_restores_on_error(self, app, tmp_path):
+        """Test bench_fixtures undoes its changes when the block fails."""
+
+        with app.app_context():
+            sqlafixtures = current_app.extensions['sqlafixtures']
+            directory = sqlafixtures.directory
+            try:
+                with bench.bench_fixtures(bench.make_bench_table(), str(tmp_path)) as model:
+                    assert sqlafixtures.registry.get_model('BenchModel') is model
+                    assert sqlafixtures.registry.get_model_by_table(
+                        bench.BENCH_TABLE_NAME) is model
+                    raise RuntimeError('failed')
+            except RuntimeError:
+                pass
+            assert 'BenchModel' not in sqlafixtures.registry.models
+            assert sqlafixtures.registry.get_model_by_table(bench.BENCH_TABLE_NAME) is None
+            assert bench.BENCH_TABLE_NAME not in sqlafixtures.db.metadata.tables
+            assert sqlafixtures.directory == directory
+
+    def test_default_phases_without_openpyxl(self, app):
+        """Test xlsx is left out of the default phases, and refused, without openpyxl."""
+
+        assert bench.get_default_phases() == list(bench.PHASES)
+        xlsx_module = bench.XLSX_MODULE
+        bench.XLSX_MODULE = 'sqlafixtures_missing_module'
+        try:
+            assert bench.get_default_phases() == ['seed', 'bulk', 'formats', 'export']
+            with app.app_context():
+                try:
+                    bench.run_benchmark([10], ['xlsx'])
+                    assert False
+                except ValueError as e:
+                    assert str(e) == bench.XLSX_MISSING
+            runner = CliRunner()
+            result = runner.invoke(commands.sqlafixtures_bench, ['--phases', 'seed,xlsx'])
+        finally:
+            bench.XLSX_MODULE = xlsx_module
+        assert result.exit_code == 2
+        assert bench.XLSX_MISSING in result.output
+
+    def test_run_benchmark_unknown_phase(self, app):
+        """Test an unknown phase raises ValueError."""
+
+        with app.app_context():
+            try:
+                bench.run_benchmark([10], ['load'])
+                assert False
+            except ValueError as e:
+                assert str(e) == "Unknown benchmark phase 'load'."
+
+    def test_generate_records(self):
+        """Test records are repeatable and encoded as in a fixture."""
+
+        table = bench.make_bench_table()
+        records = list(bench.generate_records(table, 10))
+        assert records == list(bench.generate_records(table, 10))
+        assert records != list(bench.generate_records(table, 10, seed=1))
+        assert [record['id'] for record in records] == list(range(1, 11))
+        assert records[0]['added'] == dt.datetime.strptime(
+            records[0]['added'], '%Y-%m-%d').date().isoformat()
+        assert records[6]['added'] is None
+        assert records[4]['last_seen'] is None
+
+    def test_compare_results(self, tmp_path):
+        """Test rates of the same phase and size are compared."""
+
+        previous = {'results': [
+            {'phase': 'seed', 'rows': 1000, 'rows_per_second': 100.},
+            {'phase': 'export', 'rows': 1000, 'rows_per_second': 200.}]}
+        current = {'results': [
+            {'phase': 'seed', 'rows': 1000, 'rows_per_second': 150.},
+            {'phase': 'seed', 'rows': 10000, 'rows_per_second': 150.}]}
+        path = str(tmp_path / 'previous.json')
+        bench.save_results(path, previous)
+        comparison = bench.compare_results(bench.load_results(path), current)
+        assert comparison == [{'phase': 'seed', 'rows': 1000, 'previous': 100.,
+                               'current': 150., 'change': 0.5}]
+
+    def test_parse_sizes(self):
+        """Test sizes with k and M suffixes."""
+
+        assert bench.parse_sizes('1000, 10k,1M') == [1000, 10000, 1000000]
+        for value in ('0', 'many'):
+            try:
+                bench.parse_sizes(value)
+                assert False
+            except ValueError:
+                pass
+
+    def test_sqlafixtures_bench_command(self, tmp_path):
+        """Test the command runs the benchmark and saves the results."""
+
+        run_benchmark = bench.run_benchmark
+        report = {'results': [{'phase': 'seed', 'rows': 1000, 'rows_per_second': 20.}]}
+        bench.run_benchmark = MagicMock(return_value=report)
+        previous = str(tmp_path / 'previous.json')
+        bench.save_results(previous, {'results': [
+            {'phase': 'seed', 'rows': 1000, 'rows_per_second': 10.}]})
+        output = str(tmp_path / 'results.json')
+        try:
+            runner = CliRunner()
+            result = runner.invoke(
+                commands.sqlafixtures_bench,
+                ['--sizes', '1k', '--phases', 'seed,export', '--output', output,
+                 '--compare', previous],
+                catch_exceptions=False)
+            bench.run_benchmark.assert_called_with(
+                [1000], ['seed', 'export'], batch_size=None)
+        finally:
+            bench.run_benchmark = run_benchmark
+        assert not result.exception
+        assert bench.load_results(output) == report
+        assert '(+100.0%)' in result.output
+
+    def test_sqlafixtures_bench_command_unknown_phase(self):
+        """Test the command rejects an unknown phase."""
+
+        runner = CliRunner()
+        result = runner.invoke(commands.sqlafixtures_bench, ['--phases', 'load'])
+        assert result.exit_code == 2
+        assert "Unknown phase 'load'." in result.output
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Metrics:
+    """Test sqlafixtures.metrics and sqlafixtures.signals."""
+
+    def seed(self, app, **kwargs):
+        with app.app_context():
+            return db_utils.seed(**kwargs)
+
+    def test_seed_report(self, app, db, tmp_path):
+        """Test seed returns the metrics of each table."""
+
+        test_dir = BASEDIR / 'tests' / 'data'
+        for name in ('tools.json', 'users.json'):
+            shutil.copy(str(test_dir / name), str(tmp_path))
+        report = self.seed(app)
+        assert report.operation == 'seed'
+        assert report.count == 4
+        assert [table.name for table in report.tables] == ['tools', 'users']
+        for table in report.tables:
+            assert table.status == 'loaded'
+            assert table.rows == 2
+            assert table.bytes == os.path.getsize(str(test_dir / (table.name + '.json')))
+            assert table.statements == 1
+            assert table.parse_time > 0
+            assert table.convert_time > 0
+            assert table.insert_time > 0
+        assert report.statements > 2
+        assert report.elapsed > 0
+
+        path = str(tmp_path / 'report.json')
+        report.save(path)
+        saved = json.load(open(path))
+        assert saved['count'] == 4
+        assert saved['tables'][0]['name'] == 'tools'
+        assert saved['tables'][0]['rows'] == 2
+
+    def test_seed_signals(self, app, db, tmp_path):
+        """Test seed sends its signals from the app."""
+
+        shutil.copy(str(BASEDIR / 'tests' / 'data' / 'tools.json'), str(tmp_path))
+        received = []
+
+        def receiver(name):
+            return lambda sender, **kwargs: received.append((name, sender, kwargs))
+
+        with signals.seed_started.connected_to(receiver('started'), app), \
+                signals.table_loaded.connected_to(receiver('loaded'), app), \
+                signals.table_skipped.connected_to(receiver('skipped'), app), \
+                signals.seed_finished.connected_to(receiver('finished'), app):
+            report = self.seed(app, model_names=['Tool'])
+            assert [name for name, sender, kwargs in received] == [
+                'started', 'loaded', 'finished']
+            assert received[0][2] == {'tables': ['tools'], 'mode': 'upsert'}
+            assert received[1][2]['metrics'] is report.table('tools')
+            assert received[2][2]['report'] is report
+
+            del received[:]
+            report = self.seed(app, model_names=['Tool'])
+            assert [name for name, sender, kwargs in received] == [
+                'started', 'skipped', 'finished']
+            assert report.table('tools').status == 'skipped'
+            assert report.count == 0
+
+    def test_seed_report_failed_table(self, app, db, tmp_path):
+        """Test a report passed to seed keeps the metrics of a failed seed."""
+
+        shutil.copy(str(BASEDIR / 'tests' / 'data' / 'tools.json'), str(tmp_path))
+        (tmp_path / 'users.json').write_text('{"records": [')
+        report = metrics.Report('seed')
+        try:
+            self.seed(app, savepoints=True, report=report)
+            assert False
+        except db_utils.SeedError:
+            pass
+        assert report.table('tools').status == 'loaded'
+        assert report.table('users').status == 'failed'
+        assert report.count == 2
+
+    def test_seed_tables_by_level_report(self, app, tmp_path):
+        """Test statements of worker threads are attributed to their tables."""
+
+        from sqlalchemy import create_engine
+        test_dir = str(BASEDIR / 'tests' / 'data')
+        engine = create_engine('sqlite:///' + str(tmp_path / 'levels.db'))
+        tables = [Tool.__table__, User.__table__]
+        User.metadata.create_all(engine, tables=tables)
+        paths = {table: os.path.join(test_dir, table.name + '.json') for table in tables}
+
+        report = metrics.Report('seed')
+        with report.count_statements(engine):
+            count = db_utils.seed_tables_by_level(
+                engine, tables, paths, batch_size=1, workers=2, report=report)
+        engine.dispose()
+        assert count == 4
+        assert [(table.name, table.rows, table.statements, table.status)
+                for table in report.tables] == [
+            ('tools', 2, 2, 'loaded'), ('users', 2, 2, 'loaded')]
+
+    def test_create_fixtures_report(self, app, db, tool, tmp_path):
+        """Test create_fixtures from db returns the metrics of each fixture."""
+
+        received = []
+        with app.app_context():
+            with signals.export_started.connected_to(
+                    lambda sender, **kwargs: received.append(kwargs), app), \
+                    signals.fixture_created.connected_to(
+                        lambda sender, **kwargs: received.append(kwargs), app):
+                report = db_utils.create_fixtures([], [], from_file=False)
+        assert received[0] == {'model_names': ['User', 'Tool'], 'from_file': False}
+        assert [kwargs['metrics'].name for kwargs in received[1:]] == ['users', 'tools']
+        assert report.count == 1
+        tools = report.table('tools')
+        assert (tools.status, tools.rows, tools.statements) == ('created', 1, 1)
+        assert tools.bytes == os.path.getsize(str(tmp_path / 'tools.json'))
+        assert report.table('users').rows == 0
+
+    def test_create_fixtures_file_report(self, app, tmp_path):
+        """Test create_fixtures from file times reading and converting each sheet."""
+
+        app.extensions['sqlafixtures'].file = str(BASEDIR / 'tests' / 'data' / 'fixtures_file.xlsx')
+        with app.app_context():
+            report = db_utils.create_fixtures(['User'], [], from_file=True)
+            skipped = db_utils.create_fixtures(['User'], [], from_file=True)
+        users = report.table('users')
+        assert (users.status, users.rows) == ('created', 3)
+        assert users.parse_time > 0
+        assert users.convert_time > 0
+        assert users.bytes == os.path.getsize(str(tmp_path / 'users.json'))
+        assert skipped.table('users').status == 'skipped'
+
+    def test_seed_command_report(self, tmp_path):
+        """Test seed --report saves the report, also when the seed fails."""
+
+        seed = db_utils.seed
+        db_utils.seed = MagicMock(side_effect=db_utils.SeedError('Failed'))
+        path = str(tmp_path / 'report.json')
+        try:
+            runner = CliRunner()
+            result = runner.invoke(commands.seed, ['--report', path])
+        finally:
+            db_utils.seed = seed
+        assert isinstance(result.exception, db_utils.SeedError)
+        assert json.load(open(path))['operation'] == 'seed'
+
+    def test_create_fixtures_from_db_command_report(self, tmp_path):
+        """Test create-fixtures-from-db --report saves the report."""
+
+        create_fixtures = db_utils.create_fixtures
+        db_utils.create_fixtures = MagicMock()
+        path = str(tmp_path / 'report.json')
+        try:
+            runner = CliRunner()
+            result = runner.invoke(
+                commands.create_fixtures_from_db, ['--report', path], catch_exceptions=False)
+        finally:
+            db_utils.create_fixtures = create_fixtures
+        assert not result.exception
+        assert json.load(open(path))['operation'] == 'create_fixtures'
+
+
+@pytest.mark.usefixtures('fixtures_directory')
+class Test_SQLAFixtures_Scale:
+    """Test sqlafixtures.scale."""
+
+    def make_scalers(self):
+        from sqlalchemy import (
+            Boolean, Column, Date, ForeignKey, Integer, MetaData, String, Table)
+        metadata = MetaData()
+        customers = Table('customers', metadata, Column('id', Integer, primary_key=True),
+                          Column('email', String(40), unique=True),
+                          Column('vip', Boolean))
+        orders = Table('orders', metadata, Column('id', Integer, primary_key=True),
+                       Column('customer_id', Integer, ForeignKey('customers.id')),
+                       Column('placed', Date))
+        scalers = {
+            customers: scale.TableScaler(customers, [
+                {'id': 1, 'email': 'ann@x.org', 'vip': True},
+                {'id': 2, 'email': None, 'vip': False}]),
+            orders: scale.TableScaler(orders, [
+                {'id': 10, 'customer_id': 2, 'placed': '2020-03-29'},
+                {'id': 12, 'customer_id': None, 'placed': '2020-04-19'},
+                {'id': 11, 'customer_id': 1, 'placed': None}]),
+        }
+        for scaler in scalers.values():
+            scaler.plan_keys()
+        for scaler in scalers.values():
+            scaler.plan_references(scalers)
+        return customers, orders, scalers
+
+    def scale(self, app, model_names, **kwargs):
+        with app.app_context():
+            return scale.scale_fixtures(model_names, **kwargs)
+
+    def test_iter_batches(self):
+        """Test keys are offset, foreign keys follow their parents and dates are kept."""
+
+        customers, orders, scalers = self.make_scalers()
+        assert scalers[customers].plans == {'id': ('offset', 2), 'email': ('suffix', None)}
+        batches = list(scalers[customers].iter_batches(3, batch_size=4))
+        assert [len(batch) for batch in batches] == [4, 2]
+        records = [record for batch in batches for record in batch]
+        assert [record['id'] for record in records] == [1, 2, 3, 4, 5, 6]
+        assert [record['email'] for record in records] == [
+            'ann@x.org', None, 'ann@x.org-1', None, 'ann@x.org-2', None]
+        assert [record['vip'] for record in records] == [True, False] * 3
+
+        records = [record for batch in scalers[orders].iter_batches(3, batch_size=2)
+                   for record in batch]
+        assert [record['id'] for record in records] == [10, 12, 11, 13, 15, 14, 16, 18, 17]
+        assert [record['customer_id'] for record in records] == [
+            2, None, 1, 4, None, 3, 6, None, 5]
+        assert [record['placed'] for record in records] == [
+            '2020-03-29', '2020-04-19', None] * 3
+        assert all(type(record['id']) is int for record in records)
+
+    def test_scale_column(self):
+        """Test scale_column writes the scaled values of any rows and copies to out."""
+
+        import numpy as np
+        customers, orders, scalers = self.make_scalers()
+        out = np.empty(4, dtype=object)
+        rows, copies = np.array([1, 0, 1, 0]), np.array([1, 2, 2, 3])
+        assert scalers[customers].scale_column('email', rows, copies, out) is out
+        assert out.tolist() == [None, 'ann@x.org-2', None, 'ann@x.org-3']
+        assert scalers[customers].scale_column('id', rows, copies, out).tolist() == [
+            4, 5, 6, 7]
+        assert scalers[customers].scale_column('vip', rows, copies, out).tolist() == [
+            False, True, False, True]
+
+    def test_check_keys(self):
+        """Test check_keys raises for a unique key that can not change in each copy."""
+
+        from sqlalchemy import Column, Date, MetaData, Table
+        table = Table('days', MetaData(), Column('day', Date, primary_key=True))
+        scaler = scale.TableScaler(table, [{'day': '2020-03-29'}])
+        scaler.plan_keys()
+        try:
+            scaler.check_keys()
+            assert False
+        except scale.ScaleError as e:
+            assert e.message == "Unique key (day) of 'days' can not be kept unique."
+
+    def test_scale_fixtures(self, app, tmp_path):
+        """Test scale_fixtures writes the scaled fixture and its manifest."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        report = self.scale(app, ['Tool'], factor=3)
+        assert report.count == 6
+        records = list(formats.read_fixture_records(str(tmp_path / 'x3' / 'tools.json')))
+        assert [record['id'] for record in records] == [1, 2, 3, 4, 5, 6]
+        assert [record['added'] for record in records] == ['2020-03-29', '2020-04-19'] * 3
+        saved = manifest.load_manifest(str(tmp_path / 'x3'))
+        assert saved['load_order'] == ['tools']
+        assert saved['tables']['tools']['rows'] == 6
+
+    def test_scale_fixtures_shards(self, app, tmp_path):
+        """Test scale_fixtures writes shards over SQLAFIXTURES_SHARD_ROWS."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        app.extensions['sqlafixtures'].shard_rows = 4
+        output = tmp_path / 'scaled'
+        self.scale(app, ['Tool'], factor=3, output_directory=str(output),
+                   batch_size=1)
+        assert sorted(os.listdir(str(output))) == [
+            'manifest.json', 'tools.0000.json', 'tools.0001.json']
+
+    def test_scale_fixtures_to_db(self, app, db, tmp_path):
+        """Test scale_fixtures loads the scaled records into the database."""
+
+        base_dir = Path(app.root_path).parent
+        shutil.copy(os.path.join(base_dir, 'tests', 'data', 'tools.json'), tmp_path)
+        report = self.scale(app, ['Tool'], factor=5, to_db=True)
+        assert report.count == 10
+        assert report.table('tools').status == 'loaded'
+        rows = list(db.session.execute('SELECT id, added FROM tools ORDER BY id'))
+        assert [row[0] for row in rows] == list(range(1, 11))
+        assert [row[1] for row in rows] == ['2020-03-29', '2020-04-19'] * 5
+        assert not os.path.exists(str(tmp_path / 'x5'))
+
+    def test_scale_fixtures_errors(self, app, tmp_path):
+        """Test scale_fixtures raises for the fixtures directory as output."""
+
+        try:
+            self.scale(app, [], factor=2, output_directory=str(tmp_path))
+            assert False
+        except scale.ScaleError as e:
+            assert e.message == (
+                'The scaled fixtures can not replace the fixtures they are scaled from.')
+        assert scale.parse_factor('100x') == 100
+        try:
+            scale.parse_factor('0')
+            assert False
+        except scale.ScaleError as e:
+            assert e.message == "Invalid factor '0', expected a number of copies, ex: 100."
+
+    def test_scale_fixtures_command(self):
+        """Test the scale-fixtures command."""
+
+        scale_fixtures = scale.scale_fixtures
+        scale.scale_fixtures = MagicMock()
+        runner = CliRunner()
+        try:
+            result = runner.invoke(
+                commands.scale_fixtures, ['--factor', '100', '--models', 'Tool', '--to-db'],
+                catch_exceptions=False)
+            assert not result.exception
+            scale.scale_fixtures.assert_called_with(
+                ['Tool'], [], factor=100, output_directory=None, to_db=True,
+                batch_size=None, report=ANY)
+            result = runner.invoke(commands.scale_fixtures, ['--factor', 'many'])
+            assert result.exit_code == 2
+        finally:
+            scale.scale_fixtures = scale_fixtures
+
+
+class Test_SQLAFixtures_Imports:
+    """Test the CLI import path stays free of pandas and numpy."""
+
+    HEAVY_MODULES = ('pandas', 'numpy')
+
+    def run(self, code):
+        import subprocess
+        env = dict(os.environ, PYTHONPATH=str(BASEDIR))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code], cwd=str(BASEDIR), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        assert result.returncode == 0, result.stderr
+        return result
+
+    def test_import_commands(self):
+        """Test importing the extension and its commands does not import pandas."""
+
+        result = self.run('import flask_sqlafixtures.commands')
+        imported = [line.split('|')[-1].strip() for line in result.stderr.splitlines()]
+        for name in self.HEAVY_MODULES:
+            assert name not in imported
+
+    def test_seed_and_create_from_db(self, tmp_path):
+        """Test seed and create_fixture_from_db run without importing pandas."""
+
+        code = '''
+import sys
+from unittest.mock import MagicMock
+from app import create_app
+from app.extensions import db
+from app.users.models import Tool
+from config import TestConfig
+from flask_sqlafixtures import db_utils
+app = create_app(TestConfig)
+with app.app_context():
+    db.create_all()
+    db_utils.get_fixtures_directory = MagicMock(return_value={data!r})
+    db_utils.seed()
+    db_utils.get_fixtures_directory = MagicMock(return_value={output!r})
+    db_utils.create_fixture_from_db(Tool)
+heavy = [name for name in {heavy!r} if name in sys.modules]
+assert not heavy, heavy
+'''.format(data=str(BASEDIR / 'tests' / 'data'), output=str(tmp_path),
+             heavy=self.HEAVY_MODULES)
+        self.run(code)
+        assert (tmp_path / 'tools.json').is_file()